@@ -15,4 +15,7 @@ from ._version import __version__  # noqa
 from .connection import DEFAULT_HOST, DEFAULT_PORT, Connection  # noqa
 from .table import Table  # noqa
 from .batch import Batch  # noqa
-from .pool import ConnectionPool, NoConnectionsAvailable  # noqa
+from .pipeline import Pipeline, PipelineResult, PipelineTable  # noqa
+from .pool import ConnectionPool, NoConnectionsAvailable, PoolListener  # noqa
+from .regions import RegionCache  # noqa
+from .retry import RetryPolicy  # noqa
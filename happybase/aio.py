@@ -0,0 +1,731 @@
+"""
+HappyBase asyncio module.
+
+This module provides asyncio versions of the :py:class:`Connection`,
+:py:class:`Table`, :py:class:`Batch`, and :py:class:`ConnectionPool`
+classes, built on the asyncio support in thriftpy2. It requires Python 3.7
+or later, and it is not imported by the ``happybase`` package itself, so it
+must be imported explicitly::
+
+    from happybase.aio import AsyncConnection, AsyncConnectionPool
+"""
+
+import asyncio
+import contextlib
+import logging
+from numbers import Integral
+import socket
+
+from thriftpy2.contrib.aio.client import TAsyncClient
+from thriftpy2.contrib.aio.protocol.binary import TAsyncBinaryProtocol
+from thriftpy2.contrib.aio.protocol.compact import TAsyncCompactProtocol
+from thriftpy2.contrib.aio.socket import TAsyncSocket
+from thriftpy2.contrib.aio.transport.buffered import TAsyncBufferedTransport
+from thriftpy2.contrib.aio.transport.framed import TAsyncFramedTransport
+from thriftpy2.thrift import TException
+from thriftpy2.transport import TTransportException
+
+from Hbase_thrift import Hbase
+
+from .batch import Batch
+from .connection import (
+    COMPAT_MODES, DEFAULT_COMPAT, DEFAULT_HOST, DEFAULT_PORT,
+    DEFAULT_PROTOCOL, DEFAULT_TRANSPORT, STRING_OR_BINARY)
+from .pool import NoConnectionsAvailable
+from .table import (
+    make_ordered_row, make_row, pack_i64, scanner_open_request)
+from .util import bytes_increment, ensure_bytes, thrift_type_to_dict
+
+logger = logging.getLogger(__name__)
+
+ASYNC_THRIFT_TRANSPORTS = dict(
+    buffered=TAsyncBufferedTransport,
+    framed=TAsyncFramedTransport,
+)
+ASYNC_THRIFT_PROTOCOLS = dict(
+    binary=TAsyncBinaryProtocol,
+    compact=TAsyncCompactProtocol,
+)
+
+# Errors after which the state of a connection is unknown, e.g. because
+# a reply has not been read (completely).
+BROKEN_CONNECTION_ERRORS = (
+    asyncio.CancelledError, asyncio.TimeoutError, TTransportException,
+    socket.error)
+
+
+class AsyncConnection(object):
+    """Connection to an HBase Thrift server for use with asyncio.
+
+    This class works like :py:class:`happybase.Connection`, but it only
+    accepts the `host`, `port`, `timeout`, `table_prefix`,
+    `table_prefix_separator`, `compat`, `transport`, and `protocol`
+    arguments. The `transport` must be ``'buffered'`` or ``'framed'``, and
+    the `protocol` must be ``'binary'`` or ``'compact'``; automatic
+    detection (``'auto'``) and ``'zlib'`` compression are not supported,
+    and neither are `connect_timeout`, `socket_options`, `retry_policy`,
+    `shared`, and `accelerated`. Since connecting requires a running event
+    loop, there is no `autoconnect` argument either: the connection is
+    made when it is first used, by awaiting :py:meth:`open`, or by using
+    the connection as an asynchronous context manager::
+
+        async with AsyncConnection('somehost') as connection:
+            table = connection.table('mytable')
+            row = await table.row(b'row-key')
+
+    Requests using the same connection are sent one after another, since
+    Thrift does not support concurrent requests on a single connection.
+    Use an :py:class:`AsyncConnectionPool` to have many requests in flight
+    at the same time.
+
+    If a request is cancelled (e.g. because of a timeout) or fails because
+    of a transport error, the connection is closed, and a new connection is
+    made for the next request.
+
+    Table administration is not supported; use :py:class:`Connection` for
+    that.
+
+    .. versionadded:: 1.3.0
+
+    :param str host: The host to connect to
+    :param int port: The port to connect to
+    :param int timeout: The socket timeout in milliseconds (optional)
+    :param str table_prefix: Prefix used to construct table names (optional)
+    :param str table_prefix_separator: Separator used for `table_prefix`
+    :param str compat: Compatibility mode (optional)
+    :param str transport: Thrift transport mode (optional)
+    :param str protocol: Thrift protocol (optional)
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None,
+                 table_prefix=None, table_prefix_separator=b'_',
+                 compat=DEFAULT_COMPAT, transport=DEFAULT_TRANSPORT,
+                 protocol=DEFAULT_PROTOCOL):
+
+        if transport not in ASYNC_THRIFT_TRANSPORTS:
+            raise ValueError("'transport' must be one of %s"
+                             % ", ".join(ASYNC_THRIFT_TRANSPORTS.keys()))
+
+        if table_prefix is not None:
+            if not isinstance(table_prefix, STRING_OR_BINARY):
+                raise TypeError("'table_prefix' must be a string")
+            table_prefix = ensure_bytes(table_prefix)
+
+        if not isinstance(table_prefix_separator, STRING_OR_BINARY):
+            raise TypeError("'table_prefix_separator' must be a string")
+        table_prefix_separator = ensure_bytes(table_prefix_separator)
+
+        if compat not in COMPAT_MODES:
+            raise ValueError("'compat' must be one of %s"
+                             % ", ".join(COMPAT_MODES))
+
+        if protocol not in ASYNC_THRIFT_PROTOCOLS:
+            raise ValueError("'protocol' must be one of %s"
+                             % ", ".join(ASYNC_THRIFT_PROTOCOLS))
+
+        self.host = host or DEFAULT_HOST
+        self.port = port or DEFAULT_PORT
+        self.timeout = timeout
+        self.table_prefix = table_prefix
+        self.table_prefix_separator = table_prefix_separator
+        self.compat = compat
+
+        self._transport_class = ASYNC_THRIFT_TRANSPORTS[transport]
+        self._protocol_class = ASYNC_THRIFT_PROTOCOLS[protocol]
+        self.transport = self.client = None
+
+        # Created on first use, since it must be created while the event
+        # loop is running in older Python versions.
+        self._lock = None
+
+    def _table_name(self, name):
+        """Construct a table name by optionally adding a table name prefix."""
+        name = ensure_bytes(name)
+        if self.table_prefix is None:
+            return name
+        return self.table_prefix + self.table_prefix_separator + name
+
+    def is_open(self):
+        """Return whether the underlying transport is open.
+
+        :rtype: bool
+        """
+        return self.transport is not None and self.transport.is_open()
+
+    async def open(self):
+        """Open the underlying transport to the HBase instance.
+
+        This method opens the underlying Thrift transport (TCP connection).
+        """
+        if self.is_open():
+            return
+
+        logger.debug("Opening Thrift transport to %s:%d", self.host, self.port)
+
+        # Always start afresh, since the buffers of a transport that was
+        # closed after an error may contain partial replies.
+        sock = TAsyncSocket(
+            host=self.host, port=self.port, socket_timeout=self.timeout,
+            connect_timeout=self.timeout)
+        transport = self._transport_class(sock)
+        protocol = self._protocol_class(transport, decode_response=False)
+        await transport.open()
+
+        self.transport = transport
+        self.client = TAsyncClient(Hbase, protocol)
+
+    def close(self):
+        """Close the underlying transport to the HBase instance.
+
+        This method closes the underlying Thrift transport (TCP connection).
+        """
+        if not self.is_open():
+            return
+
+        logger.debug(
+            "Closing Thrift transport to %s:%d", self.host, self.port)
+        self.transport.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def _call(self, api, *args):
+        """Call a Thrift function and return its result (internal use)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            await self.open()
+            try:
+                return await getattr(self.client, api)(*args)
+            except BROKEN_CONNECTION_ERRORS:
+                # The reply would otherwise be read by the next request.
+                self.close()
+                raise
+
+    def table(self, name, use_prefix=True):
+        """Return a table object.
+
+        See :py:meth:`Connection.table`.
+
+        :param str name: the name of the table
+        :param bool use_prefix: whether to use the table prefix (if any)
+        :return: AsyncTable instance
+        :rtype: :py:class:`AsyncTable`
+        """
+        name = ensure_bytes(name)
+        if use_prefix:
+            name = self._table_name(name)
+        return AsyncTable(name, self)
+
+    async def tables(self):
+        """Return a list of table names available in this HBase instance.
+
+        See :py:meth:`Connection.tables`.
+
+        :return: The table names
+        :rtype: List of strings
+        """
+        names = await self._call('getTableNames')
+
+        # Filter using prefix, and strip prefix from names
+        if self.table_prefix is not None:
+            prefix = self._table_name(b'')
+            offset = len(prefix)
+            names = [n[offset:] for n in names if n.startswith(prefix)]
+
+        return names
+
+
+class AsyncTable(object):
+    """HBase table abstraction class for use with asyncio.
+
+    This class works like :py:class:`happybase.Table`, but its methods are
+    coroutines, except for :py:meth:`batch`, and :py:meth:`scan`, which
+    returns an asynchronous iterator. The methods accept the same arguments
+    as their counterparts in :py:class:`happybase.Table`, but some advanced
+    arguments (such as the `raw` and `retries` arguments) are not
+    supported.
+
+    This class cannot be instantiated directly; use
+    :py:meth:`AsyncConnection.table` instead.
+
+    .. versionadded:: 1.3.0
+    """
+    def __init__(self, name, connection):
+        self.name = name
+        self.connection = connection
+
+    def __repr__(self):
+        return '<%s.%s name=%r>' % (
+            __name__,
+            self.__class__.__name__,
+            self.name,
+        )
+
+    async def families(self):
+        """Retrieve the column families for this table.
+
+        :return: Mapping from column family name to settings dict
+        :rtype: dict
+        """
+        descriptors = await self.connection._call(
+            'getColumnDescriptors', self.name)
+        families = dict()
+        for name, descriptor in descriptors.items():
+            name = name.rstrip(b':')
+            families[name] = thrift_type_to_dict(descriptor)
+        return families
+
+    async def _column_family_names(self):
+        """Retrieve the column family names for this table (internal use)"""
+        descriptors = await self.connection._call(
+            'getColumnDescriptors', self.name)
+        return [name.rstrip(b':') for name in descriptors.keys()]
+
+    async def regions(self):
+        """Retrieve the regions for this table.
+
+        :return: regions for this table
+        :rtype: list of dicts
+        """
+        regions = await self.connection._call('getTableRegions', self.name)
+        return [thrift_type_to_dict(r) for r in regions]
+
+    #
+    # Data retrieval
+    #
+
+    async def row(self, row, columns=None, timestamp=None,
+                  include_timestamp=False):
+        """Retrieve a single row of data.
+
+        See :py:meth:`Table.row`.
+
+        :return: Mapping of columns (both qualifier and family) to values
+        :rtype: dict
+        """
+        if columns is not None and not isinstance(columns, (tuple, list)):
+            raise TypeError("'columns' must be a tuple or list")
+
+        if timestamp is None:
+            rows = await self.connection._call(
+                'getRowWithColumns', self.name, row, columns, {})
+        else:
+            if not isinstance(timestamp, Integral):
+                raise TypeError("'timestamp' must be an integer")
+            rows = await self.connection._call(
+                'getRowWithColumnsTs', self.name, row, columns, timestamp, {})
+
+        if not rows:
+            return {}
+
+        return make_row(rows[0].columns, include_timestamp)
+
+    async def rows(self, rows, columns=None, timestamp=None,
+                   include_timestamp=False):
+        """Retrieve multiple rows of data.
+
+        See :py:meth:`Table.rows`.
+
+        :return: List of `(row_key, row_data)` tuples
+        :rtype: list
+        """
+        if columns is not None and not isinstance(columns, (tuple, list)):
+            raise TypeError("'columns' must be a tuple or list")
+
+        if not rows:
+            # Avoid round-trip if the result is empty anyway
+            return []
+
+        if timestamp is None:
+            results = await self.connection._call(
+                'getRowsWithColumns', self.name, rows, columns, {})
+        else:
+            if not isinstance(timestamp, Integral):
+                raise TypeError("'timestamp' must be an integer")
+
+            # Work-around a bug in the HBase Thrift server where the
+            # timestamp is only applied if columns are specified, at
+            # the cost of an extra round-trip.
+            if columns is None:
+                columns = await self._column_family_names()
+
+            results = await self.connection._call(
+                'getRowsWithColumnsTs', self.name, rows, columns, timestamp,
+                {})
+
+        return [(r.row, make_row(r.columns, include_timestamp))
+                for r in results]
+
+    async def cells(self, row, column, versions=None, timestamp=None,
+                    include_timestamp=False):
+        """Retrieve multiple versions of a single cell from the table.
+
+        See :py:meth:`Table.cells`.
+
+        :return: cell values
+        :rtype: list of values
+        """
+        if versions is None:
+            versions = (2 ** 31) - 1  # Thrift type is i32
+        elif not isinstance(versions, int):
+            raise TypeError("'versions' argument must be a number or None")
+        elif versions < 1:
+            raise ValueError(
+                "'versions' argument must be at least 1 (or None)")
+
+        if timestamp is None:
+            cells = await self.connection._call(
+                'getVer', self.name, row, column, versions, {})
+        else:
+            if not isinstance(timestamp, Integral):
+                raise TypeError("'timestamp' must be an integer")
+            cells = await self.connection._call(
+                'getVerTs', self.name, row, column, timestamp, versions, {})
+
+        return [
+            (c.value, c.timestamp) if include_timestamp else c.value
+            for c in cells
+        ]
+
+    async def scan(self, row_start=None, row_stop=None, row_prefix=None,
+                   columns=None, filter=None, timestamp=None,
+                   include_timestamp=False, batch_size=1000,
+                   scan_batching=None, limit=None, sorted_columns=False,
+                   reverse=False):
+        """Create a scanner for data in the table.
+
+        This method returns an asynchronous iterator, to be used with
+        ``async for``, that retrieves batches of `batch_size` rows from the
+        server while iterating. See :py:meth:`Table.scan` for the
+        arguments.
+
+        Other requests can use the same connection between the
+        retrieval of batches. If iteration is stopped early, use the
+        ``aclose()`` method of the iterator to close the scanner on the
+        server right away.
+
+        :return: asynchronous iterator yielding the rows matching the scan
+        :rtype: async iterable of `(row_key, row_data)` tuples
+        """
+        if batch_size < 1:
+            raise ValueError("'batch_size' must be >= 1")
+
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be >= 1")
+
+        if scan_batching is not None and scan_batching < 1:
+            raise ValueError("'scan_batching' must be >= 1")
+
+        if sorted_columns and self.connection.compat < '0.96':
+            raise NotImplementedError(
+                "'sorted_columns' is only supported in HBase >= 0.96")
+
+        if reverse and self.connection.compat < '0.98':
+            raise NotImplementedError(
+                "'reverse' is only supported in HBase >= 0.98")
+
+        if row_prefix is not None:
+            if row_start is not None or row_stop is not None:
+                raise TypeError(
+                    "'row_prefix' cannot be combined with 'row_start' "
+                    "or 'row_stop'")
+
+            if reverse:
+                row_start = bytes_increment(row_prefix)
+                row_stop = row_prefix
+            else:
+                row_start = row_prefix
+                row_stop = bytes_increment(row_prefix)
+
+        if row_start is None:
+            row_start = b''
+
+        api, args = scanner_open_request(
+            self.connection.compat, self.name, row_start, row_stop, columns,
+            filter, timestamp, batch_size, scan_batching, sorted_columns,
+            reverse)
+        scan_id = await self.connection._call(api, *args)
+        logger.debug("Opened scanner (id=%d) on '%s'", scan_id, self.name)
+
+        n_returned = 0
+        try:
+            while limit is None or n_returned < limit:
+                if limit is None:
+                    how_many = batch_size
+                else:
+                    how_many = min(batch_size, limit - n_returned)
+
+                items = await self.connection._call(
+                    'scannerGetList', scan_id, how_many)
+                if not items:
+                    return  # scan has finished
+
+                n_returned += len(items)
+                for item in items:
+                    if sorted_columns:
+                        row = make_ordered_row(item.sortedColumns,
+                                               include_timestamp)
+                    else:
+                        row = make_row(item.columns, include_timestamp)
+
+                    yield item.row, row
+        finally:
+            # If the connection was closed because of an error, the
+            # scanner will expire on the server.
+            if self.connection.is_open():
+                await self.connection._call('scannerClose', scan_id)
+            logger.debug(
+                "Closed scanner (id=%d) on '%s' (%d returned)",
+                scan_id, self.name, n_returned)
+
+    #
+    # Data manipulation
+    #
+
+    async def put(self, row, data, timestamp=None, wal=True):
+        """Store data in the table.
+
+        See :py:meth:`Table.put`.
+        """
+        async with self.batch(timestamp=timestamp, wal=wal) as batch:
+            await batch.put(row, data)
+
+    async def delete(self, row, columns=None, timestamp=None, wal=True):
+        """Delete data from the table.
+
+        See :py:meth:`Table.delete`.
+        """
+        async with self.batch(timestamp=timestamp, wal=wal) as batch:
+            await batch.delete(row, columns)
+
+    def batch(self, timestamp=None, batch_size=None, transaction=False,
+              wal=True):
+        """Create a new batch operation for this table.
+
+        See :py:meth:`Table.batch`.
+
+        :return: AsyncBatch instance
+        :rtype: :py:class:`AsyncBatch`
+        """
+        kwargs = locals().copy()
+        del kwargs['self']
+        return AsyncBatch(table=self, **kwargs)
+
+    #
+    # Atomic counters
+    #
+
+    async def counter_get(self, row, column):
+        """Retrieve the current value of a counter column.
+
+        See :py:meth:`Table.counter_get`.
+
+        :return: counter value
+        :rtype: int
+        """
+        # Don't query directly, but increment with value=0 so that the counter
+        # is correctly initialised if didn't exist yet.
+        return await self.counter_inc(row, column, value=0)
+
+    async def counter_set(self, row, column, value=0):
+        """Set a counter column to a specific value.
+
+        See :py:meth:`Table.counter_set`.
+        """
+        await self.put(row, {column: pack_i64(value)})
+
+    async def counter_inc(self, row, column, value=1):
+        """Atomically increment (or decrements) a counter column.
+
+        See :py:meth:`Table.counter_inc`.
+
+        :return: counter value after incrementing
+        :rtype: int
+        """
+        return await self.connection._call(
+            'atomicIncrement', self.name, row, column, value)
+
+    async def counter_dec(self, row, column, value=1):
+        """Atomically decrement (or increments) a counter column.
+
+        See :py:meth:`Table.counter_dec`.
+
+        :return: counter value after decrementing
+        :rtype: int
+        """
+        return await self.counter_inc(row, column, -value)
+
+
+class AsyncBatch(Batch):
+    """Batch mutation class for use with asyncio.
+
+    This class works like :py:class:`happybase.Batch`, but its
+    :py:meth:`put`, :py:meth:`delete`, and :py:meth:`send` methods are
+    coroutines, and it must be used as an asynchronous context manager
+    (``async with``) instead of a regular one.
+
+    This class cannot be instantiated directly; use
+    :py:meth:`AsyncTable.batch` instead.
+
+    .. versionadded:: 1.3.0
+    """
+
+    async def send(self):
+        """Send the batch to the server."""
+        bms = self._batch_mutations()
+        if not bms:
+            return
+
+        logger.debug("Sending batch for '%s' (%d mutations on %d rows)",
+                     self._table.name, self._mutation_count, len(bms))
+        if self._timestamp is None:
+            await self._table.connection._call(
+                'mutateRows', self._table.name, bms, {})
+        else:
+            await self._table.connection._call(
+                'mutateRowsTs', self._table.name, bms, self._timestamp, {})
+
+        self._reset_mutations()
+
+    async def put(self, row, data, wal=None):
+        """Store data in the table.
+
+        See :py:meth:`Batch.put`.
+        """
+        if self._add_put(row, data, wal):
+            await self.send()
+
+    async def delete(self, row, columns=None, wal=None):
+        """Delete data from the table.
+
+        See :py:meth:`Batch.delete`.
+        """
+        if columns is None:
+            if self._families is None:
+                self._families = await self._table._column_family_names()
+            columns = self._families
+
+        if self._add_delete(row, columns, wal):
+            await self.send()
+
+    def __enter__(self):
+        raise TypeError("AsyncBatch must be used with 'async with'")
+
+    async def __aenter__(self):
+        """Called upon entering an ``async with`` block"""
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Called upon exiting an ``async with`` block"""
+        # If the 'async with' block raises an exception, the batch will not
+        # be sent to the server.
+        if self._transaction and exc_type is not None:
+            return
+
+        await self.send()
+
+
+class AsyncConnectionPool(object):
+    """Connection pool for use with asyncio.
+
+    This class works like :py:class:`happybase.ConnectionPool`. The `size`
+    argument specifies how many connections this pool manages, which is
+    the maximum number of requests that can be in flight at the same time.
+    Additional keyword arguments are passed unmodified to the
+    :py:class:`AsyncConnection` constructor (which accepts fewer arguments
+    than :py:class:`happybase.Connection`). Connections are made lazily.
+
+    Example::
+
+        pool = AsyncConnectionPool(size=100, host='somehost')
+
+        async with pool.connection() as connection:
+            row = await connection.table('mytable').row(b'row-key')
+
+    Unlike :py:class:`ConnectionPool`, nested :py:meth:`connection` blocks
+    in the same task obtain different connections.
+
+    .. versionadded:: 1.3.0
+
+    :param int size: the maximum number of concurrently open connections
+    :param kwargs: keyword arguments passed to
+                   :py:class:`AsyncConnection`
+    """
+    def __init__(self, size, **kwargs):
+        if not isinstance(size, int):
+            raise TypeError("Pool 'size' arg must be an integer")
+
+        if not size > 0:
+            raise ValueError("Pool 'size' arg must be greater than zero")
+
+        logger.debug(
+            "Initializing asyncio connection pool with %d connections", size)
+
+        self._connections = [AsyncConnection(**kwargs) for i in range(size)]
+
+        # Created on first use, since it must be created while the event
+        # loop is running in older Python versions.
+        self._queue = None
+
+    async def _acquire_connection(self, timeout=None):
+        """Acquire a connection from the pool."""
+        if self._queue is None:
+            self._queue = asyncio.LifoQueue()
+            for connection in self._connections:
+                self._queue.put_nowait(connection)
+
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise NoConnectionsAvailable(
+                "No connection available from pool within specified "
+                "timeout")
+
+    def _return_connection(self, connection):
+        """Return a connection to the pool."""
+        self._queue.put_nowait(connection)
+
+    @contextlib.asynccontextmanager
+    async def connection(self, timeout=None):
+        """
+        Obtain a connection from the pool.
+
+        This method *must* be used as an asynchronous context manager,
+        i.e. with Python's ``async with`` block. See
+        :py:meth:`ConnectionPool.connection`.
+
+        :param int timeout: number of seconds to wait (optional)
+        :return: active connection from the pool
+        :rtype: :py:class:`AsyncConnection`
+        """
+        connection = await self._acquire_connection(timeout)
+        try:
+            # Open connection, because connections are opened lazily.
+            # This is a no-op for connections that are already open.
+            await connection.open()
+
+            # Return value from the context manager's __aenter__()
+            yield connection
+
+        except (TException, socket.error):
+            # Close the connection if an exception occurred in the Thrift
+            # layer, since we don't know whether the connection is still
+            # usable. A new connection is made when it is used again.
+            logger.info("Replacing tainted pool connection")
+            connection.close()
+
+            # Reraise to caller; see contextlib.asynccontextmanager() docs
+            raise
+
+        finally:
+            self._return_connection(connection)
+
+    def close(self):
+        """Close all connections in this pool."""
+        for connection in self._connections:
+            connection.close()
@@ -45,12 +45,50 @@ class Batch(object):
         self._mutations = defaultdict(list)
         self._mutation_count = 0
 
-    def send(self):
-        """Send the batch to the server."""
-        bms = [
+    def _batch_mutations(self):
+        """Return the buffered mutations as ttypes.BatchMutation."""
+        return [
             BatchMutation(row, m)
             for row, m in six.iteritems(self._mutations)
         ]
+
+    def _add_put(self, row, data, wal):
+        """Buffer the mutations for a put (internal use).
+
+        Returns whether the batch should be sent.
+        """
+        if wal is None:
+            wal = self._wal
+
+        self._mutations[row].extend(
+            Mutation(
+                isDelete=False,
+                column=column,
+                value=value,
+                writeToWAL=wal)
+            for column, value in six.iteritems(data))
+
+        self._mutation_count += len(data)
+        return self._batch_size and self._mutation_count >= self._batch_size
+
+    def _add_delete(self, row, columns, wal):
+        """Buffer the mutations for a delete (internal use).
+
+        Returns whether the batch should be sent.
+        """
+        if wal is None:
+            wal = self._wal
+
+        self._mutations[row].extend(
+            Mutation(isDelete=True, column=column, writeToWAL=wal)
+            for column in columns)
+
+        self._mutation_count += len(columns)
+        return self._batch_size and self._mutation_count >= self._batch_size
+
+    def send(self):
+        """Send the batch to the server."""
+        bms = self._batch_mutations()
         if not bms:
             return
 
@@ -76,19 +114,7 @@ class Batch(object):
         used; its only use is to override the batch-wide value passed to
         :py:meth:`Table.batch`.
         """
-        if wal is None:
-            wal = self._wal
-
-        self._mutations[row].extend(
-            Mutation(
-                isDelete=False,
-                column=column,
-                value=value,
-                writeToWAL=wal)
-            for column, value in six.iteritems(data))
-
-        self._mutation_count += len(data)
-        if self._batch_size and self._mutation_count >= self._batch_size:
+        if self._add_put(row, data, wal):
             self.send()
 
     def delete(self, row, columns=None, wal=None):
@@ -108,15 +134,7 @@ class Batch(object):
                 self._families = self._table._column_family_names()
             columns = self._families
 
-        if wal is None:
-            wal = self._wal
-
-        self._mutations[row].extend(
-            Mutation(isDelete=True, column=column, writeToWAL=wal)
-            for column in columns)
-
-        self._mutation_count += len(columns)
-        if self._batch_size and self._mutation_count >= self._batch_size:
+        if self._add_delete(row, columns, wal):
             self.send()
 
     #
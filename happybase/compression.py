@@ -0,0 +1,76 @@
+"""
+HappyBase compression module.
+
+This module provides a Thrift transport compressing all data sent over the
+connection using zlib, which trades CPU time for network traffic. It is
+compatible with the zlib transports of Apache Thrift (``TZlibTransport``),
+which the Thrift server must use as well.
+
+This module is not part of the public API; the transport is used by passing
+``transport='zlib'`` to :py:class:`Connection`.
+"""
+
+import zlib
+from io import BytesIO
+
+from thriftpy2.transport import TTransportBase
+
+# Amount of compressed data to read from the socket at once
+READ_SIZE = 4096
+
+
+class TZlibTransport(TTransportBase):
+    """Thrift transport compressing data using zlib.
+
+    Data is compressed as a single zlib stream per connection. Written data
+    is buffered until :py:meth:`flush` is called, which compresses and
+    sends it, using a sync flush so that the other side can decompress
+    everything sent so far.
+    """
+    def __init__(self, trans, compress_level=zlib.Z_DEFAULT_COMPRESSION):
+        self._trans = trans
+        self._compress_level = compress_level
+        self._reset()
+
+    def _reset(self):
+        """Start new zlib streams, e.g. for a new connection."""
+        self._compressor = zlib.compressobj(self._compress_level)
+        self._decompressor = zlib.decompressobj()
+        self._rbuf = BytesIO(b'')
+        self._wbuf = BytesIO()
+
+    def is_open(self):
+        return self._trans.is_open()
+
+    def open(self):
+        self._reset()
+        return self._trans.open()
+
+    def close(self):
+        return self._trans.close()
+
+    def _read(self, sz):
+        ret = self._rbuf.read(sz)
+        if ret:
+            return ret
+
+        # A chunk of compressed data may not be enough to decompress
+        # anything yet.
+        data = b''
+        while not data:
+            data = self._decompressor.decompress(self._trans.read(READ_SIZE))
+
+        self._rbuf = BytesIO(data)
+        return self._rbuf.read(sz)
+
+    def write(self, buf):
+        self._wbuf.write(buf)
+
+    def flush(self):
+        out = self._wbuf.getvalue()
+        # reset wbuf before write/flush to preserve state on underlying failure
+        self._wbuf = BytesIO()
+        self._trans.write(
+            self._compressor.compress(out)
+            + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self._trans.flush()
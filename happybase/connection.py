@@ -5,16 +5,41 @@ HappyBase connection module.
 """
 
 import logging
+import os
+import socket
+import struct
+import threading
+import weakref
 
 import six
-from thriftpy2.thrift import TClient
-from thriftpy2.transport import TBufferedTransport, TFramedTransport, TSocket
-from thriftpy2.protocol import TBinaryProtocol, TCompactProtocol
+from thriftpy2.thrift import TClient, TException
+from thriftpy2.transport import TSocket, TTransportException
+from thriftpy2.transport.buffered import TBufferedTransport
+from thriftpy2.transport.framed import TFramedTransport
+from thriftpy2.protocol.binary import TBinaryProtocol
+from thriftpy2.protocol.compact import TCompactProtocol
+from thriftpy2.protocol.exc import TProtocolException
+
+try:
+    from thriftpy2.transport import TCyBufferedTransport, TCyFramedTransport
+    from thriftpy2.protocol import TCyBinaryProtocol
+    from thriftpy2.protocol.cybin import ProtocolError as CyProtocolError
+except ImportError:
+    # thriftpy2 can be built without its Cython extensions
+    TCyBufferedTransport = TCyFramedTransport = TCyBinaryProtocol = None
+    CyProtocolError = TProtocolException
 
 from Hbase_thrift import Hbase, ColumnDescriptor
 
+from .compression import TZlibTransport
+from .pipeline import (
+    DEFAULT_MAX_IN_FLIGHT, SEQID_LIMIT, Pipeline, call_many, make_request,
+    read_response, unpack_result, write_request)
+from .regions import RegionCache
+from .retry import RetryPolicy
 from .table import Table
-from .util import ensure_bytes, pep8_to_camel_case
+from .util import (
+    ensure_bytes, monotonic, pep8_to_camel_case, register_after_fork)
 
 logger = logging.getLogger(__name__)
 
@@ -24,18 +49,67 @@ COMPAT_MODES = ('0.90', '0.92', '0.94', '0.96', '0.98')
 THRIFT_TRANSPORTS = dict(
     buffered=TBufferedTransport,
     framed=TFramedTransport,
+    zlib=TZlibTransport,
 )
 THRIFT_PROTOCOLS = dict(
     binary=TBinaryProtocol,
     compact=TCompactProtocol,
 )
 
+# Cython versions of the above. There is no Cython compact protocol, and
+# the Cython binary protocol only works with Cython transports.
+ACCELERATED_AVAILABLE = TCyBinaryProtocol is not None
+ACCELERATED_THRIFT_TRANSPORTS = dict(
+    buffered=TCyBufferedTransport,
+    framed=TCyFramedTransport,
+)
+ACCELERATED_THRIFT_PROTOCOLS = dict(
+    binary=TCyBinaryProtocol,
+)
+ACCELERATED_MODES = (True, False, 'auto')
+
 DEFAULT_HOST = 'localhost'
 DEFAULT_PORT = 9090
 DEFAULT_TRANSPORT = 'buffered'
 DEFAULT_COMPAT = '0.98'
 DEFAULT_PROTOCOL = 'binary'
 
+# Small requests should not wait for more data to send (Nagle's algorithm),
+# and dead peers on idle connections should be detected eventually.
+DEFAULT_SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+# Transport and protocol combinations tried for 'auto', in order of
+# preference, and the timeout (in milliseconds) for each attempt.
+NEGOTIATION_ORDER = [
+    ('framed', 'compact'),
+    ('framed', 'binary'),
+    ('buffered', 'compact'),
+    ('buffered', 'binary'),
+]
+NEGOTIATION_TIMEOUT = 1000
+
+# Errors showing that the server uses another transport or protocol. Any
+# decoded reply, including an exception sent by the server, shows that the
+# transport and protocol are right.
+NEGOTIATION_ERRORS = (
+    TTransportException, TProtocolException, CyProtocolError, socket.error,
+    EOFError, struct.error, ValueError, OverflowError, MemoryError)
+
+# Negotiated (transport, protocol) per (host, port, transport, protocol)
+_negotiated_modes = {}
+
+
+def _thrift_classes(transport, protocol, accelerated):
+    """Return the Thrift transport and protocol classes to use."""
+    if accelerated and transport in ACCELERATED_THRIFT_TRANSPORTS:
+        return (ACCELERATED_THRIFT_TRANSPORTS[transport],
+                ACCELERATED_THRIFT_PROTOCOLS.get(
+                    protocol, THRIFT_PROTOCOLS[protocol]))
+    return THRIFT_TRANSPORTS[transport], THRIFT_PROTOCOLS[protocol]
+
 
 class Connection(object):
     """Connection to an HBase Thrift server.
@@ -65,24 +139,101 @@ class Connection(object):
 
     The optional `transport` argument specifies the Thrift transport
     mode to use. Supported values for this argument are ``buffered``
-    (the default) and ``framed``. Make sure to choose the right one,
-    since otherwise you might see non-obvious connection errors or
-    program hangs when making a connection. HBase versions before 0.94
-    always use the buffered transport. Starting with HBase 0.94, the
-    Thrift server optionally uses a framed transport, depending on the
-    argument passed to the ``hbase-daemon.sh start thrift`` command.
-    The default ``-threadpool`` mode uses the buffered transport; the
-    ``-hsha``, ``-nonblocking``, and ``-threadedselector`` modes use the
-    framed transport.
+    (the default), ``framed``, ``zlib``, and ``auto`` (see below). Make
+    sure to choose the right one, since otherwise you might see
+    non-obvious connection errors or program hangs when making a
+    connection. HBase versions before 0.94 always use the buffered
+    transport. Starting with HBase 0.94, the Thrift server optionally
+    uses a framed transport, depending on the argument passed to the
+    ``hbase-daemon.sh start thrift`` command. The default ``-threadpool``
+    mode uses the buffered transport; the ``-hsha``, ``-nonblocking``,
+    and ``-threadedselector`` modes use the framed transport.
+
+    The ``zlib`` transport compresses all data sent in both directions,
+    which reduces network traffic for e.g. large scans and batches of
+    text data, at the cost of CPU time. It requires a Thrift server (or
+    proxy) that uses a zlib transport as well, like the
+    ``TZlibTransport`` of Apache Thrift; it is never chosen by ``auto``.
 
     The optional `protocol` argument specifies the Thrift transport
     protocol to use. Supported values for this argument are ``binary``
-    (the default) and ``compact``. Make sure to choose the right one,
-    since otherwise you might see non-obvious connection errors or
-    program hangs when making a connection. ``TCompactProtocol`` is
-    a more compact binary format that is  typically more efficient to
-    process as well. ``TBinaryProtocol`` is the default protocol that
-    Happybase uses.
+    (the default), ``compact``, and ``auto``. Make sure to choose the
+    right one, since otherwise you might see non-obvious connection
+    errors or program hangs when making a connection.
+    ``TCompactProtocol`` is a more compact binary format that is
+    typically more efficient to process as well. ``TBinaryProtocol`` is
+    the default protocol that Happybase uses.
+
+    If `transport` and/or `protocol` is ``auto``, :py:meth:`open` finds
+    out which ones the Thrift server uses, by making a cheap call with
+    each combination in turn, preferring the framed transport and the
+    compact protocol. Each attempt waits one second for a reply, or
+    `timeout` if that is longer. The result is remembered
+    for the host and port, so that later connections (also those of a
+    :py:class:`ConnectionPool`) do not need to do this again. The first
+    connection may take a few seconds longer though, since a server using
+    a different transport may not respond at all.
+
+    The optional `accelerated` argument specifies whether to use the
+    Cython implementations of the Thrift transports and of the binary
+    protocol that thriftpy2 provides. With ``'auto'`` (the default), these
+    are used if thriftpy2 has been built with its Cython extensions; with
+    `True`, a :py:exc:`RuntimeError` is raised if they are not available.
+    With `False`, the pure Python implementations are used, which is
+    mostly useful for comparing performance and for debugging; the
+    results of scans and :py:meth:`Table.rows` are then decoded by
+    HappyBase itself, which is faster than the pure Python protocol but
+    slower than the Cython one. The
+    compact protocol and the zlib transport only have pure Python
+    implementations. The `accelerated` attribute tells whether the
+    Cython implementations are used.
+
+    The optional `connect_timeout` argument specifies the timeout in
+    milliseconds for establishing the TCP connection. By default, `timeout`
+    is used for this as well. A short connect timeout makes connecting to
+    an unreachable host fail quickly, while a longer `timeout` allows for
+    slow requests.
+
+    The optional `socket_options` argument is a list of
+    ``(level, option, value)`` tuples that are passed to
+    :py:meth:`socket.socket.setsockopt` before connecting. It replaces
+    :py:data:`DEFAULT_SOCKET_OPTIONS`, which enables ``TCP_NODELAY`` and
+    ``SO_KEEPALIVE``, so include those if they are still wanted, e.g.::
+
+        options = happybase.connection.DEFAULT_SOCKET_OPTIONS + [
+            (socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024),
+        ]
+        connection = happybase.Connection('somehost', socket_options=options)
+
+    The optional `retry_policy` argument specifies a
+    :py:class:`RetryPolicy` for retrying calls that fail because of
+    a broken connection. By default, calls are not retried.
+
+    By default, a connection must not be used by multiple threads at the
+    same time. If `shared` is `True`, it can be: requests from all
+    threads are sent over the same TCP connection, in order, without
+    waiting for the responses to earlier requests (pipelining), and each
+    thread receives the response to its own request. This allows many
+    concurrent requests without many connections to the Thrift server,
+    but a slow request delays the responses to later requests. If the
+    connection breaks, all pending calls fail, until it is reopened using
+    :py:meth:`close` and :py:meth:`open`; use a `retry_policy` to
+    reconnect automatically. Scanners and batches must still be used by
+    one thread at a time.
+
+    The `region_cache` attribute is a :py:class:`RegionCache` holding the
+    regions of the tables used through this connection. It can be
+    replaced, e.g. to change the time regions are cached for.
+
+    A connection can be used in a child process after a fork, e.g. when
+    using a pre-forking server or :py:mod:`multiprocessing`. The child
+    process gets its own TCP connection, while the one of the parent
+    process stays intact. This requires Python 3.7 or newer.
+
+    .. versionadded:: 1.3.0
+       `connect_timeout`, `socket_options`, `retry_policy`, `shared`,
+       and `accelerated` arguments, ``auto`` transport and protocol,
+       `region_cache` attribute, and support for forks
 
     .. versionadded:: 0.9
        `protocol` argument
@@ -99,19 +250,30 @@ class Connection(object):
     :param str host: The host to connect to
     :param int port: The port to connect to
     :param int timeout: The socket timeout in milliseconds (optional)
+    :param int connect_timeout: The connect timeout in milliseconds
+                                (optional)
+    :param list socket_options: Socket options to set (optional)
     :param bool autoconnect: Whether the connection should be opened directly
     :param str table_prefix: Prefix used to construct table names (optional)
     :param str table_prefix_separator: Separator used for `table_prefix`
     :param str compat: Compatibility mode (optional)
     :param str transport: Thrift transport mode (optional)
+    :param str protocol: Thrift protocol mode (optional)
+    :param retry_policy: Policy for retrying failed calls (optional)
+    :type retry_policy: :py:class:`RetryPolicy`
+    :param bool shared: Whether multiple threads can use the connection
+    :param accelerated: Whether to use the Cython Thrift implementations
+                        (`True`, `False`, or ``'auto'``)
     """
     def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None,
                  autoconnect=True, table_prefix=None,
                  table_prefix_separator=b'_', compat=DEFAULT_COMPAT,
-                 transport=DEFAULT_TRANSPORT, protocol=DEFAULT_PROTOCOL):
+                 transport=DEFAULT_TRANSPORT, protocol=DEFAULT_PROTOCOL,
+                 retry_policy=None, shared=False, accelerated='auto',
+                 connect_timeout=None, socket_options=None):
 
-        if transport not in THRIFT_TRANSPORTS:
-            raise ValueError("'transport' must be one of %s"
+        if transport != 'auto' and transport not in THRIFT_TRANSPORTS:
+            raise ValueError("'transport' must be one of %s, auto"
                              % ", ".join(THRIFT_TRANSPORTS.keys()))
 
         if table_prefix is not None:
@@ -127,35 +289,200 @@ class Connection(object):
             raise ValueError("'compat' must be one of %s"
                              % ", ".join(COMPAT_MODES))
 
-        if protocol not in THRIFT_PROTOCOLS:
-            raise ValueError("'protocol' must be one of %s"
+        if protocol != 'auto' and protocol not in THRIFT_PROTOCOLS:
+            raise ValueError("'protocol' must be one of %s, auto"
                              % ", ".join(THRIFT_PROTOCOLS))
 
+        if connect_timeout is not None and not connect_timeout > 0:
+            raise ValueError("'connect_timeout' must be > 0")
+
+        if socket_options is None:
+            socket_options = DEFAULT_SOCKET_OPTIONS
+        elif not isinstance(socket_options, (tuple, list)):
+            raise TypeError("'socket_options' must be a tuple or list")
+
+        if accelerated not in ACCELERATED_MODES:
+            raise ValueError("'accelerated' must be True, False or 'auto'")
+
+        if accelerated is True and not ACCELERATED_AVAILABLE:
+            raise RuntimeError(
+                "No Cython Thrift implementation available; please install "
+                "thriftpy2 with its Cython extensions to use "
+                "accelerated=True.")
+
+        if not (retry_policy is None or isinstance(retry_policy, RetryPolicy)):
+            raise TypeError("'retry_policy' must be a RetryPolicy instance")
+
         # Allow host and port to be None, which may be easier for
         # applications wrapping a Connection instance.
         self.host = host or DEFAULT_HOST
         self.port = port or DEFAULT_PORT
         self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.socket_options = list(socket_options)
         self.table_prefix = table_prefix
         self.table_prefix_separator = table_prefix_separator
         self.compat = compat
-
-        self._transport_class = THRIFT_TRANSPORTS[transport]
-        self._protocol_class = THRIFT_PROTOCOLS[protocol]
+        self.retry_policy = retry_policy
+        self.shared = shared
+
+        self._reconnect_lock = threading.Lock()
+        self.accelerated = bool(accelerated) and ACCELERATED_AVAILABLE
+        self._transport_mode = transport
+        self._protocol_mode = protocol
+        self._set_thrift_modes(
+            DEFAULT_TRANSPORT if transport == 'auto' else transport,
+            DEFAULT_PROTOCOL if protocol == 'auto' else protocol)
         self._refresh_thrift_client()
 
+        self.region_cache = RegionCache()
+
+        self._pid = os.getpid()
+        self._reopen_after_fork = True
+        register_after_fork(self)
+
         if autoconnect:
             self.open()
 
         self._initialized = True
 
+    def _set_thrift_modes(self, transport, protocol):
+        """Set the Thrift transport and protocol to use."""
+        self._transport_name = transport
+        self._protocol_name = protocol
+        self._framed = (transport == 'framed')
+        self._transport_class, self._protocol_class = _thrift_classes(
+            transport, protocol, self.accelerated)
+
+    def _negotiate(self):
+        """Choose the transport and protocol for ``auto`` modes.
+
+        This uses the result of an earlier negotiation for the same server
+        if there is one. Otherwise, each allowed combination is tried.
+        """
+        key = (self.host, self.port, self._transport_mode,
+               self._protocol_mode)
+        modes = _negotiated_modes.get(key)
+        if modes is None:
+            modes = self._probe_modes()
+            _negotiated_modes[key] = modes
+            logger.info(
+                "Using %s transport and %s protocol for %s:%d",
+                modes[0], modes[1], self.host, self.port)
+
+        if modes != (self._transport_name, self._protocol_name):
+            self._set_thrift_modes(*modes)
+            self._refresh_thrift_client()
+
+    def _probe_modes(self):
+        """Find a transport and protocol the Thrift server responds to."""
+        timeout = NEGOTIATION_TIMEOUT
+        if self.timeout is not None:
+            timeout = max(timeout, self.timeout)
+
+        for transport, protocol in NEGOTIATION_ORDER:
+            if self._transport_mode not in ('auto', transport):
+                continue
+            if self._protocol_mode not in ('auto', protocol):
+                continue
+
+            transport_class, protocol_class = _thrift_classes(
+                transport, protocol, self.accelerated)
+            trans = transport_class(self._new_socket(timeout))
+
+            # Errors while connecting are not caused by the modes, so
+            # those are raised directly.
+            trans.open()
+            try:
+                client = TClient(
+                    Hbase, protocol_class(trans, decode_response=False))
+                client.getTableNames()
+            except NEGOTIATION_ERRORS as exc:
+                logger.debug(
+                    "Thrift server at %s:%d does not use %s transport "
+                    "and %s protocol: %r",
+                    self.host, self.port, transport, protocol, exc)
+            except TException:
+                # HBase errors and TApplicationException are replies too
+                return transport, protocol
+            else:
+                return transport, protocol
+            finally:
+                trans.close()
+
+        raise TTransportException(
+            type=TTransportException.UNKNOWN,
+            message="Cannot determine the Thrift transport and protocol "
+                    "used by %s:%d" % (self.host, self.port))
+
+    def _new_socket(self, timeout):
+        """Create a Thrift socket for this connection."""
+        connect_timeout = self.connect_timeout
+        if connect_timeout is None:
+            connect_timeout = self.timeout
+        return _Socket(self.host, self.port, timeout, connect_timeout,
+                       self.socket_options)
+
     def _refresh_thrift_client(self):
         """Refresh the Thrift socket, transport, and client."""
-        socket = TSocket(host=self.host, port=self.port, socket_timeout=self.timeout)
-
-        self.transport = self._transport_class(socket)
+        self._socket = self._new_socket(self.timeout)
+        self.transport = self._transport_class(self._socket)
         protocol = self._protocol_class(self.transport, decode_response=False)
-        self.client = TClient(Hbase, protocol)
+        if self.shared:
+            # Requests are written while responses are read, so these
+            # need their own protocol instances, which may keep state.
+            self._client = _PipelinedClient(
+                Hbase, protocol,
+                self._protocol_class(self.transport, decode_response=False),
+                flush_each=self._framed,
+                timeout=self.timeout / 1000.0 if self.timeout else None)
+        else:
+            self._client = TClient(Hbase, protocol)
+        if self.retry_policy is None:
+            self.client = self._client
+        else:
+            self.client = _RetryingClient(self)
+
+    def _reconnect(self):
+        """Replace the (possibly broken) Thrift connection by a new one."""
+        with self._reconnect_lock:
+            if (self.shared and self._client.broken is None
+                    and self.transport.is_open()):
+                # Another thread already replaced the broken connection.
+                return
+
+            logger.info(
+                "Reconnecting Thrift transport to %s:%d",
+                self.host, self.port)
+            self.close()
+            self._refresh_thrift_client()
+            self.open()
+
+    def _after_fork(self):
+        """Replace the Thrift connection inherited from the parent process.
+
+        The inherited socket is closed without shutting it down, since
+        that would break the connection of the parent process as well.
+        """
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+
+        self._pid = pid
+        self._reconnect_lock = threading.Lock()
+        was_open = self.transport.is_open()
+        if self._socket.sock is not None:
+            self._socket.sock.close()
+            self._socket.sock = None
+        self._refresh_thrift_client()
+
+        if was_open and self._reopen_after_fork:
+            try:
+                self.open()
+            except (TTransportException, socket.error) as exc:
+                logger.warning(
+                    "Cannot reopen Thrift transport to %s:%d after fork: %s",
+                    self.host, self.port, exc)
 
     def _table_name(self, name):
         """Construct a table name by optionally adding a table name prefix."""
@@ -169,9 +496,18 @@ class Connection(object):
 
         This method opens the underlying Thrift transport (TCP connection).
         """
+        if self.shared and self._client.broken is not None:
+            # The requests and responses of a broken shared connection are
+            # out of step, so it needs a new Thrift client.
+            self.close()
+            self._refresh_thrift_client()
+
         if self.transport.is_open():
             return
 
+        if 'auto' in (self._transport_mode, self._protocol_mode):
+            self._negotiate()
+
         logger.debug("Opening Thrift transport to %s:%d", self.host, self.port)
         self.transport.open()
 
@@ -230,6 +566,56 @@ class Connection(object):
     # Table administration and maintenance
     #
 
+    def pipeline(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Create a new pipeline for sending many calls at once.
+
+        This method returns a new :py:class:`Pipeline` instance. Calls
+        made using the tables obtained using :py:meth:`Pipeline.table` are
+        queued, instead of sent to the server right away. When the
+        pipeline is sent, all queued requests are written in one go, and
+        the responses are read afterwards, so that many small independent
+        calls take a single round-trip instead of one each. The results
+        are available as a list, and as :py:class:`PipelineResult`
+        instances returned when queueing the calls. Example::
+
+            with connection.pipeline() as pipe:
+                table = pipe.table('mytable')
+                a = table.row(b'row-a')
+                b = table.counter_inc(b'row-b', b'cf:counter')
+
+            print(a.result(), b.result())
+
+        A pipeline can also be sent explicitly using
+        :py:meth:`Pipeline.send`, which returns the results as a list.
+        When used as a context manager, the pipeline is sent at the end of
+        the ``with`` block, unless an exception occurred.
+
+        Since the Thrift server stops reading requests while its responses
+        are not read, at most `max_in_flight` requests are sent before
+        reading a response.
+
+        .. versionadded:: 1.3.0
+
+        :param int max_in_flight: max number of requests awaiting a response
+        :return: Pipeline instance
+        :rtype: :py:class:`Pipeline`
+        """
+        return Pipeline(self, max_in_flight)
+
+    def _call_many(self, requests, max_in_flight):
+        """Make many Thrift calls at once (internal use).
+
+        This returns the result structs for the `(api, request)` tuples,
+        see :py:func:`happybase.pipeline.call_many`.
+        """
+        if self.shared:
+            return self._client._call_many(requests, max_in_flight)
+
+        return call_many(
+            self._client._oprot, self._client._iprot, requests,
+            flush_each=self._framed,
+            max_in_flight=max_in_flight)
+
     def tables(self):
         """Return a list of table names available in this HBase instance.
 
@@ -365,3 +751,209 @@ class Connection(object):
             self.client.majorCompact(name)
         else:
             self.client.compact(name)
+
+
+class _Socket(TSocket):
+    """Thrift socket with socket options and a connect timeout (internal use).
+
+    Unlike :py:class:`TSocket`, this supports IPv6 addresses, and sets the
+    socket options before connecting, which is required for the receive
+    buffer size to affect the TCP window size.
+    """
+    def __init__(self, host, port, socket_timeout, connect_timeout,
+                 socket_options):
+        super(_Socket, self).__init__(
+            host=host, port=port, socket_timeout=socket_timeout)
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.socket_timeout = (
+            socket_timeout / 1000.0 if socket_timeout else None)
+        self.connect_timeout = (
+            connect_timeout / 1000.0 if connect_timeout else None)
+        self.socket_options = socket_options
+
+    def open(self):
+        error = None
+        try:
+            addresses = socket.getaddrinfo(
+                self.host, self.port, 0, socket.SOCK_STREAM)
+        except socket.error as exc:
+            addresses = []
+            error = exc
+
+        for family, socktype, proto, _, address in addresses:
+            sock = socket.socket(family, socktype, proto)
+            try:
+                for level, option, value in self.socket_options:
+                    sock.setsockopt(level, option, value)
+                sock.settimeout(self.connect_timeout)
+                sock.connect(address)
+            except socket.error as exc:
+                sock.close()
+                error = exc
+                continue
+
+            sock.settimeout(self.socket_timeout)
+            self.sock = sock
+            return
+
+        raise TTransportException(
+            type=TTransportException.NOT_OPEN,
+            message="Could not connect to %s:%d: %s" % (
+                self.host, self.port, error))
+
+
+class _RetryingClient(object):
+    """Thrift client retrying failed calls (internal use).
+
+    This calls the Thrift client of a connection according to its retry
+    policy, using the client of the connection at the time of each
+    attempt, since retries use a new connection.
+    """
+
+    # Results cannot be decoded directly, see happybase.decode.can_decode()
+    _iprot = None
+
+    def __init__(self, connection):
+        # No reference cycle, since Connection has a __del__() method.
+        self._connection = weakref.proxy(connection)
+
+    def __getattr__(self, api):
+        connection = self._connection
+
+        def call(*args, **kwargs):
+            return connection.retry_policy.call(
+                api,
+                lambda: getattr(connection._client, api)(*args, **kwargs),
+                connection._reconnect)
+
+        return call
+
+
+class _PipelinedClient(TClient):
+    """Thrift client that can be used by many threads at once (internal use).
+
+    Each request is sent right away, with its own sequence id, without
+    waiting for the responses to earlier requests, which the Thrift
+    server sends back in the same order. Each thread then waits for its
+    turn to read its response, so that sending requests overlaps with
+    receiving responses. Once the connection breaks, all calls fail. This
+    includes a thread that does not read its response (e.g. because it is
+    interrupted), and waiting longer than `timeout` seconds (if given) for
+    the response to an earlier request to be read.
+    """
+
+    # Results cannot be decoded directly, see happybase.decode.can_decode()
+    _iprot = None
+
+    def __init__(self, service, iprot, oprot, flush_each=False,
+                 timeout=None):
+        self._service = service
+        self._in = iprot
+        self._out = oprot
+        self._flush_each = flush_each
+        self._timeout = timeout
+        self._send_lock = threading.Lock()
+        self._turn = threading.Condition(threading.RLock())
+        self._next_seqid = 0
+        self._next_response = 0
+
+        # The error that broke the connection, if any.
+        self.broken = None
+
+    def _fail(self, exc):
+        """Mark the connection as broken, and wake up all waiting threads."""
+        with self._turn:
+            if self.broken is None:
+                self.broken = exc
+            self._turn.notify_all()
+
+    def _check(self):
+        if self.broken is not None:
+            raise TTransportException(
+                type=TTransportException.NOT_OPEN,
+                message="Shared connection is broken: %r" % (self.broken,))
+
+    def _send_requests(self, requests):
+        """Send `(api, request)` tuples, and return their sequence ids."""
+        with self._send_lock:
+            self._check()
+            seqids = []
+            try:
+                for api, request in requests:
+                    seqid = self._next_seqid
+                    self._next_seqid = (seqid + 1) % SEQID_LIMIT
+                    write_request(self._out, api, request, seqid)
+                    seqids.append(seqid)
+                    if self._flush_each:
+                        self._out.trans.flush()
+                if not self._flush_each:
+                    self._out.trans.flush()
+            except Exception as exc:
+                # A partially written request corrupts the stream.
+                self._fail(exc)
+                raise
+        return seqids
+
+    def _recv_response(self, api, seqid):
+        """Wait for the turn of a request, and read its response."""
+        with self._turn:
+            waiting_for = deadline = None
+            while self._next_response != seqid and self.broken is None:
+                if self._next_response != waiting_for:
+                    # Another response was read, so the clock restarts.
+                    waiting_for = self._next_response
+                    if self._timeout is not None:
+                        deadline = monotonic() + self._timeout
+
+                if deadline is None:
+                    self._turn.wait()
+                    continue
+
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self._fail(TTransportException(
+                        type=TTransportException.TIMED_OUT,
+                        message="Timed out waiting for the response to an "
+                                "earlier request"))
+                    break
+                self._turn.wait(remaining)
+            self._check()
+
+            try:
+                result = read_response(self._in, api, seqid)
+            except Exception as exc:
+                self._fail(exc)
+                raise
+
+            self._next_response = (seqid + 1) % SEQID_LIMIT
+            self._turn.notify_all()
+        return result
+
+    def _req(self, _api, *args, **kwargs):
+        request = make_request(_api, *args, **kwargs)
+        seqid, = self._send_requests([(_api, request)])
+        try:
+            result = self._recv_response(_api, seqid)
+        except BaseException as exc:
+            # An unread response would block all later calls forever.
+            self._fail(exc)
+            raise
+        return unpack_result(result)
+
+    def _call_many(self, requests, max_in_flight):
+        """Make many calls, sending up to `max_in_flight` at once."""
+        results = []
+        for i in range(0, len(requests), max_in_flight):
+            chunk = requests[i:i + max_in_flight]
+            seqids = self._send_requests(chunk)
+            try:
+                results.extend(
+                    self._recv_response(api, seqid)
+                    for (api, _), seqid in zip(chunk, seqids))
+            except BaseException as exc:
+                # See _req()
+                self._fail(exc)
+                raise
+        return results
@@ -0,0 +1,259 @@
+"""
+HappyBase result decoding module.
+
+The generic Thrift client decodes row results into ``TRowResult`` and
+``TCell`` instances, which are then converted into dicts. For calls that
+return many rows, the functions in this module read the binary protocol
+wire format straight into the final `(row_key, row_data)` tuples instead,
+or into `(row_key, values)` tuples with a value for each of a list of
+columns (for :py:meth:`Table.scan_columnar`).
+
+This only works with the pure Python binary protocol of thriftpy2, which is
+used with ``accelerated=False``, with the ``zlib`` transport, or if
+thriftpy2 was built without its Cython extensions (see
+:py:func:`can_decode`). It is a fallback that makes that protocol faster;
+by default, connections use the Cython protocol, which decodes Thrift
+structs faster than this module can, so it is not used then.
+
+These functions are not part of the public API.
+"""
+
+from struct import Struct
+
+import six
+from six.moves import range
+from thriftpy2.protocol import binary
+from thriftpy2.thrift import TApplicationException, TMessageType, TType
+
+from Hbase_thrift import Hbase
+
+from .util import OrderedDict
+
+unpack_i16 = Struct('>h').unpack
+unpack_i32 = Struct('>i').unpack
+unpack_string_field = Struct('>hi').unpack
+unpack_i64_field = Struct('>hq').unpack
+unpack_list_begin = Struct('>bi').unpack
+unpack_map_begin = Struct('>bbi').unpack
+
+# Wire types as (single byte) strings, so that field types can be compared
+# without unpacking them first.
+T_STOP = six.int2byte(TType.STOP)
+T_STRING = six.int2byte(TType.STRING)
+T_I64 = six.int2byte(TType.I64)
+T_STRUCT = six.int2byte(TType.STRUCT)
+T_MAP = six.int2byte(TType.MAP)
+T_LIST = six.int2byte(TType.LIST)
+
+
+def _skip(trans, ftype):
+    """Skip a value of the specified wire type."""
+    binary.skip(trans, six.indexbytes(ftype, 0))
+
+
+def _read_cell(read, trans):
+    """Read a TCell struct and return a `(value, timestamp)` tuple."""
+    # This is the innermost loop, so the field header and the (fixed size
+    # part of the) field value are read at once.
+    value = timestamp = None
+    while True:
+        ftype = read(1)
+        if ftype == T_STRING:
+            fid, size = unpack_string_field(read(6))
+            if fid == 1:
+                value = read(size)
+            else:
+                read(size)
+        elif ftype == T_I64:
+            fid, n = unpack_i64_field(read(10))
+            if fid == 2:
+                timestamp = n
+        elif ftype == T_STOP:
+            return value, timestamp
+        else:
+            read(2)
+            _skip(trans, ftype)
+
+
+def _read_column(read, trans):
+    """Read a TColumn struct and return a `(name, value, timestamp)` tuple."""
+    name = None
+    value = timestamp = None
+    while True:
+        ftype = read(1)
+        if ftype == T_STOP:
+            return name, value, timestamp
+
+        fid, = unpack_i16(read(2))
+        if fid == 1 and ftype == T_STRING:
+            name = read(unpack_i32(read(4))[0])
+        elif fid == 2 and ftype == T_STRUCT:
+            value, timestamp = _read_cell(read, trans)
+        else:
+            _skip(trans, ftype)
+
+
+def _read_row(read, trans, include_timestamp, sorted_columns):
+    """Read a TRowResult struct and return a `(row_key, row_data)` tuple."""
+    row = None
+    data = OrderedDict() if sorted_columns else {}
+    while True:
+        ftype = read(1)
+        if ftype == T_STOP:
+            return row, data
+
+        fid, = unpack_i16(read(2))
+        if fid == 1 and ftype == T_STRING:
+            row = read(unpack_i32(read(4))[0])
+
+        elif fid == 2 and ftype == T_MAP and not sorted_columns:
+            ktype, vtype, size = unpack_map_begin(read(6))
+            if (ktype, vtype) != (TType.STRING, TType.STRUCT):
+                for _ in range(size):
+                    binary.skip(trans, ktype)
+                    binary.skip(trans, vtype)
+                continue
+
+            for _ in range(size):
+                name = read(unpack_i32(read(4))[0])
+                value, timestamp = _read_cell(read, trans)
+                data[name] = (
+                    (value, timestamp) if include_timestamp else value)
+
+        elif fid == 3 and ftype == T_LIST and sorted_columns:
+            etype, size = unpack_list_begin(read(5))
+            if etype != TType.STRUCT:
+                for _ in range(size):
+                    binary.skip(trans, etype)
+                continue
+
+            for _ in range(size):
+                name, value, timestamp = _read_column(read, trans)
+                data[name] = (
+                    (value, timestamp) if include_timestamp else value)
+
+        else:
+            _skip(trans, ftype)
+
+
+def _read_columnar_row(read, trans, column_index):
+    """Read a TRowResult struct and return a `(row_key, values)` tuple.
+
+    The `column_index` dict maps column names to positions in `values`;
+    other columns are ignored, and missing ones are None.
+    """
+    row = None
+    values = [None] * len(column_index)
+    while True:
+        ftype = read(1)
+        if ftype == T_STOP:
+            return row, values
+
+        fid, = unpack_i16(read(2))
+        if fid == 1 and ftype == T_STRING:
+            row = read(unpack_i32(read(4))[0])
+
+        elif fid == 2 and ftype == T_MAP:
+            ktype, vtype, size = unpack_map_begin(read(6))
+            if (ktype, vtype) != (TType.STRING, TType.STRUCT):
+                for _ in range(size):
+                    binary.skip(trans, ktype)
+                    binary.skip(trans, vtype)
+                continue
+
+            for _ in range(size):
+                name = read(unpack_i32(read(4))[0])
+                value, timestamp = _read_cell(read, trans)
+                i = column_index.get(name)
+                if i is not None:
+                    values[i] = value
+
+        else:
+            _skip(trans, ftype)
+
+
+def _read_result(trans, result_spec, read_row, *args):
+    """Read a ``*_result`` struct returning a list of TRowResult.
+
+    Each TRowResult is read using `read_row`, which is passed `args` as
+    additional arguments. Returns a `(rows, exception)` tuple, since
+    exceptions declared by the Thrift function are part of the result
+    struct.
+    """
+    read = trans.read
+    rows = exc = None
+    while True:
+        ftype = read(1)
+        if ftype == T_STOP:
+            return rows, exc
+
+        fid, = unpack_i16(read(2))
+        if fid == 0 and ftype == T_LIST:
+            etype, size = unpack_list_begin(read(5))
+            if etype != TType.STRUCT:
+                for _ in range(size):
+                    binary.skip(trans, etype)
+                continue
+
+            rows = [read_row(read, trans, *args) for _ in range(size)]
+
+        elif fid in result_spec and ftype == T_STRUCT:
+            # Declared exception, e.g. IOError
+            exc = binary.read_val(
+                trans, TType.STRUCT, result_spec[fid][2],
+                decode_response=False)
+
+        else:
+            _skip(trans, ftype)
+
+
+def can_decode(client):
+    """Tell whether results for a Thrift client can be decoded directly.
+
+    This is only the case for the pure Python binary protocol. The Cython
+    version of the binary protocol (which thriftpy2 uses if available)
+    decodes results into Thrift structs faster than Python code reading
+    the wire format can, and the compact protocol is not supported.
+    """
+    return type(client._iprot) is binary.TBinaryProtocol
+
+
+def request_rows(client, api, args, include_timestamp=False,
+                 sorted_columns=False, columnar=None):
+    """Call a Thrift function returning a list of TRowResult.
+
+    This sends a request for the Thrift function `api` (e.g.
+    ``scannerGetList``) with the keyword arguments in the `args` dict, and
+    decodes the results directly into a list of `(row_key, row_data)`
+    tuples, like :py:meth:`Table.rows` and :py:meth:`Table.scan` return.
+    If a list of column names is passed as `columnar`, the results are
+    `(row_key, values)` tuples instead, where `values` is a list holding
+    the value of each of these columns (or None). The `client` must use
+    the pure Python binary protocol (see :py:func:`can_decode`).
+    """
+    client._send(api, **args)
+
+    iprot = client._iprot
+    _, mtype, _ = iprot.read_message_begin()
+    if mtype == TMessageType.EXCEPTION:
+        exc = TApplicationException()
+        exc.read(iprot)
+        iprot.read_message_end()
+        raise exc
+
+    result_spec = getattr(Hbase, api + '_result').thrift_spec
+    if columnar is None:
+        rows, exc = _read_result(
+            iprot.trans, result_spec, _read_row, include_timestamp,
+            sorted_columns)
+    else:
+        column_index = dict((name, i) for i, name in enumerate(columnar))
+        rows, exc = _read_result(
+            iprot.trans, result_spec, _read_columnar_row, column_index)
+    iprot.read_message_end()
+
+    if rows is not None:
+        return rows
+    if exc is not None:
+        raise exc
+    raise TApplicationException(TApplicationException.MISSING_RESULT)
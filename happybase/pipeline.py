@@ -0,0 +1,433 @@
+"""
+HappyBase pipeline module.
+"""
+
+import logging
+from numbers import Integral
+
+from thriftpy2.thrift import (
+    TApplicationException, TMessageType, args_to_kwargs)
+
+from Hbase_thrift import Hbase
+
+from .table import make_row, pack_i64
+
+logger = logging.getLogger(__name__)
+
+# Thrift sequence ids are signed 32-bit integers.
+SEQID_LIMIT = 2 ** 31
+
+# Maximum number of requests sent before reading a response. Since the
+# Thrift server stops reading requests while it cannot send a response,
+# sending too many requests at once could make both sides wait forever.
+DEFAULT_MAX_IN_FLIGHT = 100
+
+
+def make_request(api, *args, **kwargs):
+    """Create the Thrift struct with the arguments for a call."""
+    args_cls = getattr(Hbase, api + '_args')
+    try:
+        kwargs = args_to_kwargs(args_cls.thrift_spec, *args, **kwargs)
+    except ValueError as exc:
+        raise TApplicationException(
+            TApplicationException.UNKNOWN_METHOD,
+            '%s is required argument for Hbase.%s' % (exc.args[0], api))
+
+    request = args_cls()
+    for name, value in kwargs.items():
+        setattr(request, name, value)
+    return request
+
+
+def write_request(oprot, api, request, seqid):
+    """Write a request, without flushing the transport."""
+    oprot.write_message_begin(api, TMessageType.CALL, seqid)
+    request.write(oprot)
+    oprot.write_message_end()
+
+
+def read_response(iprot, api, seqid):
+    """Read the response to a call.
+
+    This returns the Thrift result struct, which holds either the return
+    value or the exception raised by HBase, or a
+    :py:exc:`TApplicationException` sent by the Thrift server. Errors
+    while reading are raised, since the connection cannot be used anymore
+    after those.
+    """
+    _, mtype, rseqid = iprot.read_message_begin()
+    if mtype == TMessageType.EXCEPTION:
+        result = TApplicationException()
+    else:
+        result = getattr(Hbase, api + '_result')()
+    result.read(iprot)
+    iprot.read_message_end()
+
+    if rseqid != seqid:
+        raise TApplicationException(
+            TApplicationException.BAD_SEQUENCE_ID,
+            "Expected response %d to %s, got %d" % (seqid, api, rseqid))
+
+    return result
+
+
+def unpack_result(result):
+    """Return the value from a result struct, or raise its exception."""
+    if isinstance(result, TApplicationException):
+        raise result
+
+    if getattr(result, 'success', None) is not None:
+        return result.success
+
+    # Functions without a return value and without exceptions
+    if not result.thrift_spec:
+        return None
+
+    for name, value in result.__dict__.items():
+        if name != 'success' and value:
+            raise value
+
+    if hasattr(result, 'success'):
+        raise TApplicationException(TApplicationException.MISSING_RESULT)
+
+
+def call_many(oprot, iprot, requests, flush_each=False,
+              max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """Make many calls, without waiting for responses in between.
+
+    The `requests` are `(api, request)` tuples. This returns the result
+    structs (see :py:func:`read_response`). If `flush_each` is true, the
+    transport is flushed after each request, which framed transports
+    require, since servers expect a single request per frame.
+    """
+    results = []
+    unflushed = False
+    for seqid, (api, request) in enumerate(requests):
+        if seqid - len(results) == max_in_flight:
+            if unflushed:
+                oprot.trans.flush()
+                unflushed = False
+            i = len(results)
+            results.append(read_response(iprot, requests[i][0], i))
+
+        write_request(oprot, api, request, seqid % SEQID_LIMIT)
+        if flush_each:
+            oprot.trans.flush()
+        else:
+            unflushed = True
+
+    if unflushed:
+        oprot.trans.flush()
+
+    while len(results) < len(requests):
+        i = len(results)
+        results.append(
+            read_response(iprot, requests[i][0], i % SEQID_LIMIT))
+
+    return results
+
+
+class PipelineResult(object):
+    """
+    Result of a call queued in a :py:class:`Pipeline`.
+
+    This class cannot be instantiated directly; it is returned by the
+    methods of the tables obtained using :py:meth:`Pipeline.table`.
+
+    .. versionadded:: 1.3.0
+    """
+    def __init__(self, convert=None):
+        self._convert = convert
+        self._done = False
+        self._value = self._exception = None
+
+    def _set(self, result):
+        try:
+            value = unpack_result(result)
+            if self._convert is not None:
+                value = self._convert(value)
+        except Exception as exc:
+            self._exception = exc
+        else:
+            self._value = value
+        self._done = True
+
+    def done(self):
+        """Tell whether the pipeline this call is part of has been sent.
+
+        :rtype: bool
+        """
+        return self._done
+
+    def result(self):
+        """Return the result of the call, or raise its error.
+
+        :return: the value the corresponding :py:class:`Table` method
+                 would return
+        """
+        if not self._done:
+            raise RuntimeError("The pipeline has not been sent yet")
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+    def exception(self):
+        """Return the error raised by the call, if any.
+
+        :return: the error, or `None`
+        """
+        if not self._done:
+            raise RuntimeError("The pipeline has not been sent yet")
+        return self._exception
+
+
+class Pipeline(object):
+    """
+    Queue of calls that are sent to the server together.
+
+    This class cannot be instantiated directly; use
+    :py:meth:`Connection.pipeline` instead.
+
+    .. versionadded:: 1.3.0
+    """
+    def __init__(self, connection, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Initialise a new Pipeline instance."""
+        if not max_in_flight > 0:
+            raise ValueError("'max_in_flight' must be > 0")
+
+        self.connection = connection
+        self._max_in_flight = max_in_flight
+        self._calls = []
+
+    def __len__(self):
+        return len(self._calls)
+
+    def table(self, name, use_prefix=True):
+        """Return a table object for queueing calls in this pipeline.
+
+        See :py:meth:`Connection.table` for the arguments.
+
+        :return: PipelineTable instance
+        :rtype: :py:class:`PipelineTable`
+        """
+        return PipelineTable(self, self.connection.table(name, use_prefix))
+
+    def _add(self, api, args, convert=None):
+        """Queue a call, and return its PipelineResult."""
+        result = PipelineResult(convert)
+        self._calls.append((api, make_request(api, *args), result))
+        return result
+
+    def send(self):
+        """Send the queued calls to the server, and read the results.
+
+        This returns the results of the calls, in the order the calls were
+        queued. If any call failed, the first error is raised, after all
+        results have been read; use the :py:class:`PipelineResult`
+        instances to get the other results. Calls in a pipeline are never
+        retried, even if the connection has a :py:class:`RetryPolicy`.
+
+        :return: results of the calls
+        :rtype: list
+        """
+        calls, self._calls = self._calls, []
+        if not calls:
+            return []
+
+        logger.debug("Sending pipeline with %d calls", len(calls))
+        responses = self.connection._call_many(
+            [(api, request) for api, request, _ in calls],
+            self._max_in_flight)
+
+        for (_, _, result), response in zip(calls, responses):
+            result._set(response)
+
+        for _, _, result in calls:
+            if result._exception is not None:
+                raise result._exception
+
+        return [result._value for _, _, result in calls]
+
+    #
+    # Context manager methods
+    #
+
+    def __enter__(self):
+        """Called upon entering a ``with`` block"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Called upon exiting a ``with`` block"""
+        # If the 'with' block raises an exception, the queued calls are
+        # not sent to the server.
+        if exc_type is not None:
+            return
+
+        self.send()
+
+
+class PipelineTable(object):
+    """
+    Table whose methods queue calls in a :py:class:`Pipeline`.
+
+    The methods of this class accept the same arguments as the
+    corresponding :py:class:`Table` methods, but return
+    a :py:class:`PipelineResult` instead of the result.
+
+    This class cannot be instantiated directly; use
+    :py:meth:`Pipeline.table` instead.
+
+    .. versionadded:: 1.3.0
+    """
+    def __init__(self, pipeline, table):
+        self._pipeline = pipeline
+        self._table = table
+        self.name = table.name
+
+    def __repr__(self):
+        return '<%s.%s name=%r>' % (
+            __name__,
+            self.__class__.__name__,
+            self.name,
+        )
+
+    def row(self, row, columns=None, timestamp=None,
+            include_timestamp=False):
+        """Queue retrieving a single row of data. See :py:meth:`Table.row`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        if columns is not None and not isinstance(columns, (tuple, list)):
+            raise TypeError("'columns' must be a tuple or list")
+
+        def convert(rows):
+            if not rows:
+                return {}
+            return make_row(rows[0].columns, include_timestamp)
+
+        if timestamp is None:
+            return self._pipeline._add(
+                'getRowWithColumns', (self.name, row, columns, {}), convert)
+
+        if not isinstance(timestamp, Integral):
+            raise TypeError("'timestamp' must be an integer")
+        return self._pipeline._add(
+            'getRowWithColumnsTs', (self.name, row, columns, timestamp, {}),
+            convert)
+
+    def rows(self, rows, columns=None, timestamp=None,
+             include_timestamp=False):
+        """Queue retrieving multiple rows. See :py:meth:`Table.rows`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        if columns is not None and not isinstance(columns, (tuple, list)):
+            raise TypeError("'columns' must be a tuple or list")
+
+        def convert(results):
+            return [(r.row, make_row(r.columns, include_timestamp))
+                    for r in results]
+
+        if timestamp is None:
+            return self._pipeline._add(
+                'getRowsWithColumns', (self.name, rows, columns, {}),
+                convert)
+
+        if not isinstance(timestamp, Integral):
+            raise TypeError("'timestamp' must be an integer")
+
+        # See Table.rows()
+        if columns is None:
+            columns = self._table._column_family_names()
+
+        return self._pipeline._add(
+            'getRowsWithColumnsTs',
+            (self.name, rows, columns, timestamp, {}), convert)
+
+    def cells(self, row, column, versions=None, timestamp=None,
+              include_timestamp=False):
+        """Queue retrieving versions of a cell. See :py:meth:`Table.cells`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        if versions is None:
+            versions = (2 ** 31) - 1  # Thrift type is i32
+        elif not isinstance(versions, int):
+            raise TypeError("'versions' argument must be a number or None")
+        elif versions < 1:
+            raise ValueError(
+                "'versions' argument must be at least 1 (or None)")
+
+        def convert(cells):
+            return [
+                (c.value, c.timestamp) if include_timestamp else c.value
+                for c in cells
+            ]
+
+        if timestamp is None:
+            return self._pipeline._add(
+                'getVer', (self.name, row, column, versions, {}), convert)
+
+        if not isinstance(timestamp, Integral):
+            raise TypeError("'timestamp' must be an integer")
+        return self._pipeline._add(
+            'getVerTs', (self.name, row, column, timestamp, versions, {}),
+            convert)
+
+    def _add_batch(self, batch):
+        """Queue sending the mutations of a batch."""
+        bms = batch._batch_mutations()
+        if batch._timestamp is None:
+            return self._pipeline._add('mutateRows', (self.name, bms, {}))
+        return self._pipeline._add(
+            'mutateRowsTs', (self.name, bms, batch._timestamp, {}))
+
+    def put(self, row, data, timestamp=None, wal=True):
+        """Queue storing data in the table. See :py:meth:`Table.put`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        batch = self._table.batch(timestamp=timestamp, wal=wal)
+        batch._add_put(row, data, None)
+        return self._add_batch(batch)
+
+    def delete(self, row, columns=None, timestamp=None, wal=True):
+        """Queue deleting data from the table. See :py:meth:`Table.delete`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        if columns is None:
+            columns = self._table._column_family_names()
+
+        batch = self._table.batch(timestamp=timestamp, wal=wal)
+        batch._add_delete(row, columns, None)
+        return self._add_batch(batch)
+
+    def counter_get(self, row, column):
+        """Queue retrieving a counter. See :py:meth:`Table.counter_get`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        return self.counter_inc(row, column, value=0)
+
+    def counter_set(self, row, column, value=0):
+        """Queue setting a counter. See :py:meth:`Table.counter_set`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        return self.put(row, {column: pack_i64(value)})
+
+    def counter_inc(self, row, column, value=1):
+        """Queue incrementing a counter. See :py:meth:`Table.counter_inc`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        return self._pipeline._add(
+            'atomicIncrement', (self.name, row, column, value))
+
+    def counter_dec(self, row, column, value=1):
+        """Queue decrementing a counter. See :py:meth:`Table.counter_dec`.
+
+        :rtype: :py:class:`PipelineResult`
+        """
+        return self.counter_inc(row, column, -value)
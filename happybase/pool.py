@@ -4,23 +4,31 @@ HappyBase connection pool module.
 
 import contextlib
 import logging
+import os
+import random
 import socket
 import threading
+from operator import attrgetter
 
-from six.moves import queue, range
+from six.moves import range
 
 from thriftpy2.thrift import TException
+from thriftpy2.transport import TTransportException
 
-from .connection import Connection
+from .connection import (
+    Connection, DEFAULT_HOST, DEFAULT_PORT, STRING_OR_BINARY)
+from .regions import RegionCache
+from .util import (
+    AT_FORK_SUPPORTED, Histogram, ensure_bytes, monotonic,
+    register_after_fork, socket_is_alive)
 
 logger = logging.getLogger(__name__)
 
-#
-# TODO: maybe support multiple Thrift servers. What would a reasonable
-# distribution look like? Round-robin? Randomize the list upon
-# instantiation and then cycle through it? How to handle (temporary?)
-# connection errors?
-#
+STRATEGIES = ('round_robin', 'random', 'least_outstanding')
+
+# Seconds after which idle connections in excess of the minimum size of an
+# elastic pool are closed, if no `max_idle_time` is specified.
+DEFAULT_SHRINK_IDLE_TIME = 60.0
 
 
 class NoConnectionsAvailable(RuntimeError):
@@ -35,6 +43,87 @@ class NoConnectionsAvailable(RuntimeError):
     pass
 
 
+class PoolListener(object):
+    """
+    Receiver of connection pool events, for monitoring purposes.
+
+    Pass an instance of a subclass that overrides some of the methods
+    below as the `listener` argument to :py:class:`ConnectionPool`. The
+    methods are called in the thread that uses the pool, so they should
+    return quickly. By default, they do nothing.
+
+    .. versionadded:: 1.3.0
+    """
+    def checked_out(self, pool, connection, wait_time):
+        """Called when a connection was taken from the pool.
+
+        :param float wait_time: seconds waited for an idle connection
+        """
+
+    def checked_in(self, pool, connection, hold_time):
+        """Called when a connection was returned to the pool.
+
+        :param float hold_time: seconds the connection was held
+        """
+
+    def timed_out(self, pool, wait_time):
+        """Called when :py:exc:`NoConnectionsAvailable` is raised.
+
+        :param float wait_time: seconds waited for an idle connection
+        """
+
+    def connected(self, pool, connection, connect_time):
+        """Called when a pool connection was opened.
+
+        The `host` and `port` attributes of the connection tell which
+        Thrift server it was opened to.
+
+        :param float connect_time: seconds it took to connect
+        """
+
+    def connect_failed(self, pool, host, port, exc):
+        """Called when opening a pool connection failed.
+
+        :param str host: the host of the Thrift server
+        :param int port: the port of the Thrift server
+        :param exc: the exception raised
+        """
+
+    def replaced(self, pool, connection, reason):
+        """Called when an open pool connection is about to be reopened.
+
+        :param str reason: why the connection is replaced
+        """
+
+
+class _Server(object):
+    """Bookkeeping for a Thrift server used by a connection pool."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+        # Number of (successfully) opened pool connections to this
+        # server, and how many of those are currently in use.
+        self.open_connections = 0
+        self.outstanding = 0
+
+        # Consecutive connection failures, and until when this server
+        # is not used for new connections because of those.
+        self.failures = 0
+        self.down_until = None
+
+        # Set after a failure, so that the server gets its share of the
+        # connections back once it is reachable again.
+        self.recovering = False
+
+    def __repr__(self):
+        return '%s:%d' % (self.host, self.port)
+
+    def is_up(self, now):
+        return self.down_until is None or self.down_until <= now
+
+
 class ConnectionPool(object):
     """
     Thread-safe connection pool.
@@ -47,30 +136,224 @@ class ConnectionPool(object):
     the `autoconnect` argument, since maintaining connections is the
     task of the pool.
 
+    Instead of a fixed `size`, the `min_size` and `max_size` arguments
+    can be specified to create an elastic pool. Such a pool starts with
+    `min_size` connections, and adds connections when all of them are in
+    use, up to `max_size` connections. Idle connections in excess of
+    `min_size` are closed and removed from the pool after `max_idle_time`
+    seconds (or 60 seconds if not specified). Since the pool does not
+    use a background thread, this happens when a connection is taken
+    from or returned to the pool. If `warm_up` is true, the initial
+    connections are opened in parallel when the pool is created, instead
+    of when they are first used.
+
+    The pool can spread its connections over multiple Thrift servers.
+    To do so, pass a list of ``(host, port)`` tuples (or just host
+    names, which use the default port) as the `hosts` argument instead
+    of the `host` and `port` arguments. Each time a pool connection is
+    (re)opened, a server is picked using the specified `strategy`:
+
+    * ``'round_robin'`` cycles through the servers, starting at a random
+      one (this is the default)
+    * ``'random'`` picks a random server
+    * ``'least_outstanding'`` picks the server with the fewest
+      connections currently in use
+
+    If a server cannot be connected to, the next server is tried, and
+    the failing server is not used for new connections for `backoff`
+    seconds. This period doubles after each consecutive failure, up to
+    `max_backoff` seconds. Idle connections to a server that is marked
+    down are moved to other servers when they are taken from the pool.
+    Once a server is reachable again, idle connections are moved back to
+    it until the connections are spread evenly again. If all servers are
+    marked down, connecting is attempted anyway, so that the actual
+    connection error is raised.
+
+    Before a connection is handed out, the pool checks whether the
+    server closed it in the mean time (e.g. because the Thrift server
+    restarted), which only requires a system call. If so, the connection
+    is reopened, instead of letting the caller run into an error. The
+    same happens to connections that have been idle for more than
+    `max_idle_time` seconds, or that were opened more than
+    `max_lifetime` seconds ago. The latter makes sure that connections
+    are spread over the servers again after network changes, and limits
+    the impact of server-side resource leaks. If `probe_idle_time` is
+    specified, connections that have been idle for more than that many
+    seconds are also probed by making a cheap Thrift call (retrieving
+    the table names), which detects connections that are broken without
+    the server having closed them, at the cost of a round-trip.
+
+    The connections in the pool share a :py:class:`RegionCache`, which is
+    available as the `region_cache` attribute of the pool.
+
+    The pool keeps statistics, such as how long callers waited for a
+    connection and how long they held it, which can be retrieved using
+    :py:meth:`stats`. To act on individual events, pass a
+    :py:class:`PoolListener` as the `listener` argument.
+
+    A pool can be created before forking worker processes, e.g. in
+    a pre-forking server or when using :py:mod:`multiprocessing`. Each
+    child process then gets its own connections, which are opened when
+    first used, while the connections of the parent process stay intact.
+    The statistics of a child process start at zero.
+
     :param int size: the maximum number of concurrently open connections
+    :param int min_size: the minimum number of connections (elastic pools)
+    :param int max_size: the maximum number of connections (elastic pools)
+    :param bool warm_up: whether to open the initial connections right away
+    :param listener: receiver of pool events (optional)
+    :type listener: :py:class:`PoolListener`
+    :param list hosts: Thrift servers to connect to (optional)
+    :param str strategy: how to spread connections over the servers
+    :param float backoff: seconds a failing server is not used for
+    :param float max_backoff: maximum seconds a server is not used for
+    :param float max_idle_time: maximum seconds a connection can be idle
+                                (optional)
+    :param float max_lifetime: maximum seconds a connection is used for
+                               (optional)
+    :param float probe_idle_time: seconds of idleness after which
+                                  a connection is probed (optional)
     :param kwargs: keyword arguments passed to
                    :py:class:`happybase.Connection`
-    """
-    def __init__(self, size, **kwargs):
-        if not isinstance(size, int):
-            raise TypeError("Pool 'size' arg must be an integer")
 
-        if not size > 0:
-            raise ValueError("Pool 'size' arg must be greater than zero")
+    .. versionadded:: 1.3.0
+       The `hosts`, `strategy`, `backoff`, `max_backoff`,
+       `max_idle_time`, `max_lifetime`, `probe_idle_time`, `min_size`,
+       `max_size`, `warm_up` and `listener` arguments. The `size`
+       argument is now optional.
+    """
+    def __init__(self, size=None, hosts=None, strategy='round_robin',
+                 backoff=1.0, max_backoff=60.0, max_idle_time=None,
+                 max_lifetime=None, probe_idle_time=None, min_size=None,
+                 max_size=None, warm_up=False, listener=None, **kwargs):
+        if size is not None:
+            if min_size is not None or max_size is not None:
+                raise TypeError(
+                    "'size' cannot be combined with 'min_size' or "
+                    "'max_size'")
+
+            if not isinstance(size, int):
+                raise TypeError("Pool 'size' arg must be an integer")
+
+            if not size > 0:
+                raise ValueError(
+                    "Pool 'size' arg must be greater than zero")
+
+            min_size = max_size = size
+
+        elif max_size is None:
+            raise TypeError("Either 'size' or 'max_size' must be specified")
+
+        else:
+            if min_size is None:
+                min_size = 1
+
+            if not (isinstance(min_size, int)
+                    and isinstance(max_size, int)):
+                raise TypeError(
+                    "'min_size' and 'max_size' must be integers")
+
+            if not 0 <= min_size <= max_size or not max_size > 0:
+                raise ValueError(
+                    "'max_size' must be > 0 and 'min_size' must be "
+                    "between 0 and 'max_size'")
+
+        if strategy not in STRATEGIES:
+            raise ValueError("'strategy' must be one of %s"
+                             % ", ".join(STRATEGIES))
+
+        if not 0 < backoff <= max_backoff:
+            raise ValueError(
+                "'backoff' must be > 0 and <= 'max_backoff'")
+
+        if listener is not None and not isinstance(listener, PoolListener):
+            raise TypeError("'listener' must be a PoolListener instance")
+
+        for name, value in [('max_idle_time', max_idle_time),
+                            ('max_lifetime', max_lifetime),
+                            ('probe_idle_time', probe_idle_time)]:
+            if value is not None and value <= 0:
+                raise ValueError("'%s' must be > 0" % name)
+
+        if hosts is None:
+            hosts = [(kwargs.pop('host', None), kwargs.pop('port', None))]
+        elif 'host' in kwargs or 'port' in kwargs:
+            raise TypeError(
+                "'hosts' cannot be combined with 'host' or 'port'")
+
+        self._servers = []
+        for item in hosts:
+            if isinstance(item, STRING_OR_BINARY):
+                host, port = item, None
+            else:
+                host, port = item
+            self._servers.append(
+                _Server(host or DEFAULT_HOST, port or DEFAULT_PORT))
+
+        if not self._servers:
+            raise ValueError("'hosts' must not be empty")
 
         logger.debug(
-            "Initializing connection pool with %d connections", size)
+            "Initializing connection pool with %d to %d connections to %s",
+            min_size, max_size, ", ".join(map(repr, self._servers)))
+
+        self._strategy = strategy
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._max_idle_time = max_idle_time
+        self._max_lifetime = max_lifetime
+        self._probe_idle_time = probe_idle_time
+        self._next_server = random.randrange(len(self._servers))
+        self._connection_servers = {}
+
+        # Connection -> (time opened, time last returned to the pool)
+        self._connection_times = {}
+
+        # Servers by host name, for routing requests to the Thrift server
+        # running on the region server hosting a row.
+        self._servers_by_host = {}
+        for server in self._servers:
+            self._servers_by_host.setdefault(
+                ensure_bytes(server.host).lower(), server)
+
+        self._listener = listener
+        self._stats_lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ['checkouts', 'timeouts', 'connects', 'connect_failures',
+             'replaced'], 0)
+        self._histograms = {
+            'wait_time': Histogram(),
+            'hold_time': Histogram(),
+            'connect_time': Histogram(),
+        }
 
         self._lock = threading.Lock()
-        self._queue = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+        self._min_size = min_size
+        self._max_size = max_size
+        self._shrink_idle_time = max_idle_time or DEFAULT_SHRINK_IDLE_TIME
         self._thread_connections = threading.local()
 
-        connection_kwargs = kwargs
-        connection_kwargs['autoconnect'] = False
+        # All connections, the idle ones (least recently returned first),
+        # and their number. These are protected by the condition.
+        self._connections = set()
+        self._idle = []
+        self._n_connections = 0
+        self._idle_available = threading.Condition(threading.Lock())
 
-        for i in range(size):
-            connection = Connection(**connection_kwargs)
-            self._queue.put(connection)
+        self._connection_kwargs = kwargs
+        self._connection_kwargs['autoconnect'] = False
+        self._connection_kwargs['host'] = self._servers[0].host
+        self._connection_kwargs['port'] = self._servers[0].port
+
+        self.region_cache = RegionCache()
+        for i in range(min_size):
+            self._idle.append(self._new_connection())
+
+        register_after_fork(self)
+
+        if warm_up:
+            self._warm_up()
 
         # The first connection is made immediately so that trivial
         # mistakes like unresolvable host names are raised immediately.
@@ -78,21 +361,477 @@ class ConnectionPool(object):
         with self.connection():
             pass
 
-    def _acquire_connection(self, timeout=None):
-        """Acquire a connection from the pool."""
+    def _count(self, name, duration_name=None, duration=None):
+        """Update the statistics."""
+        with self._stats_lock:
+            self._counters[name] += 1
+            if duration_name is not None:
+                self._histograms[duration_name].observe(duration)
+
+    def _replaced(self, connection, reason):
+        """Record that an open connection is replaced."""
+        self._count('replaced')
+        if self._listener is not None:
+            self._listener.replaced(self, connection, reason)
+
+    def stats(self):
+        """Return statistics about this pool.
+
+        This returns a dict with these items:
+
+        * ``size``, ``min_size`` and ``max_size``: the current, minimum
+          and maximum number of connections
+        * ``in_use`` and ``idle``: the number of connections that are
+          currently in use and idle
+        * ``checkouts``: the number of times a connection was taken from
+          the pool (not counting nested :py:meth:`connection` calls)
+        * ``timeouts``: the number of times
+          :py:exc:`NoConnectionsAvailable` was raised
+        * ``connects`` and ``connect_failures``: the number of
+          (un)successful attempts to open a connection
+        * ``replaced``: the number of open connections that were
+          reopened, because of an error, a failed check, or to move them
+          to another server
+        * ``wait_time``, ``hold_time`` and ``connect_time``: histograms
+          of the seconds spent waiting for a connection, holding a
+          connection, and opening a connection
+        * ``servers``: a dict with the number of ``open_connections``
+          and ``in_use`` connections for each Thrift server, and whether
+          it is ``up``
+
+        Each histogram is a dict with the ``count``, ``sum`` and ``max``
+        of the durations, and ``buckets``, a list of ``(upper_bound,
+        count)`` tuples with upper bounds ranging from half a millisecond
+        to infinity.
+
+        :return: statistics
+        :rtype: dict
+        """
+        with self._idle_available:
+            size = self._n_connections
+            idle = len(self._idle)
+
+        now = monotonic()
+        with self._lock:
+            servers = dict(
+                (repr(server), {
+                    'open_connections': server.open_connections,
+                    'in_use': server.outstanding,
+                    'up': server.is_up(now),
+                })
+                for server in self._servers)
+
+        with self._stats_lock:
+            stats = dict(self._counters)
+            for name, histogram in self._histograms.items():
+                stats[name] = histogram.snapshot()
+
+        stats.update(
+            size=size, min_size=self._min_size, max_size=self._max_size,
+            in_use=size - idle, idle=idle, servers=servers)
+        return stats
+
+    def _new_connection(self):
+        """Create a (not yet opened) pool connection.
+
+        This requires the idle lock, unless the pool is being initialized.
+        """
+        connection = Connection(**self._connection_kwargs)
+        connection.region_cache = self.region_cache
+
+        # Reopened lazily by the pool after a fork.
+        connection._reopen_after_fork = False
+
+        self._connections.add(connection)
+        self._n_connections += 1
+        return connection
+
+    def _after_fork(self):
+        """Reset the state inherited from the parent process.
+
+        Only the thread that forked exists in the child process, so locks
+        held by other threads are replaced, and the connections they were
+        using are put back into the pool.
+        """
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+
+        self._pid = pid
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._idle_available = threading.Condition(threading.Lock())
+        self.region_cache._lock = threading.Lock()
+
+        # The connection of the thread that forked (if any) is kept,
+        # since it is still in use.
+        current = getattr(self._thread_connections, 'current', None)
+        server = self._connection_servers.get(current)
+        times = self._connection_times.get(current)
+        self._idle = [
+            connection for connection in self._connections
+            if connection is not current]
+        self._connection_servers = {}
+        self._connection_times = {}
+        for s in self._servers:
+            s.open_connections = s.outstanding = 0
+
+        for connection in self._connections:
+            connection._after_fork()
+
+        if server is not None:
+            self._connection_servers[current] = server
+            self._connection_times[current] = times
+            server.open_connections = server.outstanding = 1
+            try:
+                current.open()
+            except (TTransportException, socket.error) as exc:
+                # Replaced when returned to the pool.
+                logger.warning(
+                    "Cannot reopen pool connection after fork: %s", exc)
+
+        for name in self._counters:
+            self._counters[name] = 0
+        for name in self._histograms:
+            self._histograms[name] = Histogram()
+
+    def _warm_up(self):
+        """Open the initial connections in parallel."""
+        def run(connection):
+            try:
+                self._open_connection(connection)
+            except (TTransportException, socket.error) as exc:
+                # Retried when the connection is used.
+                logger.warning("Cannot open pool connection: %s", exc)
+
+        threads = [
+            threading.Thread(target=run, args=(connection,))
+            for connection in self._idle]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _shrink(self):
+        """Remove surplus connections that were idle for too long.
+
+        This requires the idle lock. The removed connections are returned,
+        and must be closed by the caller, after releasing the lock.
+        """
+        removed = []
+        now = monotonic()
+        with self._lock:
+            while self._idle and self._n_connections > self._min_size:
+                connection = self._idle[0]
+                times = self._connection_times.get(connection)
+                if (times is not None
+                        and now - times[1] <= self._shrink_idle_time):
+                    break
+
+                del self._idle[0]
+                self._connections.discard(connection)
+                self._n_connections -= 1
+                self._detach_connection(connection)
+                removed.append(connection)
+
+        return removed
+
+    def _close_removed(self, removed):
+        """Close connections removed from the pool."""
+        if removed:
+            logger.debug(
+                "Removing %d idle connections from the pool", len(removed))
+        for connection in removed:
+            connection.close()
+
+    def _acquire_connection(self, timeout=None, server=None):
+        """Acquire a connection from the pool.
+
+        If `server` is specified, an idle connection to that server is
+        preferred over the most recently used one, followed by one that is
+        not opened to any server yet. If no connection is idle, a new one
+        is added, unless the pool is at its maximum size.
+        """
+        removed = []
         try:
-            return self._queue.get(True, timeout)
-        except queue.Empty:
-            raise NoConnectionsAvailable(
-                "No connection available from pool within specified "
-                "timeout")
+            with self._idle_available:
+                removed = self._shrink()
+                if timeout is not None:
+                    deadline = monotonic() + timeout
+                while not self._idle:
+                    if self._n_connections < self._max_size:
+                        return self._new_connection()
+
+                    if timeout is None:
+                        self._idle_available.wait()
+                        continue
+
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        raise NoConnectionsAvailable(
+                            "No connection available from pool within "
+                            "specified timeout")
+                    self._idle_available.wait(remaining)
+
+                if server is not None:
+                    with self._lock:
+                        servers = [
+                            self._connection_servers.get(connection)
+                            for connection in self._idle]
+                    for wanted in (server, None):
+                        for i in range(len(servers) - 1, -1, -1):
+                            if servers[i] is wanted:
+                                return self._idle.pop(i)
+
+                return self._idle.pop()
+        finally:
+            self._close_removed(removed)
 
     def _return_connection(self, connection):
         """Return a connection to the pool."""
-        self._queue.put(connection)
+        with self._lock:
+            times = self._connection_times.get(connection)
+            if times is not None:
+                self._connection_times[connection] = (times[0], monotonic())
+
+        with self._idle_available:
+            self._idle.append(connection)
+            self._idle_available.notify()
+            removed = self._shrink()
+        self._close_removed(removed)
+
+    def _choose_server(self, exclude):
+        """Pick a server for a new connection. Requires the lock."""
+        now = monotonic()
+        candidates = [
+            server for server in self._servers if server not in exclude]
+        if not candidates:
+            return None
+
+        up = [server for server in candidates if server.is_up(now)]
+        if not up:
+            # Try the server that would be up again first.
+            return min(candidates, key=attrgetter('down_until'))
+
+        recovering = [server for server in up if server.recovering]
+        if recovering:
+            return min(recovering, key=attrgetter('open_connections'))
+
+        if self._strategy == 'random':
+            return random.choice(up)
+
+        if self._strategy == 'least_outstanding':
+            return min(up, key=attrgetter('outstanding', 'open_connections'))
+
+        while True:
+            server = self._servers[self._next_server]
+            self._next_server = (self._next_server + 1) % len(self._servers)
+            if server in up:
+                return server
+
+    def _reserve_server(self, exclude, preferred=None):
+        """Pick a server and count a connection to it. Requires the lock.
+
+        The `preferred` server is picked if it is up. The connection is
+        counted right away (and uncounted if connecting fails), so that
+        concurrent callers take it into account.
+        """
+        if (preferred is not None and preferred not in exclude
+                and preferred.is_up(monotonic())):
+            server = preferred
+        else:
+            server = self._choose_server(exclude)
+        server.open_connections += 1
+        return server
+
+    def _should_move(self, server):
+        """Tell whether a connection should move elsewhere. Requires the lock.
+
+        This is the case if its server is marked down while another one
+        is up, or if a recovering server has (at least two) fewer
+        connections.
+        """
+        now = monotonic()
+        if not server.is_up(now):
+            return any(other.is_up(now) for other in self._servers)
+
+        return any(
+            other.recovering and other.is_up(now)
+            and other.open_connections + 1 < server.open_connections
+            for other in self._servers)
+
+    def _mark_down(self, server):
+        """Stop using a server for new connections for a while."""
+        with self._lock:
+            now = monotonic()
+            if not server.is_up(now):
+                # Another connection attempt already failed.
+                return
+
+            server.failures += 1
+            server.recovering = True
+            delay = min(
+                self._max_backoff,
+                self._backoff * 2 ** (server.failures - 1))
+            server.down_until = now + delay
+
+        logger.warning(
+            "Marking Thrift server %r down for %.1f seconds", server, delay)
+
+    def _detach_connection(self, connection):
+        """Forget which server a connection is opened to. Requires the lock."""
+        self._connection_times.pop(connection, None)
+        server = self._connection_servers.pop(connection, None)
+        if server is not None:
+            server.open_connections -= 1
+
+    def _has_idle_peer(self, connection):
+        """Tell whether another connection to the same server is idle."""
+        with self._idle_available:
+            with self._lock:
+                server = self._connection_servers.get(connection)
+                return server is not None and any(
+                    self._connection_servers.get(other) is server
+                    for other in self._idle)
+
+    def _open_connection(self, connection, rebalance=False, preferred=None):
+        """Open a pool connection, picking a server if needed.
+
+        If `rebalance` is true, an open connection may be moved to another
+        server (see :py:meth:`_should_move`), or to the `preferred` server
+        if another connection to its current server is idle, so that the
+        current server is not left without one. Returns the server the
+        connection is opened to.
+        """
+        tried = []
+        moved = False
+        movable = (
+            rebalance and preferred is not None
+            and self._has_idle_peer(connection))
+        with self._lock:
+            server = self._connection_servers.get(connection)
+            if server is not None and connection.transport.is_open():
+                if not rebalance or preferred is server:
+                    return server
+
+                if not movable or not preferred.is_up(monotonic()):
+                    if not self._should_move(server):
+                        return server
+
+                logger.info(
+                    "Moving pool connection away from Thrift server %r",
+                    server)
+                moved = True
+
+            self._detach_connection(connection)
+            server = self._reserve_server(tried, preferred)
+
+        if moved:
+            self._replaced(connection, "moved")
+        connection.close()
+
+        while True:
+            tried.append(server)
+            connection.host = server.host
+            connection.port = server.port
+            connection._refresh_thrift_client()
+            started = monotonic()
+            try:
+                connection.open()
+            except (TTransportException, socket.error) as exc:
+                logger.warning(
+                    "Cannot connect to Thrift server %r: %s", server, exc)
+                self._count('connect_failures')
+                if self._listener is not None:
+                    self._listener.connect_failed(
+                        self, server.host, server.port, exc)
+                with self._lock:
+                    server.open_connections -= 1
+                self._mark_down(server)
+                if len(tried) == len(self._servers):
+                    raise
+
+                with self._lock:
+                    server = self._reserve_server(tried)
+                continue
+
+            with self._lock:
+                self._connection_servers[connection] = server
+                now = monotonic()
+                self._connection_times[connection] = (now, now)
+                server.failures = 0
+                server.down_until = None
+
+                # A recovering server is treated as such until it has
+                # its share of the connections.
+                total = sum(s.open_connections for s in self._servers)
+                n_up = sum(1 for s in self._servers if s.is_up(now))
+                if server.open_connections >= total // n_up:
+                    server.recovering = False
+
+            connect_time = monotonic() - started
+            self._count('connects', 'connect_time', connect_time)
+            if self._listener is not None:
+                self._listener.connected(self, connection, connect_time)
+            return server
+
+    def _check_connection(self, connection):
+        """Close an idle connection if it should not be used anymore.
+
+        The connection is then reopened by :py:meth:`_open_connection`.
+        """
+        with self._lock:
+            times = self._connection_times.get(connection)
+            server = self._connection_servers.get(connection)
+        if times is None or not connection.transport.is_open():
+            return
+
+        now = monotonic()
+        opened, returned = times
+        if (self._max_lifetime is not None
+                and now - opened > self._max_lifetime):
+            reason = "maximum lifetime reached"
+        elif (self._max_idle_time is not None
+                and now - returned > self._max_idle_time):
+            reason = "maximum idle time reached"
+        elif not socket_is_alive(connection._socket.sock):
+            reason = "connection broken"
+        elif (self._probe_idle_time is not None
+                and now - returned > self._probe_idle_time
+                and not self._probe_connection(connection)):
+            reason = "liveness probe failed"
+        else:
+            return
+
+        logger.info(
+            "Replacing pool connection to Thrift server %r (%s)",
+            server, reason)
+        self._replaced(connection, reason)
+        with self._lock:
+            self._detach_connection(connection)
+        connection.close()
+
+    def _probe_connection(self, connection):
+        """Tell whether a connection works by making a cheap Thrift call."""
+        try:
+            # This bypasses the retry policy (if any) of the connection.
+            connection._client.getTableNames()
+        except (TException, socket.error):
+            return False
+        return True
+
+    def _region_server(self, table, row):
+        """Find the server running on the region server hosting a row.
+
+        Returns `None` if the region server does not run a Thrift server
+        used by this pool.
+        """
+        region = self.region_cache.region(table, row)
+        return self._servers_by_host.get(region['server_name'].lower())
 
     @contextlib.contextmanager
-    def connection(self, timeout=None):
+    def connection(self, timeout=None, table=None, row=None,
+                   use_prefix=True):
         """
         Obtain a connection from the pool.
 
@@ -107,13 +846,44 @@ class ConnectionPool(object):
         :py:exc:`NoConnectionsAvailable` is raised. If omitted, this
         method waits forever for a connection to become available.
 
+        If the pool uses multiple Thrift servers, the `table` and `row`
+        arguments can be used to route requests for a row to the Thrift
+        server running on the region server that hosts the row, which
+        saves a network hop between the Thrift server and the region
+        server. This requires that each region server runs a Thrift server
+        that is specified (using the same host name that HBase uses for
+        the region server) in the `hosts` argument to the pool. If so, an
+        idle connection to that server is preferred. Otherwise a connection
+        is moved to that server, but only if another connection to its
+        current server is idle; if not, it is used as is. For scans, pass
+        the row key the scan starts at. The regions are looked up in the
+        :py:class:`RegionCache` of the pool, and are looked up again after
+        an error occurs while using a connection obtained this way. The
+        `use_prefix` argument specifies whether the
+        table prefix is prepended to the `table` name, just like for
+        :py:meth:`Connection.table`. Routing does not apply to nested
+        requests (see below), and without `hosts` these arguments have no
+        effect.
+
         :param int timeout: number of seconds to wait (optional)
+        :param str table: table name, for routing requests (optional)
+        :param str row: row key, for routing requests (optional)
+        :param bool use_prefix: whether to use the table prefix (if any)
         :return: active connection from the pool
         :rtype: :py:class:`happybase.Connection`
+
+        .. versionadded:: 1.3.0
+           The `table`, `row` and `use_prefix` arguments.
         """
+        if (table is None) != (row is None):
+            raise TypeError("'table' and 'row' must be specified together")
+
+        if not AT_FORK_SUPPORTED and self._pid != os.getpid():
+            self._after_fork()
 
         connection = getattr(self._thread_connections, 'current', None)
 
+        routed_table = preferred = None
         return_after_use = False
         if connection is None:
             # This is the outermost connection requests for this thread.
@@ -126,14 +896,45 @@ class ConnectionPool(object):
             # http://emptysquare.net/blog/another-thing-about-pythons-
             # threadlocals/
             return_after_use = True
-            connection = self._acquire_connection(timeout)
+            if table is not None and len(self._servers) > 1:
+                # Looking up the regions requires a connection if they
+                # are not cached (yet).
+                with self.connection() as connection:
+                    routed_table = connection.table(table, use_prefix)
+                    preferred = self._region_server(
+                        routed_table, ensure_bytes(row))
+
+            started = monotonic()
+            try:
+                connection = self._acquire_connection(timeout, preferred)
+            except NoConnectionsAvailable:
+                wait_time = monotonic() - started
+                self._count('timeouts')
+                if self._listener is not None:
+                    self._listener.timed_out(self, wait_time)
+                raise
+
+            wait_time = monotonic() - started
             with self._lock:
                 self._thread_connections.current = connection
 
+        server = checked_out = None
         try:
+            if return_after_use:
+                self._check_connection(connection)
+
             # Open connection, because connections are opened lazily.
-            # This is a no-op for connections that are already open.
-            connection.open()
+            # This is a no-op for connections that are already open,
+            # unless the connection should move to another server.
+            server = self._open_connection(
+                connection, rebalance=return_after_use, preferred=preferred)
+            if return_after_use:
+                with self._lock:
+                    server.outstanding += 1
+                self._count('checkouts', 'wait_time', wait_time)
+                if self._listener is not None:
+                    self._listener.checked_out(self, connection, wait_time)
+                checked_out = monotonic()
 
             # Return value from the context manager's __enter__()
             yield connection
@@ -143,8 +944,16 @@ class ConnectionPool(object):
             # occurred in the Thrift layer, since we don't know whether
             # the connection is still usable.
             logger.info("Replacing tainted pool connection")
+            if server is not None:
+                self._replaced(connection, "error")
+            if routed_table is not None:
+                # Regions may have moved to another region server.
+                self.region_cache.invalidate(routed_table)
+            with self._lock:
+                self._detach_connection(connection)
             connection._refresh_thrift_client()
-            connection.open()
+            if server is not None:
+                self._open_connection(connection)
 
             # Reraise to caller; see contextlib.contextmanager() docs
             raise
@@ -154,5 +963,15 @@ class ConnectionPool(object):
             # block ends. Afterwards the thread no longer owns the
             # connection.
             if return_after_use:
+                if server is not None:
+                    with self._lock:
+                        server.outstanding -= 1
                 del self._thread_connections.current
                 self._return_connection(connection)
+
+                if checked_out is not None:
+                    hold_time = monotonic() - checked_out
+                    with self._stats_lock:
+                        self._histograms['hold_time'].observe(hold_time)
+                    if self._listener is not None:
+                        self._listener.checked_in(self, connection, hold_time)
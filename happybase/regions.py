@@ -0,0 +1,118 @@
+"""
+HappyBase region cache module.
+"""
+
+import logging
+import threading
+from bisect import bisect_right
+from operator import itemgetter
+
+from .util import monotonic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGION_CACHE_TTL = 60.0
+
+
+class RegionCache(object):
+    """
+    Cache of the regions of tables.
+
+    Retrieving the regions of a table using :py:meth:`Table.regions`
+    requires a round-trip to the Thrift server, and the server has to look
+    them up in the ``hbase:meta`` table. This class keeps the regions of
+    each table, sorted by start key, so that finding the region for a row
+    key does not require any round-trips, and takes logarithmic time.
+
+    Each :py:class:`Connection` has a region cache, available as its
+    `region_cache` attribute. The connections in a
+    :py:class:`ConnectionPool` share the cache of the pool.
+
+    Since regions split and move between region servers, the cached
+    regions of a table are retrieved again after `ttl` seconds. If `ttl`
+    is `None`, they are kept until :py:meth:`invalidate` is called, which
+    happens automatically when a scanner fails (which may be caused by a
+    region that moved or split).
+
+    .. versionadded:: 1.3.0
+
+    :param float ttl: number of seconds to cache regions (optional)
+    """
+    def __init__(self, ttl=DEFAULT_REGION_CACHE_TTL):
+        if ttl is not None and ttl <= 0:
+            raise ValueError("'ttl' must be > 0")
+
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        # Table name -> (expiry time, start keys, regions)
+        self._tables = {}
+
+    def _lookup(self, table):
+        """Return the start keys and regions for a table."""
+        now = monotonic()
+        with self._lock:
+            entry = self._tables.get(table.name)
+        if entry is not None and (entry[0] is None or entry[0] > now):
+            return entry[1], entry[2]
+
+        logger.debug("Retrieving regions for table '%s'", table.name)
+        regions = table.regions()
+        regions.sort(key=itemgetter('start_key'))
+        start_keys = [region['start_key'] for region in regions]
+        expiry = None if self.ttl is None else now + self.ttl
+        with self._lock:
+            self._tables[table.name] = (expiry, start_keys, regions)
+        return start_keys, regions
+
+    def regions(self, table):
+        """Return the regions of a table.
+
+        This works like :py:meth:`Table.regions`, but the result is
+        retrieved from the cache if possible, and is sorted by start key.
+        The returned list must not be modified.
+
+        :param table: the table
+        :type table: :py:class:`Table`
+        :return: regions of the table
+        :rtype: list of dicts
+        """
+        return self._lookup(table)[1]
+
+    def region(self, table, row):
+        """Return the region of a table that holds a row key.
+
+        The region is returned as a dict like :py:meth:`Table.regions`
+        returns. If the cached regions do not cover the row key, which
+        means they are out of date, the regions are retrieved again.
+
+        :param table: the table
+        :type table: :py:class:`Table`
+        :param str row: the row key
+        :return: the region holding the row key
+        :rtype: dict
+        """
+        for attempt in range(2):
+            start_keys, regions = self._lookup(table)
+            i = bisect_right(start_keys, row) - 1
+            if i >= 0:
+                region = regions[i]
+                if not region['end_key'] or row < region['end_key']:
+                    return region
+
+            self.invalidate(table)
+
+        raise ValueError(
+            "No region of table '%s' holds row key %r" % (table.name, row))
+
+    def invalidate(self, table=None):
+        """Drop the cached regions of a table, or of all tables.
+
+        :param table: the table (optional)
+        :type table: :py:class:`Table`
+        """
+        with self._lock:
+            if table is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(table.name, None)
@@ -0,0 +1,188 @@
+"""
+HappyBase retry module.
+"""
+
+import logging
+import random
+import socket
+import threading
+import time
+
+from thriftpy2.transport import TTransportException
+
+from .util import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Only errors in the Thrift transport layer are retried. Errors raised by
+# HBase itself (e.g. IOError) are passed on; the Thrift server already
+# retries its requests to the region servers.
+RETRYABLE_ERRORS = (TTransportException, socket.error)
+
+# Thrift calls that change data in a way that is not safe to repeat. If the
+# connection breaks after the request was sent, it is unknown whether the
+# call took effect.
+NON_IDEMPOTENT_CALLS = frozenset([
+    'append',
+    'atomicIncrement',
+    'checkAndPut',
+    'createTable',
+    'deleteTable',
+    'increment',
+    'incrementRows',
+])
+
+# Scanners only exist on the Thrift server that opened them, so calls
+# using a scanner id cannot be retried using a new connection. Failed
+# scans can be reopened using the `retries` argument to Table.scan().
+SCANNER_CALLS = frozenset([
+    'scannerClose',
+    'scannerGet',
+    'scannerGetList',
+])
+
+
+class RetryPolicy(object):
+    """
+    Policy for retrying failed Thrift calls.
+
+    A retry policy can be passed to :py:class:`Connection` (or to
+    :py:class:`ConnectionPool`, which passes it on to its connections)
+    using the `retry_policy` argument. When a Thrift call fails because
+    of a transport error, such as a broken connection or a restarted
+    Thrift server, the connection is reopened and the call is tried
+    again. Errors raised by HBase itself are not retried.
+
+    The `max_retries` argument specifies how many times a call is
+    retried. Before each retry, a random time between zero and the
+    backoff time is waited ("full jitter"), so that many clients do not
+    retry at the same time. The backoff time starts at `backoff` seconds
+    and doubles after each retry, up to `max_backoff` seconds. If
+    `deadline` is specified, a call is not retried if it would not start
+    within `deadline` seconds after the first attempt started.
+
+    Calls that are not idempotent, i.e. that cannot safely be repeated
+    because the first attempt may have taken effect before the
+    connection broke, are not retried unless `retry_non_idempotent` is
+    `True`. These are :py:meth:`Table.counter_inc` (and related methods),
+    and creating and deleting tables. Calls that use a scanner are never
+    retried, since scanners only exist on the server that opened them;
+    use the `retries` argument to :py:meth:`Table.scan` instead.
+
+    A policy keeps counters that can be exported for monitoring, see
+    :py:meth:`stats`. A policy can be shared by many connections.
+
+    .. versionadded:: 1.3.0
+
+    :param int max_retries: maximum number of retries per call
+    :param float backoff: initial backoff time in seconds
+    :param float max_backoff: maximum backoff time in seconds
+    :param float deadline: maximum total time per call in seconds
+                           (optional)
+    :param bool retry_non_idempotent: whether to retry calls that are not
+                                      idempotent
+    """
+    def __init__(self, max_retries=3, backoff=.1, max_backoff=5.0,
+                 deadline=None, retry_non_idempotent=False):
+        if max_retries < 0:
+            raise ValueError("'max_retries' must be >= 0")
+
+        if not 0 < backoff <= max_backoff:
+            raise ValueError("'backoff' must be > 0 and <= 'max_backoff'")
+
+        if deadline is not None and deadline <= 0:
+            raise ValueError("'deadline' must be > 0")
+
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.retry_non_idempotent = retry_non_idempotent
+
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ['calls', 'failures', 'retries', 'recovered', 'exhausted',
+             'deadline_exceeded', 'not_retried'], 0)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        """Return the counters of this policy.
+
+        This returns a dict with these counters:
+
+        * ``calls``: the number of calls made using this policy
+        * ``failures``: the number of failed attempts
+        * ``retries``: the number of retries
+        * ``recovered``: the number of calls that succeeded after retrying
+        * ``exhausted``: the number of calls that failed after
+          `max_retries` retries
+        * ``deadline_exceeded``: the number of calls that were not
+          retried (again) because of the `deadline`
+        * ``not_retried``: the number of failed calls that were not
+          retried because they are not idempotent, or use a scanner
+
+        :return: counters
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def is_retryable(self, api):
+        """Tell whether a Thrift call may be retried.
+
+        :param str api: name of the Thrift function, e.g. ``getRow``
+        :rtype: bool
+        """
+        if api in SCANNER_CALLS:
+            return False
+        if api in NON_IDEMPOTENT_CALLS:
+            return self.retry_non_idempotent
+        return True
+
+    def call(self, api, func, reconnect):
+        """Call a function, retrying it according to this policy.
+
+        This calls `func` (without arguments), which makes the Thrift call
+        named `api`. If it raises a transport error, and the call may be
+        retried, `reconnect` is called before retrying. Errors raised by
+        `reconnect` count as failed attempts as well.
+        """
+        self._count('calls')
+        started = monotonic()
+        n_retries = 0
+        while True:
+            try:
+                if n_retries:
+                    reconnect()
+                result = func()
+            except RETRYABLE_ERRORS as exc:
+                self._count('failures')
+                if not self.is_retryable(api):
+                    self._count('not_retried')
+                    raise
+
+                if n_retries == self.max_retries:
+                    self._count('exhausted')
+                    raise
+
+                delay = random.uniform(0, min(
+                    self.max_backoff, self.backoff * 2 ** n_retries))
+                if (self.deadline is not None
+                        and monotonic() + delay - started > self.deadline):
+                    self._count('deadline_exceeded')
+                    raise
+
+                n_retries += 1
+                self._count('retries')
+                logger.warning(
+                    "Thrift call %s failed (%r); retrying in %.2f seconds "
+                    "(retry %d of %d)",
+                    api, exc, delay, n_retries, self.max_retries)
+                time.sleep(delay)
+            else:
+                if n_retries:
+                    self._count('recovered')
+                return result
@@ -4,19 +4,67 @@ HappyBase table module.
 
 import logging
 from numbers import Integral
+from operator import attrgetter, itemgetter
+import socket
 from struct import Struct
+import sys
+import threading
+import time
 
+import six
 from six import iteritems
+from six.moves import queue, range
 
-from Hbase_thrift import TScan
+from thriftpy2.transport import TTransportException
 
-from .util import thrift_type_to_dict, bytes_increment, OrderedDict
+try:
+    import numpy
+except ImportError:
+    # NumPy is only required for Table.scan_columnar()
+    numpy = None
+
+from Hbase_thrift import TScan, IOError as HBaseIOError
+
+from .util import (
+    thrift_type_to_dict, bytes_increment, OrderedDict, split_key_range,
+    queue_put, prefetch_iter, monotonic, BatchSizer, ensure_bytes)
 from .batch import Batch
+from .decode import can_decode, request_rows
 
 logger = logging.getLogger(__name__)
 
 pack_i64 = Struct('>q').pack
 
+# Settings for scans using batch_size='auto'
+AUTO_BATCH_SIZE_INITIAL = 100
+AUTO_BATCH_SIZE_MIN = 1
+AUTO_BATCH_SIZE_MAX = 10000
+AUTO_BATCH_TARGET_BYTES = 1024 * 1024
+AUTO_BATCH_MAX_LATENCY = 1.0
+
+# Errors after which a scan can be resumed, and the delay (in seconds)
+# before reopening the scanner, which doubles after each retry. HBase
+# errors are only retried if they are caused by the scanner or the region
+# (see TRANSIENT_SCAN_ERRORS); other errors, e.g. because of a bad filter
+# or a missing column family, will occur again.
+RETRYABLE_SCAN_ERRORS = (HBaseIOError, TTransportException, socket.error)
+SCAN_RETRY_DELAY = .1
+SCAN_RETRY_MAX_DELAY = 5.0
+
+# Names of HBase exceptions (as included in the messages of the IOErrors
+# raised by the Thrift server) after which a scan can be resumed
+TRANSIENT_SCAN_ERRORS = (
+    'UnknownScannerException',
+    'ScannerTimeoutException',
+    'LeaseException',
+    'OutOfOrderScannerNextException',
+    'NotServingRegionException',
+    'RegionMovedException',
+    'RegionOpeningException',
+    'RegionServerStoppedException',
+    'RegionTooBusyException',
+)
+
 
 def make_row(cell_map, include_timestamp):
     """Make a row dict for a cell mapping like ttypes.TRowResult.columns."""
@@ -38,6 +86,291 @@ def make_ordered_row(sorted_columns, include_timestamp):
     return od
 
 
+def make_values(cell_map, columns):
+    """Make a list with the value (or None) of each of the `columns`."""
+    cells = [cell_map.get(column) for column in columns]
+    return [None if cell is None else cell.value for cell in cells]
+
+
+def make_columnar(items, columns, dtypes):
+    """Make NumPy arrays for the columns of a list of rows.
+
+    The rows are `(row_key, values)` tuples, where `values` holds the
+    value (or None) of each of the `columns`.
+    """
+    n = len(items)
+    row_keys = numpy.empty(n, dtype=object)
+    row_keys[:] = [row_key for row_key, values in items]
+
+    # Transpose the rows into a sequence of cells for each column.
+    if n:
+        column_cells = zip(*[values for row_key, values in items])
+    else:
+        column_cells = [()] * len(columns)
+
+    arrays = {}
+    for column, cells in zip(columns, column_cells):
+        mask = numpy.fromiter(
+            (cell is None for cell in cells), dtype=bool, count=n)
+
+        dtype = dtypes.get(column)
+        if dtype is None:
+            values = numpy.empty(n, dtype=object)
+            values[:] = cells
+        else:
+            missing = b'\x00' * dtype.itemsize
+            raw_values = [missing if cell is None else cell
+                          for cell in cells]
+            if raw_values and set(map(len, raw_values)) != {dtype.itemsize}:
+                raise ValueError(
+                    "values in column %r do not match dtype %s"
+                    % (column, dtype))
+            values = numpy.frombuffer(
+                bytearray().join(raw_values), dtype=dtype)
+
+        arrays[column] = numpy.ma.masked_array(values, mask=mask)
+
+    return row_keys, arrays
+
+
+def _columnar_chunks(batches, columns, dtypes, chunk_size):
+    """Generate column arrays in chunks of rows (internal use)"""
+    pending = []
+    try:
+        for items in batches:
+            pending.extend(items)
+            while len(pending) >= chunk_size:
+                yield make_columnar(pending[:chunk_size], columns, dtypes)
+                del pending[:chunk_size]
+
+        if pending:
+            yield make_columnar(pending, columns, dtypes)
+    finally:
+        batches.close()
+
+
+def result_size(item):
+    """Estimate the size in bytes of a ttypes.TRowResult."""
+    size = len(item.row)
+    if item.columns:
+        for name, cell in iteritems(item.columns):
+            size += len(name) + len(cell.value) + 8
+    else:
+        for column in item.sortedColumns or ():
+            size += len(column.columnName) + len(column.cell.value) + 8
+    return size
+
+
+def row_size(row):
+    """Estimate the size in bytes of a `(row_key, row_data)` tuple."""
+    row_key, data = row
+    size = len(row_key)
+    for name, value in iteritems(data):
+        if isinstance(value, tuple):
+            value = value[0]  # include_timestamp
+        size += len(name) + len(value) + 8
+    return size
+
+
+def values_size(row):
+    """Estimate the size in bytes of a `(row_key, values)` tuple."""
+    row_key, values = row
+    return len(row_key) + sum(
+        len(value) + 8 for value in values if value is not None)
+
+
+def _request_rows(client, api, args, include_timestamp, sorted_columns,
+                  columnar=None):
+    """Call a Thrift function returning TRowResults (internal use).
+
+    This returns a list of `(row_key, row_data)` tuples, or of
+    `(row_key, values)` tuples if a list of column names is passed as
+    `columnar` (see :py:func:`make_values`). If possible, the results are
+    decoded into these directly, without building Thrift structs first
+    (see :py:mod:`happybase.decode`).
+    """
+    if can_decode(client):
+        return request_rows(
+            client, api, args, include_timestamp, sorted_columns, columnar)
+
+    items = getattr(client, api)(**args)
+    if columnar is not None:
+        return [(item.row, make_values(item.columns, columnar))
+                for item in items]
+    if sorted_columns:
+        return [(item.row, make_ordered_row(item.sortedColumns,
+                                            include_timestamp))
+                for item in items]
+    return [(item.row, make_row(item.columns, include_timestamp))
+            for item in items]
+
+
+def _scanner_batches(client, scan_id, batch_size, limit, sizer=None,
+                     raw=True, include_timestamp=False,
+                     sorted_columns=False, columnar=None):
+    """Retrieve lists of results from an open scanner (internal use)"""
+    n_fetched = 0
+    while limit is None or n_fetched < limit:
+        if sizer is not None:
+            batch_size = sizer.size
+
+        if limit is None:
+            how_many = batch_size
+        else:
+            how_many = min(batch_size, limit - n_fetched)
+
+        started = monotonic()
+        if raw:
+            items = client.scannerGetList(scan_id, how_many)
+        else:
+            items = _request_rows(
+                client, 'scannerGetList', dict(id=scan_id, nbRows=how_many),
+                include_timestamp, sorted_columns, columnar)
+        if not items:
+            return  # scan has finished
+
+        if sizer is not None:
+            if raw:
+                size = result_size
+            elif columnar is not None:
+                size = values_size
+            else:
+                size = row_size
+            sizer.update([size(item) for item in items],
+                         monotonic() - started)
+
+        n_fetched += len(items)
+        yield items
+
+
+def is_retryable_scan_error(exc):
+    """Tell whether a scan can be resumed after an error."""
+    if not isinstance(exc, HBaseIOError):
+        return isinstance(exc, RETRYABLE_SCAN_ERRORS)
+
+    message = exc.message or ''
+    if isinstance(message, bytes):
+        message = message.decode('utf-8', 'replace')
+    return any(name in message for name in TRANSIENT_SCAN_ERRORS)
+
+
+def scanner_open_request(compat, name, row_start, row_stop, columns, filter,
+                         timestamp, caching, scan_batching, sorted_columns,
+                         reverse):
+    """Return the Thrift function and arguments to open a scanner.
+
+    The return value is a `(function_name, args)` tuple.
+    """
+    if compat == '0.90':
+        # The scannerOpenWithScan() Thrift function is not
+        # available, so work around it as much as possible with the
+        # other scannerOpen*() Thrift functions
+
+        if filter is not None:
+            raise NotImplementedError(
+                "'filter' is not supported in HBase 0.90")
+
+        if row_stop is None:
+            if timestamp is None:
+                return 'scannerOpen', (name, row_start, columns, {})
+            else:
+                return 'scannerOpenTs', (
+                    name, row_start, columns, timestamp, {})
+        else:
+            if timestamp is None:
+                return 'scannerOpenWithStop', (
+                    name, row_start, row_stop, columns, {})
+            else:
+                return 'scannerOpenWithStopTs', (
+                    name, row_start, row_stop, columns, timestamp, {})
+
+    else:
+        # XXX: The "batch_size" can be slightly confusing to those
+        # familiar with the HBase Java API:
+        #
+        # * TScan.caching (Thrift API) translates to
+        #   Scan.setCaching() (Java API)
+        #
+        # * TScan.batchSize (Thrift API) translates to
+        #   Scan.setBatching (Java API) .
+        #
+        # However, we set Scan.setCaching() to what is called
+        # batch_size in the HappyBase API, so that the HTable on the
+        # Java side (inside the Thrift server) retrieves rows from
+        # the region servers in the same chunk sizes that it sends
+        # out again to Python (over Thrift). This cannot be tweaked
+        # (by design).
+        #
+        # The Scan.setBatching() value (Java API), which possibly
+        # cuts rows into multiple partial rows, can be set using the
+        # slightly strange name scan_batching.
+        #
+        # When the batch size is adjusted while scanning (because
+        # of batch_size='auto' or max_result_bytes), the Thrift
+        # server's default caching is used instead, since that is
+        # (or can be configured to be) limited by size as well.
+        scan = TScan(
+            startRow=row_start,
+            stopRow=row_stop,
+            timestamp=timestamp,
+            columns=columns,
+            caching=caching,
+            filterString=filter,
+            batchSize=scan_batching,
+            sortColumns=sorted_columns,
+            reversed=reverse,
+        )
+        return 'scannerOpenWithScan', (name, scan, {})
+
+
+def _parallel_scan_worker(pool, name, ranges, stop, scan_kwargs, chunk_size):
+    """Scan region sub-ranges and queue the results (internal use).
+
+    Each item in the `ranges` queue is a `(row_start, row_stop, output)`
+    tuple. Rows are put on the `output` queue in lists of at most
+    `chunk_size` rows, followed by `None` once the range has been
+    scanned completely. Exceptions are put on the `output` queue as
+    `sys.exc_info()` tuples.
+    """
+    while not stop.is_set():
+        try:
+            row_start, row_stop, output = ranges.get_nowait()
+        except queue.Empty:
+            return
+
+        # Route the scanner to the Thrift server on the region server
+        # hosting the range, if the pool uses multiple Thrift servers.
+        if scan_kwargs['reverse']:
+            route_key = row_stop or b''
+        else:
+            route_key = row_start
+
+        try:
+            with pool.connection(table=name, row=route_key,
+                                 use_prefix=False) as connection:
+                scanner = connection.table(name, use_prefix=False).scan(
+                    row_start=row_start, row_stop=row_stop, **scan_kwargs)
+                try:
+                    chunk = []
+                    for row in scanner:
+                        chunk.append(row)
+                        if len(chunk) < chunk_size:
+                            continue
+                        if not queue_put(output, chunk, stop):
+                            return
+                        chunk = []
+                    if chunk and not queue_put(output, chunk, stop):
+                        return
+                finally:
+                    scanner.close()
+        except Exception:
+            queue_put(output, sys.exc_info(), stop)
+            return
+
+        if not queue_put(output, None, stop):
+            return
+
+
 class Table(object):
     """HBase table abstraction class.
 
@@ -86,7 +419,8 @@ class Table(object):
     # Data retrieval
     #
 
-    def row(self, row, columns=None, timestamp=None, include_timestamp=False):
+    def row(self, row, columns=None, timestamp=None, include_timestamp=False,
+            raw=False):
         """Retrieve a single row of data.
 
         This method retrieves the row with the row key specified in the `row`
@@ -106,10 +440,22 @@ class Table(object):
         whether cells are returned as single values or as `(value, timestamp)`
         tuples.
 
+        If `raw` is `True`, the result is not converted into a dictionary,
+        and the Thrift ``TRowResult`` instance received from the server is
+        returned as-is, or `None` if the row does not exist. Its `columns`
+        attribute is a dictionary mapping column names to ``TCell``
+        instances, which have `value` and `timestamp` attributes. This avoids
+        conversion overhead for applications that pass the data on
+        elsewhere, such as proxies.
+
+        .. versionadded:: 1.3.0
+           `raw` argument
+
         :param str row: the row key
         :param list_or_tuple columns: list of columns (optional)
         :param int timestamp: timestamp (optional)
         :param bool include_timestamp: whether timestamps are returned
+        :param bool raw: whether to return the unconverted Thrift result
 
         :return: Mapping of columns (both qualifier and family) to values
         :rtype: dict
@@ -126,26 +472,42 @@ class Table(object):
             rows = self.connection.client.getRowWithColumnsTs(
                 self.name, row, columns, timestamp, {})
 
+        if raw:
+            return rows[0] if rows else None
+
         if not rows:
             return {}
 
         return make_row(rows[0].columns, include_timestamp)
 
     def rows(self, rows, columns=None, timestamp=None,
-             include_timestamp=False):
+             include_timestamp=False, max_result_bytes=None, raw=False):
         """Retrieve multiple rows of data.
 
         This method retrieves the rows with the row keys specified in the
         `rows` argument, which should be a list (or tuple) of row
         keys. The return value is a list of `(row_key, row_dict)` tuples.
 
-        The `columns`, `timestamp` and `include_timestamp` arguments behave
-        exactly the same as for :py:meth:`row`.
+        The `columns`, `timestamp`, `include_timestamp`, and `raw` arguments
+        behave exactly the same as for :py:meth:`row`. If `raw` is `True`,
+        a list of ``TRowResult`` instances is returned. Otherwise, results
+        are decoded as described for :py:meth:`scan`, which only differs
+        from the default when using the pure Python binary protocol.
+
+        If `max_result_bytes` is given, the row keys are split into
+        multiple requests, so that the results of each request stay under
+        this number of bytes. See :py:meth:`scan` for details.
+
+        .. versionadded:: 1.3.0
+           `max_result_bytes` and `raw` arguments
 
         :param list rows: list of row keys
         :param list_or_tuple columns: list of columns (optional)
         :param int timestamp: timestamp (optional)
         :param bool include_timestamp: whether timestamps are returned
+        :param int max_result_bytes: max size of results per request
+                                     (optional)
+        :param bool raw: whether to return unconverted Thrift results
 
         :return: List of mappings (columns to values)
         :rtype: list of dicts
@@ -153,14 +515,14 @@ class Table(object):
         if columns is not None and not isinstance(columns, (tuple, list)):
             raise TypeError("'columns' must be a tuple or list")
 
+        if max_result_bytes is not None and max_result_bytes < 1:
+            raise ValueError("'max_result_bytes' must be >= 1")
+
         if not rows:
             # Avoid round-trip if the result is empty anyway
-            return {}
+            return [] if raw else {}
 
-        if timestamp is None:
-            results = self.connection.client.getRowsWithColumns(
-                self.name, rows, columns, {})
-        else:
+        if timestamp is not None:
             if not isinstance(timestamp, Integral):
                 raise TypeError("'timestamp' must be an integer")
 
@@ -170,14 +532,41 @@ class Table(object):
             if columns is None:
                 columns = self._column_family_names()
 
-            results = self.connection.client.getRowsWithColumnsTs(
-                self.name, rows, columns, timestamp, {})
-
-        return [(r.row, make_row(r.columns, include_timestamp))
-                for r in results]
+        def get_rows(keys):
+            if timestamp is None:
+                api = 'getRowsWithColumns'
+                args = dict(tableName=self.name, rows=keys, columns=columns,
+                            attributes={})
+            else:
+                api = 'getRowsWithColumnsTs'
+                args = dict(tableName=self.name, rows=keys, columns=columns,
+                            timestamp=timestamp, attributes={})
+
+            client = self.connection.client
+            if raw:
+                return getattr(client, api)(**args)
+            return _request_rows(client, api, args, include_timestamp, False)
+
+        if max_result_bytes is None:
+            return get_rows(rows)
+
+        # Start with a single row, and size subsequent requests based on
+        # the largest row seen in the previous request.
+        sizer = BatchSizer(1, 1, len(rows), max_bytes=max_result_bytes)
+        ret = []
+        offset = 0
+        while offset < len(rows):
+            chunk = rows[offset:offset + sizer.size]
+            offset += len(chunk)
+            results = get_rows(chunk)
+            size = result_size if raw else row_size
+            sizer.update([size(r) for r in results], 0)
+            ret.extend(results)
+
+        return ret
 
     def cells(self, row, column, versions=None, timestamp=None,
-              include_timestamp=False):
+              include_timestamp=False, raw=False):
         """Retrieve multiple versions of a single cell from the table.
 
         This method retrieves multiple versions of a cell (if any).
@@ -188,11 +577,18 @@ class Table(object):
         The `timestamp` and `include_timestamp` arguments behave exactly the
         same as for :py:meth:`row`.
 
+        If `raw` is `True`, the Thrift ``TCell`` instances received from the
+        server are returned as-is.
+
+        .. versionadded:: 1.3.0
+           `raw` argument
+
         :param str row: the row key
         :param str column: the column name
         :param int versions: the maximum number of versions to retrieve
         :param int timestamp: timestamp (optional)
         :param bool include_timestamp: whether timestamps are returned
+        :param bool raw: whether to return unconverted Thrift results
 
         :return: cell values
         :rtype: list of values
@@ -214,6 +610,9 @@ class Table(object):
             cells = self.connection.client.getVerTs(
                 self.name, row, column, timestamp, versions, {})
 
+        if raw:
+            return cells
+
         return [
             (c.value, c.timestamp) if include_timestamp else c.value
             for c in cells
@@ -222,7 +621,9 @@ class Table(object):
     def scan(self, row_start=None, row_stop=None, row_prefix=None,
              columns=None, filter=None, timestamp=None,
              include_timestamp=False, batch_size=1000, scan_batching=None,
-             limit=None, sorted_columns=False, reverse=False):
+             limit=None, sorted_columns=False, reverse=False,
+             prefetch=None, max_result_bytes=None, retries=0,
+             resume_after=None, raw=False):
         """Create a scanner for data in the table.
 
         This method returns an iterable that can be used for looping over the
@@ -257,6 +658,51 @@ class Table(object):
         this to a low value (or even 1) if your data is large, since a low
         batch size results in added round-trips to the server.
 
+        If `batch_size` is ``'auto'``, the batch size is adjusted after each
+        round-trip, based on the observed size of the rows and the time the
+        round-trip took. This aims at transferring about 1 MiB per
+        round-trip, which works well for tables with both narrow and wide
+        rows. The chosen batch sizes are included in the debug log message
+        that is emitted when the scanner is closed.
+
+        If `max_result_bytes` is given, the number of rows retrieved per
+        batch is limited so that a batch of rows as large as the largest
+        row in the previous batch stays under this number of bytes. The
+        first batch only contains a single row. This bounds the memory used
+        per round-trip, both in the Thrift server and in the client, for
+        tables that (sometimes) contain very large rows. Note that this is
+        a best-effort limit, since the sizes of rows that have not been
+        retrieved yet are unknown.
+
+        If `retries` is given, the scanner is reopened up to this many times
+        when it fails because of a transient error (e.g. because the scanner
+        lease expired on the server, a region moved, or the Thrift server
+        was restarted); other errors, such as an invalid filter, are raised
+        immediately. The scan then continues directly after the last row
+        that was returned. After a transport error, a fresh connection to
+        the Thrift server is made first. Since a row returned from a scan
+        with `scan_batching` may be incomplete, `retries` cannot be used in
+        combination with `scan_batching`.
+
+        The `resume_after` argument can be used to continue an earlier scan
+        with the same arguments, e.g. after a batch job crashed, by storing
+        the key of the last row that was processed as a checkpoint. The scan
+        then continues directly after the row with this key. This also works
+        for reverse scans.
+
+        If `raw` is `True`, the scanner returns the Thrift ``TRowResult``
+        instances received from the server as-is, instead of `(row_key,
+        row_data)` tuples. See :py:meth:`row` and :py:meth:`scan_batches`
+        for details.
+
+        If the connection uses the pure Python binary protocol of thriftpy2
+        (e.g. with ``accelerated=False``, with the ``zlib`` transport, or if
+        thriftpy2 was built without its Cython extensions), results are
+        decoded straight into `(row_key, row_data)` tuples, without
+        building Thrift structs first. This is only a fallback that makes
+        that protocol faster; it does not apply to the Cython protocol that
+        connections use by default, which is faster still.
+
         The optional `scan_batching` is for advanced usage only; it
         translates to `Scan.setBatching()` at the Java side (inside the
         Thrift server). By setting this value rows may be split into
@@ -273,6 +719,15 @@ class Table(object):
         Note that the start of the range is inclusive, while the end is
         exclusive just as in the forward scan.
 
+        If `prefetch` is given, results are retrieved from the server in
+        a background thread, which reads ahead at most `prefetch` batches
+        (of `batch_size` rows) while the caller processes the current
+        batch. This overlaps network round-trips with processing, at the
+        cost of keeping more results in memory. Note that the connection
+        is used by the background thread while iterating, so it must not
+        be used for anything else until the scan has finished or the
+        scanner has been closed.
+
         **Compatibility notes:**
 
         * The `filter` argument is only available when using HBase 0.92
@@ -285,6 +740,10 @@ class Table(object):
         * The `reverse` argument is only available when using HBase 0.98
           (or up).
 
+        .. versionadded:: 1.3.0
+           `prefetch`, `max_result_bytes`, `retries`, `resume_after`, and
+           `raw` arguments, ``'auto'`` value for `batch_size`
+
         .. versionadded:: 1.1.0
            `reverse` argument
 
@@ -301,17 +760,114 @@ class Table(object):
         :param str filter: a filter string (optional)
         :param int timestamp: timestamp (optional)
         :param bool include_timestamp: whether timestamps are returned
-        :param int batch_size: batch size for retrieving results
+        :param int batch_size: batch size for retrieving results (or
+                               ``'auto'``)
         :param bool scan_batching: server-side scan batching (optional)
         :param int limit: max number of rows to return
         :param bool sorted_columns: whether to return sorted columns
         :param bool reverse: whether to perform scan in reverse
+        :param int prefetch: number of batches to retrieve ahead (optional)
+        :param int max_result_bytes: max size of a batch of results
+                                     (optional)
+        :param int retries: number of times to reopen a failed scanner
+        :param str resume_after: the row key to resume after (optional)
+        :param bool raw: whether to return unconverted Thrift results
 
         :return: generator yielding the rows matching the scan
         :rtype: iterable of `(row_key, row_data)` tuples
         """
-        if batch_size < 1:
+        batches = self._scan_result_batches(
+            row_start=row_start, row_stop=row_stop, row_prefix=row_prefix,
+            columns=columns, filter=filter, timestamp=timestamp,
+            include_timestamp=include_timestamp, batch_size=batch_size,
+            scan_batching=scan_batching, limit=limit,
+            sorted_columns=sorted_columns, reverse=reverse,
+            prefetch=prefetch, max_result_bytes=max_result_bytes,
+            retries=retries, resume_after=resume_after, raw=raw)
+
+        try:
+            for items in batches:
+                for item in items:
+                    yield item
+        finally:
+            batches.close()
+
+    def scan_batches(self, row_start=None, row_stop=None, row_prefix=None,
+                     columns=None, filter=None, timestamp=None,
+                     include_timestamp=False, batch_size=1000,
+                     scan_batching=None, limit=None, sorted_columns=False,
+                     reverse=False, prefetch=None, max_result_bytes=None,
+                     retries=0, resume_after=None, raw=False):
+        """Create a scanner that returns batches of rows.
+
+        This method works exactly like :py:meth:`scan`, and accepts the same
+        arguments, but instead of returning the rows one by one, it returns
+        a list of rows for each round-trip to the server, containing at
+        most `batch_size` rows. This avoids per-row overhead for
+        applications that process rows in bulk anyway, e.g. when exporting
+        data or writing it elsewhere.
+
+        If `raw` is `True`, the rows are not converted at all, and the
+        Thrift ``TRowResult`` instances received from the server are
+        returned instead of `(row_key, row_data)` tuples. These have a `row`
+        attribute containing the row key, and a `columns` attribute
+        containing a dictionary mapping column names to ``TCell`` instances
+        (or a `sortedColumns` attribute containing a list of ``TColumn``
+        instances when using `sorted_columns`). This is the cheapest row
+        representation available.
+
+        .. versionadded:: 1.3.0
+
+        :param bool raw: whether to return unconverted Thrift results
+
+        :return: generator yielding lists of rows matching the scan
+        :rtype: iterable of lists of `(row_key, row_data)` tuples
+        """
+        batches = self._scan_result_batches(
+            row_start=row_start, row_stop=row_stop, row_prefix=row_prefix,
+            columns=columns, filter=filter, timestamp=timestamp,
+            include_timestamp=include_timestamp, batch_size=batch_size,
+            scan_batching=scan_batching, limit=limit,
+            sorted_columns=sorted_columns, reverse=reverse,
+            prefetch=prefetch, max_result_bytes=max_result_bytes,
+            retries=retries, resume_after=resume_after, raw=raw)
+
+        try:
+            for items in batches:
+                yield items
+        finally:
+            batches.close()
+
+    def _scan_result_batches(self, row_start=None, row_stop=None,
+                             row_prefix=None, columns=None, filter=None,
+                             timestamp=None, include_timestamp=False,
+                             batch_size=1000, scan_batching=None, limit=None,
+                             sorted_columns=False, reverse=False,
+                             prefetch=None, max_result_bytes=None, retries=0,
+                             resume_after=None, raw=False, columnar=None):
+        """Scan the table and yield lists of results (internal use).
+
+        This implements :py:meth:`scan` (see there for the arguments),
+        except that lists of rows are returned, one list per round-trip.
+        If a list of column names is passed as `columnar`, the rows are
+        `(row_key, values)` tuples (see :py:func:`make_values`).
+        """
+        if max_result_bytes is not None and max_result_bytes < 1:
+            raise ValueError("'max_result_bytes' must be >= 1")
+
+        sizer = None
+        if batch_size == 'auto':
+            sizer = BatchSizer(
+                1 if max_result_bytes else AUTO_BATCH_SIZE_INITIAL,
+                AUTO_BATCH_SIZE_MIN, AUTO_BATCH_SIZE_MAX,
+                target_bytes=AUTO_BATCH_TARGET_BYTES,
+                max_latency=AUTO_BATCH_MAX_LATENCY,
+                max_bytes=max_result_bytes)
+            batch_size = sizer.size
+        elif batch_size < 1:
             raise ValueError("'batch_size' must be >= 1")
+        elif max_result_bytes is not None:
+            sizer = BatchSizer(1, 1, batch_size, max_bytes=max_result_bytes)
 
         if limit is not None and limit < 1:
             raise ValueError("'limit' must be >= 1")
@@ -319,6 +875,16 @@ class Table(object):
         if scan_batching is not None and scan_batching < 1:
             raise ValueError("'scan_batching' must be >= 1")
 
+        if prefetch is not None and prefetch < 1:
+            raise ValueError("'prefetch' must be >= 1")
+
+        if retries < 0:
+            raise ValueError("'retries' must be >= 0")
+
+        if retries and scan_batching is not None:
+            raise TypeError(
+                "'retries' cannot be combined with 'scan_batching'")
+
         if sorted_columns and self.connection.compat < '0.96':
             raise NotImplementedError(
                 "'sorted_columns' is only supported in HBase >= 0.96")
@@ -341,100 +907,446 @@ class Table(object):
                 row_stop = bytes_increment(row_prefix)
 
         if row_start is None:
-            row_start = ''
-
-        if self.connection.compat == '0.90':
-            # The scannerOpenWithScan() Thrift function is not
-            # available, so work around it as much as possible with the
-            # other scannerOpen*() Thrift functions
-
-            if filter is not None:
-                raise NotImplementedError(
-                    "'filter' is not supported in HBase 0.90")
-
-            if row_stop is None:
-                if timestamp is None:
-                    scan_id = self.connection.client.scannerOpen(
-                        self.name, row_start, columns, {})
-                else:
-                    scan_id = self.connection.client.scannerOpenTs(
-                        self.name, row_start, columns, timestamp, {})
-            else:
-                if timestamp is None:
-                    scan_id = self.connection.client.scannerOpenWithStop(
-                        self.name, row_start, row_stop, columns, {})
-                else:
-                    scan_id = self.connection.client.scannerOpenWithStopTs(
-                        self.name, row_start, row_stop, columns, timestamp, {})
+            row_start = b''
+
+        row_key = attrgetter('row') if raw else itemgetter(0)
+        scan_id = batches = None
+        last_row = resume_after
+        if last_row is not None:
+            last_row = ensure_bytes(last_row)
+        n_returned = n_fetched = n_retries = 0
+        try:
+            while True:
+                try:
+                    if scan_id is None:
+                        # When resuming, continue directly after the last
+                        # row. For reverse scans there is no such thing as
+                        # the row key directly preceding another one, so
+                        # the scan starts at the last row instead, which
+                        # is then skipped.
+                        skip_row = None
+                        if last_row is not None:
+                            if reverse:
+                                row_start = skip_row = last_row
+                            else:
+                                row_start = last_row + b'\x00'
+
+                        scan_id = self._open_scanner(
+                            row_start, row_stop, columns, filter, timestamp,
+                            None if sizer is not None else batch_size,
+                            scan_batching, sorted_columns, reverse)
+
+                        batch_limit = None
+                        if limit is not None:
+                            batch_limit = limit - n_returned
+                            if skip_row is not None:
+                                batch_limit += 1
+
+                        batches = _scanner_batches(
+                            self.connection.client, scan_id, batch_size,
+                            batch_limit, sizer, raw, include_timestamp,
+                            sorted_columns, columnar)
+                        if prefetch is not None:
+                            batches = prefetch_iter(batches, prefetch)
+
+                    for items in batches:
+                        n_fetched += len(items)
+
+                        if skip_row is not None:
+                            if row_key(items[0]) == skip_row:
+                                items = items[1:]
+                            skip_row = None
+
+                        if limit is not None:
+                            del items[limit - n_returned:]
+
+                        if not items:
+                            continue
+
+                        # Results are only fetched after the consumer is
+                        # done with the previous batch, so all of these
+                        # rows have been returned when an error occurs.
+                        n_returned += len(items)
+                        last_row = row_key(items[-1])
+                        yield items
+
+                        if limit is not None and n_returned == limit:
+                            return  # scan has finished
 
-        else:
-            # XXX: The "batch_size" can be slightly confusing to those
-            # familiar with the HBase Java API:
-            #
-            # * TScan.caching (Thrift API) translates to
-            #   Scan.setCaching() (Java API)
-            #
-            # * TScan.batchSize (Thrift API) translates to
-            #   Scan.setBatching (Java API) .
-            #
-            # However, we set Scan.setCaching() to what is called
-            # batch_size in the HappyBase API, so that the HTable on the
-            # Java side (inside the Thrift server) retrieves rows from
-            # the region servers in the same chunk sizes that it sends
-            # out again to Python (over Thrift). This cannot be tweaked
-            # (by design).
-            #
-            # The Scan.setBatching() value (Java API), which possibly
-            # cuts rows into multiple partial rows, can be set using the
-            # slightly strange name scan_batching.
-            scan = TScan(
-                startRow=row_start,
-                stopRow=row_stop,
-                timestamp=timestamp,
-                columns=columns,
-                caching=batch_size,
-                filterString=filter,
-                batchSize=scan_batching,
-                sortColumns=sorted_columns,
-                reversed=reverse,
-            )
-            scan_id = self.connection.client.scannerOpenWithScan(
-                self.name, scan, {})
+                    return  # scan has finished
 
+                except RETRYABLE_SCAN_ERRORS as exc:
+                    if (n_retries == retries
+                            or not is_retryable_scan_error(exc)):
+                        raise
+
+                    # The failure may be caused by a region that moved or
+                    # split, so the cached regions may be out of date.
+                    self.connection.region_cache.invalidate(self)
+                    n_retries += 1
+                    logger.warning(
+                        "Scanner on '%s' failed after %d rows (%r); "
+                        "reopening it (retry %d of %d)",
+                        self.name, n_returned, exc, n_retries, retries)
+                    self._discard_scanner(scan_id, batches, exc)
+                    scan_id = batches = None
+                    time.sleep(min(
+                        SCAN_RETRY_DELAY * 2 ** (n_retries - 1),
+                        SCAN_RETRY_MAX_DELAY))
+        finally:
+            if scan_id is not None:
+                # Stop retrieving results (which may happen in
+                # a background thread) before closing the scanner.
+                batches.close()
+                self.connection.client.scannerClose(scan_id)
+                logger.debug(
+                    "Closed scanner (id=%d) on '%s' "
+                    "(%d returned, %d fetched)",
+                    scan_id, self.name, n_returned, n_fetched)
+            if sizer is not None:
+                logger.debug(
+                    "Adaptive batch sizes for scan on '%s': "
+                    "%d-%d (last %d, %.0f bytes per row)",
+                    self.name, sizer.smallest, sizer.largest, sizer.size,
+                    sizer.item_bytes or 0)
+
+    def _open_scanner(self, row_start, row_stop, columns, filter, timestamp,
+                      caching, scan_batching, sorted_columns, reverse):
+        """Open a scanner and return its id (internal use)"""
+        api, args = scanner_open_request(
+            self.connection.compat, self.name, row_start, row_stop, columns,
+            filter, timestamp, caching, scan_batching, sorted_columns,
+            reverse)
+        scan_id = getattr(self.connection.client, api)(*args)
         logger.debug("Opened scanner (id=%d) on '%s'", scan_id, self.name)
+        return scan_id
+
+    def _discard_scanner(self, scan_id, batches, exc):
+        """Clean up after a failed scanner (internal use)"""
+        if batches is not None:
+            try:
+                batches.close()
+            except RETRYABLE_SCAN_ERRORS:
+                pass
+
+        if isinstance(exc, (TTransportException, socket.error)):
+            # The connection is in an unknown state, so start afresh.
+            self.connection.close()
+            self.connection._refresh_thrift_client()
 
-        n_returned = n_fetched = 0
         try:
-            while True:
-                if limit is None:
-                    how_many = batch_size
-                else:
-                    how_many = min(batch_size, limit - n_returned)
+            self.connection.open()
+            if scan_id is not None:
+                self.connection.client.scannerClose(scan_id)
+        except RETRYABLE_SCAN_ERRORS:
+            # The scanner may be gone already, e.g. because its lease
+            # expired or because the Thrift server was restarted.
+            pass
+
+    def parallel_scan(self, pool, row_start=None, row_stop=None,
+                      row_prefix=None, columns=None, filter=None,
+                      timestamp=None, include_timestamp=False,
+                      batch_size=1000, scan_batching=None, limit=None,
+                      sorted_columns=False, reverse=False,
+                      max_result_bytes=None, retries=0, ordered=False,
+                      max_workers=None, read_ahead=2):
+        """Create a scanner that scans all regions in parallel.
+
+        This method works like :py:meth:`scan`, but instead of walking the
+        whole key range with a single scanner, the range is split along
+        the region boundaries of the table (see :py:meth:`regions`), and
+        each region is scanned by a separate scanner. The scanners run
+        concurrently in background threads, each using its own
+        connection obtained from the :py:class:`ConnectionPool` passed as
+        the `pool` argument. This can speed up large scans considerably,
+        since all region servers are put to work at the same time. The
+        regions are taken from the :py:class:`RegionCache` of the
+        connection this table belongs to. Scanning with out-of-date regions
+        still returns all rows, but may not spread the work as well.
+
+        The `row_start`, `row_stop`, `row_prefix`, `columns`, `filter`,
+        `timestamp`, `include_timestamp`, `batch_size`, `scan_batching`,
+        `limit`, `sorted_columns`, `reverse`, `max_result_bytes`, and
+        `retries` arguments behave exactly the same as for :py:meth:`scan`.
+
+        By default, rows are returned in no particular order, as soon as
+        any of the scanners returns them. If `ordered` is `True`, rows
+        are returned in the same order as :py:meth:`scan` would return
+        them. Since regions do not overlap, this is done by returning the
+        rows region by region, while the scanners for the next regions
+        read ahead. The `read_ahead` argument specifies how many batches
+        (of `batch_size` rows) are buffered for each region, which bounds
+        the memory used by scanners that are ahead of the consumer.
+
+        The `max_workers` argument specifies the maximum number of
+        regions that are scanned concurrently. By default this is the
+        size of the connection pool. Note that the calling thread should
+        not hold a connection from the same pool while iterating, since
+        this takes away a connection from the scanners.
+
+        If the pool uses multiple Thrift servers, each scanner uses
+        a connection to the Thrift server running on the region server
+        hosting the scanned region, if there is one (see
+        :py:meth:`ConnectionPool.connection`).
+
+        .. versionadded:: 1.3.0
+
+        :param pool: the connection pool to use
+        :type pool: :py:class:`ConnectionPool`
+        :param str row_start: the row key to start at (inclusive)
+        :param str row_stop: the row key to stop at (exclusive)
+        :param str row_prefix: a prefix of the row key that must match
+        :param list_or_tuple columns: list of columns (optional)
+        :param str filter: a filter string (optional)
+        :param int timestamp: timestamp (optional)
+        :param bool include_timestamp: whether timestamps are returned
+        :param int batch_size: batch size for retrieving results (or
+                               ``'auto'``)
+        :param bool scan_batching: server-side scan batching (optional)
+        :param int limit: max number of rows to return
+        :param bool sorted_columns: whether to return sorted columns
+        :param bool reverse: whether to perform scan in reverse
+        :param int max_result_bytes: max size of a batch of results
+                                     (optional)
+        :param int retries: number of times to reopen a failed scanner
+        :param bool ordered: whether to return rows in key order
+        :param int max_workers: max number of concurrent scanners
+        :param int read_ahead: number of batches buffered per region
 
-                items = self.connection.client.scannerGetList(
-                    scan_id, how_many)
+        :return: generator yielding the rows matching the scan
+        :rtype: iterable of `(row_key, row_data)` tuples
+        """
+        if batch_size == 'auto':
+            chunk_size = AUTO_BATCH_SIZE_INITIAL
+        elif batch_size < 1:
+            raise ValueError("'batch_size' must be >= 1")
+        else:
+            chunk_size = batch_size
 
-                if not items:
-                    return  # scan has finished
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be >= 1")
 
-                n_fetched += len(items)
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("'max_workers' must be >= 1")
 
-                for n_returned, item in enumerate(items, n_returned + 1):
-                    if sorted_columns:
-                        row = make_ordered_row(item.sortedColumns,
-                                               include_timestamp)
-                    else:
-                        row = make_row(item.columns, include_timestamp)
+        if read_ahead < 1:
+            raise ValueError("'read_ahead' must be >= 1")
 
-                    yield item.row, row
+        # The row keys are compared to the region boundaries (bytes).
+        if row_start is not None:
+            row_start = ensure_bytes(row_start)
+        if row_stop is not None:
+            row_stop = ensure_bytes(row_stop)
+        if row_prefix is not None:
+            row_prefix = ensure_bytes(row_prefix)
+
+        if row_prefix is not None:
+            if row_start is not None or row_stop is not None:
+                raise TypeError(
+                    "'row_prefix' cannot be combined with 'row_start' "
+                    "or 'row_stop'")
 
-                    if limit is not None and n_returned == limit:
-                        return  # scan has finished
+            if reverse:
+                row_start = bytes_increment(row_prefix)
+                row_stop = row_prefix
+            else:
+                row_start = row_prefix
+                row_stop = bytes_increment(row_prefix)
+
+        boundaries = [
+            (r['start_key'], r['end_key'])
+            for r in self.connection.region_cache.regions(self)]
+
+        if reverse:
+            # A reverse scan covers the keys in the (row_stop, row_start]
+            # interval. Splitting that interval as if it were a forward
+            # range yields adjacent (lo, hi) pairs, and reverse scanning
+            # from each hi (inclusive) down to its lo (exclusive) covers
+            # every key exactly once.
+            ranges = [
+                (hi, lo or None) for lo, hi in reversed(split_key_range(
+                    boundaries, row_stop or b'', row_start or None))
+            ]
+        else:
+            ranges = split_key_range(
+                boundaries, row_start or b'', row_stop or None)
+
+        if not ranges:
+            return
+
+        if max_workers is None:
+            max_workers = pool._max_size
+
+        scan_kwargs = dict(
+            columns=columns,
+            filter=filter,
+            timestamp=timestamp,
+            include_timestamp=include_timestamp,
+            batch_size=batch_size,
+            scan_batching=scan_batching,
+            limit=limit,
+            sorted_columns=sorted_columns,
+            reverse=reverse,
+            max_result_bytes=max_result_bytes,
+            retries=retries,
+        )
+
+        # In unordered mode all workers put their results on the same
+        # output queue, and each region ends with a None marker on it.
+        # In ordered mode each region has its own output queue, which
+        # are consumed one after another. In both cases the queue sizes
+        # are bounded so that fast scanners cannot run away from a slow
+        # consumer. Workers pick regions in the order in which they are
+        # consumed, so the region being consumed is always in progress.
+        n_workers = min(max_workers, len(ranges))
+        if ordered:
+            outputs = [queue.Queue(maxsize=read_ahead) for r in ranges]
+        else:
+            outputs = [queue.Queue(maxsize=2 * n_workers)] * len(ranges)
+
+        pending = queue.Queue()
+        for (sub_start, sub_stop), output in zip(ranges, outputs):
+            pending.put((sub_start, sub_stop, output))
+
+        stop = threading.Event()
+        workers = [
+            threading.Thread(
+                target=_parallel_scan_worker,
+                args=(pool, self.name, pending, stop, scan_kwargs,
+                      chunk_size))
+            for i in range(n_workers)
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        logger.debug(
+            "Started parallel scan on '%s' (%d regions, %d workers)",
+            self.name, len(ranges), n_workers)
+
+        n_returned = 0
+        try:
+            for output in outputs:
+                while True:
+                    item = output.get()
+                    if item is None:
+                        break  # region has finished
+
+                    if isinstance(item, tuple):
+                        six.reraise(*item)
+
+                    for row in item:
+                        n_returned += 1
+                        yield row
+
+                        if limit is not None and n_returned == limit:
+                            return  # scan has finished
         finally:
-            self.connection.client.scannerClose(scan_id)
+            stop.set()
+            for worker in workers:
+                worker.join()
             logger.debug(
-                "Closed scanner (id=%d) on '%s' (%d returned, %d fetched)",
-                scan_id, self.name, n_returned, n_fetched)
+                "Finished parallel scan on '%s' (%d returned)",
+                self.name, n_returned)
+
+    def scan_columnar(self, columns, dtypes=None, chunk_size=None,
+                      row_start=None, row_stop=None, row_prefix=None,
+                      filter=None, timestamp=None, batch_size=1000,
+                      limit=None, reverse=False, prefetch=None,
+                      max_result_bytes=None, retries=0, resume_after=None):
+        """Scan the table and return the results as NumPy arrays.
+
+        This method works like :py:meth:`scan`, but instead of a dictionary
+        for each row, it returns the results in columnar form: an array of
+        row keys, and a dictionary mapping each column to an array of cell
+        values, in the same order as the row keys. No per-row data
+        structures are built, which makes this much faster than
+        :py:meth:`scan` when retrieving many rows for analytical purposes.
+        This method requires NumPy.
+
+        The `columns` argument is a list of the columns to retrieve. Unlike
+        other methods, these must be complete column names including the
+        qualifier, such as ``b'cf1:col1'``.
+
+        The `dtypes` argument is an optional dictionary mapping column names
+        to NumPy data types, for columns containing fixed-width values, such
+        as ``'>i8'`` for big-endian 64-bit integers (like the counter columns
+        manipulated by :py:meth:`counter_inc`) or ``'>f8'`` for big-endian
+        doubles. Values for these columns are converted in a single step. All
+        values must have the exact size of the data type, otherwise
+        a :py:exc:`ValueError` is raised. Columns without a data type are
+        returned as arrays of Python objects (byte strings).
+
+        All column arrays are masked arrays (see :py:mod:`numpy.ma`), in
+        which the cells that do not exist are masked.
+
+        If `chunk_size` is given, this method returns an iterator yielding
+        results for at most `chunk_size` rows at a time, instead of the
+        results for all rows at once. This bounds the memory used when
+        scanning large parts of a table.
+
+        The `row_start`, `row_stop`, `row_prefix`, `filter`, `timestamp`,
+        `batch_size`, `limit`, `reverse`, `prefetch`, `max_result_bytes`,
+        `retries`, and `resume_after` arguments behave exactly the same as
+        for :py:meth:`scan`.
+
+        .. versionadded:: 1.3.0
+
+        :param list_or_tuple columns: list of columns
+        :param dict dtypes: data types for the columns (optional)
+        :param int chunk_size: max number of rows per result (optional)
+
+        :return: row keys and column arrays, or an iterator yielding those
+        :rtype: `(row_keys, arrays)` tuple, or iterable of such tuples
+        """
+        if numpy is None:
+            raise RuntimeError(
+                "No NumPy available; please install the 'numpy' package "
+                "from PyPI to use scan_columnar().")
+
+        if not isinstance(columns, (tuple, list)) or not columns:
+            raise TypeError("'columns' must be a non-empty tuple or list")
+
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("'chunk_size' must be >= 1")
+
+        columns = [ensure_bytes(column) for column in columns]
+        dtypes = dict(
+            (ensure_bytes(column), numpy.dtype(dtype))
+            for column, dtype in iteritems(dtypes or {}))
+        for column, dtype in iteritems(dtypes):
+            if column not in columns:
+                raise ValueError(
+                    "'dtypes' contains unknown column %r" % column)
+            if dtype.itemsize == 0 or dtype.hasobject:
+                raise TypeError(
+                    "dtype for column %r must have a fixed size" % column)
+
+        batches = self._scan_result_batches(
+            row_start=row_start, row_stop=row_stop, row_prefix=row_prefix,
+            columns=columns, filter=filter, timestamp=timestamp,
+            batch_size=batch_size, limit=limit, reverse=reverse,
+            prefetch=prefetch, max_result_bytes=max_result_bytes,
+            retries=retries, resume_after=resume_after, columnar=columns)
+
+        if chunk_size is not None:
+            return _columnar_chunks(batches, columns, dtypes, chunk_size)
+
+        try:
+            parts = [make_columnar(items, columns, dtypes)
+                     for items in batches]
+        finally:
+            batches.close()
+
+        if not parts:
+            return make_columnar([], columns, dtypes)
+
+        row_keys = numpy.concatenate([keys for keys, arrays in parts])
+        arrays = dict(
+            (column, numpy.ma.concatenate(
+                [arrays[column] for keys, arrays in parts]))
+            for column in columns)
+        return row_keys, arrays
 
     #
     # Data manipulation
@@ -4,13 +4,33 @@ HappyBase utility module.
 These functions are not part of the public API.
 """
 
+import errno
+import os
 import re
+import socket
+import sys
+import threading
+import weakref
+from bisect import bisect_left
 
 import six
-from six.moves import range
+from six.moves import queue, range
 
 CAPITALS = re.compile('([A-Z])')
 
+# Whether objects can be notified of forks right away (Python 3.7 and up).
+AT_FORK_SUPPORTED = hasattr(os, 'register_at_fork')
+
+# Objects with an _after_fork() method to call in child processes.
+_after_fork_objects = weakref.WeakSet()
+
+
+try:
+    # Python 3.3 and up
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic  # noqa
+
 
 try:
     # Python 2.7 and up
@@ -86,3 +106,233 @@ def bytes_increment(b):
             b[i] += 1
             return bytes(b[:i+1])
     return None
+
+
+def split_key_range(boundaries, row_start, row_stop):
+    """Split a row key range along region boundaries.
+
+    The `boundaries` argument is a sorted list of `(start_key, end_key)`
+    tuples, in which empty byte strings denote the start and the end of
+    the table, like the `start_key` and `end_key` values returned by
+    `Table.regions()`. The `row_start` argument is the inclusive start
+    of the range (an empty string means the start of the table), and
+    `row_stop` is the exclusive end of the range (`None` means the end
+    of the table).
+
+    This function returns a list of `(row_start, row_stop)` tuples, one
+    for each region overlapping the range, in key order.
+    """
+    ranges = []
+    for start_key, end_key in boundaries:
+        if row_stop is not None and start_key >= row_stop:
+            break
+
+        if end_key and end_key <= row_start:
+            continue
+
+        start = max(start_key, row_start)
+        stop = end_key or None
+        if row_stop is not None and (stop is None or row_stop < stop):
+            stop = row_stop
+
+        if stop is not None and start >= stop:
+            continue
+
+        ranges.append((start, stop))
+
+    return ranges
+
+
+def socket_is_alive(sock):
+    """Tell whether an idle socket is still usable.
+
+    This checks, without blocking, whether the peer closed the connection
+    or sent unexpected data, neither of which should happen while no
+    request is in progress. Only a (cheap) system call is involved; no
+    data is sent.
+    """
+    if sock is None:
+        return False
+
+    timeout = sock.gettimeout()
+    sock.settimeout(0.0)
+    try:
+        sock.recv(1, socket.MSG_PEEK)
+    except socket.error as exc:
+        # No data available (yet), which is what an idle connection looks
+        # like. Anything else is an error, e.g. a connection reset.
+        return exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK)
+    finally:
+        sock.settimeout(timeout)
+
+    # Either the end of the stream (the peer closed the connection), or
+    # data that was not asked for.
+    return False
+
+
+def register_after_fork(obj):
+    """Call the _after_fork() method of an object in child processes.
+
+    This happens directly after a fork, if :py:data:`AT_FORK_SUPPORTED`.
+    The object is not kept alive by this.
+    """
+    _after_fork_objects.add(obj)
+
+
+def _run_after_fork():
+    for obj in list(_after_fork_objects):
+        obj._after_fork()
+
+
+if AT_FORK_SUPPORTED:
+    os.register_at_fork(after_in_child=_run_after_fork)
+
+
+def queue_put(q, item, stop, interval=.1):
+    """Put an item on a bounded queue, unless the stop event gets set.
+
+    This blocks while the queue is full, and returns whether the item
+    was put on the queue.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, True, interval)
+        except queue.Full:
+            continue
+        return True
+    return False
+
+
+def prefetch_iter(iterable, size):
+    """Iterate over an iterable in a background thread.
+
+    The background thread reads ahead at most `size` items. Exceptions
+    raised by the iterable are re-raised in the consuming thread. When
+    the returned generator is closed, the background thread is stopped,
+    and this waits until it has finished, so that the caller can safely
+    clean up resources used by the iterable afterwards.
+    """
+    buffer = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def run():
+        try:
+            for item in iterable:
+                if not queue_put(buffer, (item, None), stop):
+                    return
+        except Exception:
+            queue_put(buffer, (None, sys.exc_info()), stop)
+        else:
+            queue_put(buffer, None, stop)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            entry = buffer.get()
+            if entry is None:
+                return
+
+            item, exc_info = entry
+            if exc_info is not None:
+                six.reraise(*exc_info)
+
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class BatchSizer(object):
+    """Adaptive batch size for retrieving results in round-trips.
+
+    The batch size starts at `initial` and is adjusted after each
+    round-trip, based on the sizes of the results, and it always stays
+    between `minimum` and `maximum`.
+
+    If `target_bytes` is given, the batch size is chosen so that each
+    round-trip transfers about that many bytes, based on the average
+    size of the results seen so far. In this case the batch size at most
+    doubles per round-trip, and if `max_latency` is given, it is reduced
+    when a round-trip takes longer than that many seconds.
+
+    If `max_bytes` is given, the batch size is limited so that a batch
+    of results as large as the largest result in the previous round-trip
+    does not exceed that many bytes.
+    """
+    def __init__(self, initial, minimum, maximum, target_bytes=None,
+                 max_latency=None, max_bytes=None):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_bytes = target_bytes
+        self.max_latency = max_latency
+        self.max_bytes = max_bytes
+        self.item_bytes = None
+        self.smallest = self.largest = initial
+
+    def update(self, item_sizes, duration):
+        """Adjust the batch size after a round-trip."""
+        if not item_sizes:
+            return
+
+        item_bytes = float(sum(item_sizes)) / len(item_sizes)
+        if self.item_bytes is None:
+            self.item_bytes = item_bytes
+        else:
+            self.item_bytes = (self.item_bytes + item_bytes) / 2
+
+        size = self.maximum
+        if self.target_bytes is not None:
+            size = min(
+                self.target_bytes / max(self.item_bytes, 1.0),
+                2 * self.size)
+            if self.max_latency is not None and duration > self.max_latency:
+                size = min(size, self.size * self.max_latency / duration)
+
+        if self.max_bytes is not None:
+            size = min(size, self.max_bytes // max(max(item_sizes), 1))
+
+        self.size = max(self.minimum, min(self.maximum, int(size)))
+        self.smallest = min(self.smallest, self.size)
+        self.largest = max(self.largest, self.size)
+
+
+class Histogram(object):
+    """Histogram of durations in seconds, using fixed buckets.
+
+    The buckets have exponentially growing upper bounds, so that both
+    sub-millisecond and multi-second durations are counted in a useful
+    way. This class is not thread-safe.
+    """
+    BOUNDS = (.0005, .001, .002, .005, .01, .02, .05, .1, .2, .5,
+              1.0, 2.0, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """Count a duration."""
+        self.counts[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        """Return the histogram as a dict.
+
+        The ``buckets`` are ``(upper_bound, count)`` tuples, where the
+        count includes durations greater than the previous bound, and the
+        upper bound of the last bucket is infinity.
+        """
+        bounds = self.BOUNDS + (float('inf'),)
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.max,
+            'buckets': list(zip(bounds, self.counts)),
+        }
@@ -0,0 +1,119 @@
+"""
+Benchmark for the Cython Thrift implementations.
+
+This compares connections using the pure Python Thrift transport and
+protocol (``accelerated=False``) with connections using the Cython versions
+thriftpy2 provides (``accelerated=True``), for retrieving scan results and
+for sending batch puts, using the buffered transport and the binary
+protocol. Scan results are read the way :py:meth:`Table.scan` reads them,
+i.e. using the direct decoding in :py:mod:`happybase.decode` for the pure
+Python protocol. No HBase instance is needed; replies are replayed from
+memory. Run it using::
+
+    python -m tests.benchmark_accelerated [n_columns]
+"""
+
+from __future__ import print_function
+
+import io
+import sys
+import timeit
+
+from thriftpy2.protocol.binary import TBinaryProtocol
+from thriftpy2.thrift import TClient, TMessageType
+from thriftpy2.transport.memory import TMemoryBuffer
+
+from tests.test_decode import make_results
+from happybase import Connection
+from happybase.connection import ACCELERATED_AVAILABLE
+from happybase.table import _request_rows
+from Hbase_thrift import Hbase, BatchMutation, Mutation
+
+N_ROWS = 2000
+
+
+class ReplaySocket(object):
+    """Socket replaying a reply, and discarding everything written to it."""
+    def __init__(self, reply):
+        self._reply = io.BytesIO(reply)
+
+    def is_open(self):
+        return True
+
+    def read(self, sz):
+        return self._reply.read(sz)
+
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+def make_reply(api, result):
+    trans = TMemoryBuffer()
+    protocol = TBinaryProtocol(trans)
+    protocol.write_message_begin(api, TMessageType.REPLY, 0)
+    protocol.write_struct(result)
+    protocol.write_message_end()
+    return trans.getvalue()
+
+
+def make_client(accelerated, reply):
+    connection = Connection(autoconnect=False, accelerated=accelerated)
+    transport = connection._transport_class(ReplaySocket(reply))
+    protocol = connection._protocol_class(transport, decode_response=False)
+    return TClient(Hbase, protocol)
+
+
+def scan(accelerated, reply):
+    client = make_client(accelerated, reply)
+    return _request_rows(client, 'scannerGetList',
+                         dict(id=1, nbRows=N_ROWS), False, False)
+
+
+def put(accelerated, reply, batch_mutations):
+    client = make_client(accelerated, reply)
+    client.mutateRows(b'table', batch_mutations, {})
+
+
+def best_time(func, *args):
+    """Return the best time per row in microseconds."""
+    timer = timeit.Timer(lambda: func(*args))
+    return min(timer.repeat(repeat=7, number=1)) / N_ROWS * 1e6
+
+
+def main(n_columns=10):
+    if not ACCELERATED_AVAILABLE:
+        sys.exit("thriftpy2 has been built without its Cython extensions")
+
+    print("%d rows, %d columns (microseconds per row)" % (N_ROWS, n_columns))
+    print("%-20s %10s %10s %10s" % ("", "python", "cython", "speedup"))
+
+    scan_reply = make_reply(
+        'scannerGetList',
+        Hbase.scannerGetList_result(
+            success=make_results(N_ROWS, n_columns, False)))
+    assert scan(False, scan_reply) == scan(True, scan_reply)
+
+    batch_mutations = [
+        BatchMutation(
+            row=b'row-%05d' % i,
+            mutations=[
+                Mutation(column=b'cf:column-%03d' % j,
+                         value=b'value-%05d-%03d' % (i, j))
+                for j in range(n_columns)])
+        for i in range(N_ROWS)]
+    put_reply = make_reply('mutateRows', Hbase.mutateRows_result())
+
+    for label, func, args in [
+            ("scan", scan, (scan_reply,)),
+            ("batch put", put, (put_reply, batch_mutations))]:
+        python = best_time(func, False, *args)
+        cython = best_time(func, True, *args)
+        print("%-20s %10.2f %10.2f %9.1fx" % (
+            label, python, cython, python / cython))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,98 @@
+"""
+Benchmark for decoding row results.
+
+This compares the direct decoding in :py:mod:`happybase.decode` with the
+generic Thrift client followed by :py:func:`happybase.table.make_row`, both
+using the pure Python binary protocol. For reference, the generic client
+using the Cython binary protocol (if available) is timed as well; that is
+the code path used when thriftpy2 has been built with Cython. No HBase
+instance is needed; replies are replayed from memory. Run it using::
+
+    python -m tests.benchmark_decode [n_columns]
+"""
+
+from __future__ import print_function
+
+import sys
+import timeit
+
+from thriftpy2.protocol import TBinaryProtocol as DefaultBinaryProtocol
+from thriftpy2.protocol.binary import TBinaryProtocol
+from thriftpy2.thrift import TMessageType
+from thriftpy2.transport import TMemoryBuffer as DefaultMemoryBuffer
+from thriftpy2.transport.memory import TMemoryBuffer
+
+from tests.test_decode import ReplayClient, make_results
+from happybase.decode import request_rows
+from happybase.table import make_ordered_row, make_row
+from Hbase_thrift import Hbase
+
+N_ROWS = 2000
+
+
+def make_reply(results):
+    trans = TMemoryBuffer()
+    protocol = TBinaryProtocol(trans)
+    protocol.write_message_begin('scannerGetList', TMessageType.REPLY, 0)
+    protocol.write_struct(Hbase.scannerGetList_result(success=results))
+    protocol.write_message_end()
+    return trans.getvalue()
+
+
+def thrift_client(reply, protocol_class, trans_class):
+    client = ReplayClient('scannerGetList', Hbase.scannerGetList_result())
+    client._iprot = protocol_class(trans_class(reply), decode_response=False)
+    return client
+
+
+def current(reply, include_timestamp, sorted_columns, protocol_class,
+            trans_class):
+    client = thrift_client(reply, protocol_class, trans_class)
+    items = client.scannerGetList(1, N_ROWS)
+    if sorted_columns:
+        return [(item.row, make_ordered_row(item.sortedColumns,
+                                            include_timestamp))
+                for item in items]
+    return [(item.row, make_row(item.columns, include_timestamp))
+            for item in items]
+
+
+def direct(reply, include_timestamp, sorted_columns):
+    client = thrift_client(reply, TBinaryProtocol, TMemoryBuffer)
+    return request_rows(client, 'scannerGetList', {}, include_timestamp,
+                        sorted_columns)
+
+
+def best_time(func, *args):
+    """Return the best time per row in microseconds."""
+    timer = timeit.Timer(lambda: func(*args))
+    return min(timer.repeat(repeat=7, number=1)) / N_ROWS * 1e6
+
+
+def main(n_columns=10):
+    print("%d rows, %d columns (microseconds per row)" % (N_ROWS, n_columns))
+    print("%-40s %10s %10s %10s" % ("", "generic", "direct", "cython"))
+
+    for sorted_columns in (False, True):
+        reply = make_reply(make_results(N_ROWS, n_columns, sorted_columns))
+
+        for include_timestamp in (False, True):
+            assert (
+                current(reply, include_timestamp, sorted_columns,
+                        TBinaryProtocol, TMemoryBuffer)
+                == direct(reply, include_timestamp, sorted_columns))
+
+            label = "include_timestamp=%s sorted=%s" % (
+                include_timestamp, sorted_columns)
+            print("%-40s %10.2f %10.2f %10.2f" % (
+                label,
+                best_time(current, reply, include_timestamp,
+                          sorted_columns, TBinaryProtocol, TMemoryBuffer),
+                best_time(direct, reply, include_timestamp, sorted_columns),
+                best_time(current, reply, include_timestamp,
+                          sorted_columns, DefaultBinaryProtocol,
+                          DefaultMemoryBuffer)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
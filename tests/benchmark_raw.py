@@ -0,0 +1,56 @@
+"""
+Benchmark for raw scan results.
+
+This compares retrieving a batch of scan results as converted
+`(row_key, row_data)` tuples (the default) with retrieving the unconverted
+Thrift ``TRowResult`` instances (``raw=True``), for both the pure Python and
+the Cython binary protocol (if available). With the pure Python protocol,
+converted results are decoded directly (see :py:mod:`happybase.decode`).
+No HBase instance is needed; replies are replayed from memory. Run it
+using::
+
+    python -m tests.benchmark_raw [n_columns]
+"""
+
+from __future__ import print_function
+
+import sys
+
+from thriftpy2.protocol import TBinaryProtocol as DefaultBinaryProtocol
+from thriftpy2.protocol.binary import TBinaryProtocol
+from thriftpy2.transport import TMemoryBuffer as DefaultMemoryBuffer
+from thriftpy2.transport.memory import TMemoryBuffer
+
+from tests.benchmark_decode import (
+    N_ROWS, best_time, make_reply, thrift_client)
+from tests.test_decode import make_results
+from happybase.table import _scanner_batches
+
+
+def scan(reply, raw, include_timestamp, protocol_class, trans_class):
+    client = thrift_client(reply, protocol_class, trans_class)
+    batches = _scanner_batches(client, 1, N_ROWS, N_ROWS, raw=raw,
+                               include_timestamp=include_timestamp)
+    return [item for batch in batches for item in batch]
+
+
+def main(n_columns=10):
+    print("%d rows, %d columns (microseconds per row)" % (N_ROWS, n_columns))
+    print("%-40s %10s %10s %10s" % ("", "default", "raw", "saving"))
+
+    reply = make_reply(make_results(N_ROWS, n_columns))
+    for label, protocol_class, trans_class in [
+            ("python", TBinaryProtocol, TMemoryBuffer),
+            ("cython", DefaultBinaryProtocol, DefaultMemoryBuffer)]:
+        for include_timestamp in (False, True):
+            converted = best_time(scan, reply, False, include_timestamp,
+                                  protocol_class, trans_class)
+            raw = best_time(scan, reply, True, include_timestamp,
+                            protocol_class, trans_class)
+            print("%-40s %10.2f %10.2f %10.2f" % (
+                "%s include_timestamp=%s" % (label, include_timestamp),
+                converted, raw, converted - raw))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,153 @@
+"""
+Benchmark for socket options and the connect timeout.
+
+This measures how long connecting to an unresponsive server takes with only
+a (read) `timeout`, and with a short `connect_timeout` as well. The
+unresponsive server is simulated by a listening socket with a full backlog.
+
+It also measures the latency of small calls with the default socket
+options, which disable Nagle's algorithm (``TCP_NODELAY``), and with Nagle's
+algorithm enabled, both for calls made one at a time and for calls made by
+many threads on a shared connection, whose requests are written while
+earlier ones have not been answered yet. Nagle's algorithm hardly matters
+over the loopback interface, so pass the host and port of a remote Thrift
+server to see its effect; otherwise a minimal Thrift server runs in
+a background thread. Run it using::
+
+    python -m tests.benchmark_socket [host [port]]
+"""
+
+from __future__ import print_function
+
+import socket
+import sys
+import threading
+import time
+
+from thriftpy2.rpc import make_server
+from thriftpy2.transport import TTransportException
+
+from happybase import Connection
+from happybase.connection import DEFAULT_PORT, DEFAULT_SOCKET_OPTIONS
+from Hbase_thrift import Hbase
+
+LOCAL_PORT = 19090
+N_CALLS = 500
+N_THREADS = 8
+TIMEOUT = 2000
+CONNECT_TIMEOUT = 100
+
+
+class Handler(object):
+    """Thrift handler for the calls made by this benchmark."""
+    def getTableNames(self):
+        return []
+
+
+def serve():
+    server = make_server(Hbase, Handler(), '127.0.0.1', LOCAL_PORT)
+    thread = threading.Thread(target=server.serve)
+    thread.daemon = True
+    thread.start()
+    time.sleep(.5)
+
+
+def unresponsive_server():
+    """Return the port of a server that does not accept connections."""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(0)
+    port = server.getsockname()[1]
+
+    # Fill the backlog, so that further connection attempts hang.
+    sockets = [server]
+    for _ in range(5):
+        sock = socket.socket()
+        sock.setblocking(False)
+        try:
+            sock.connect(('127.0.0.1', port))
+        except socket.error:
+            pass
+        sockets.append(sock)
+    time.sleep(.2)
+    return port, sockets
+
+
+def connect_time(port, **kwargs):
+    """Return how long a failing connection attempt takes in seconds."""
+    start = time.time()
+    try:
+        Connection('127.0.0.1', port, timeout=TIMEOUT, **kwargs)
+    except TTransportException:
+        return time.time() - start
+    raise RuntimeError("Connecting to an unresponsive server succeeded")
+
+
+def sequential_latency(host, port, socket_options):
+    """Return the mean latency of calls in milliseconds."""
+    connection = Connection(host, port, socket_options=socket_options)
+    connection.tables()
+
+    start = time.time()
+    for _ in range(N_CALLS):
+        connection.tables()
+    latency = (time.time() - start) / N_CALLS * 1000
+
+    connection.close()
+    return latency
+
+
+def shared_latency(host, port, socket_options):
+    """Return the mean latency of concurrent calls in milliseconds."""
+    connection = Connection(host, port, socket_options=socket_options,
+                            shared=True)
+    connection.tables()
+
+    def run():
+        for _ in range(N_CALLS // N_THREADS):
+            connection.tables()
+
+    threads = [threading.Thread(target=run) for _ in range(N_THREADS)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latency = (time.time() - start) / (N_CALLS // N_THREADS) * 1000
+
+    connection.close()
+    return latency
+
+
+def main(host=None, port=DEFAULT_PORT):
+    unresponsive_port, sockets = unresponsive_server()
+    print("Connecting to an unresponsive server (seconds)")
+    print("%-30s %10.3f" % (
+        "timeout=%d" % TIMEOUT, connect_time(unresponsive_port)))
+    print("%-30s %10.3f" % (
+        "connect_timeout=%d" % CONNECT_TIMEOUT,
+        connect_time(unresponsive_port, connect_timeout=CONNECT_TIMEOUT)))
+    for sock in sockets:
+        sock.close()
+
+    if host is None:
+        host, port = '127.0.0.1', LOCAL_PORT
+        serve()
+
+    nagle_options = [option for option in DEFAULT_SOCKET_OPTIONS
+                     if option[1] != socket.TCP_NODELAY]
+
+    print()
+    print("Calls to %s:%d (mean latency in milliseconds)" % (host, port))
+    print("%-30s %10s %10s" % ("", "nodelay", "nagle"))
+    for label, func in [
+            ("sequential", sequential_latency),
+            ("shared, %d threads" % N_THREADS, shared_latency)]:
+        print("%-30s %10.3f %10.3f" % (
+            label,
+            func(host, port, DEFAULT_SOCKET_OPTIONS),
+            func(host, port, nagle_options)))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2] + [int(arg) for arg in sys.argv[2:3]])
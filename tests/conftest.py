@@ -0,0 +1,11 @@
+"""
+HappyBase test configuration.
+"""
+
+import sys
+
+collect_ignore = []
+
+# The asyncio API (and its tests) require Python 3.7 or newer.
+if sys.version_info < (3, 7):
+    collect_ignore.append('test_aio.py')
@@ -0,0 +1,183 @@
+"""
+HappyBase asyncio tests.
+"""
+
+import asyncio
+import os
+
+from happybase import Connection, NoConnectionsAvailable
+from happybase.aio import AsyncConnection, AsyncConnectionPool
+
+HAPPYBASE_HOST = os.environ.get('HAPPYBASE_HOST')
+HAPPYBASE_PORT = os.environ.get('HAPPYBASE_PORT')
+HAPPYBASE_COMPAT = os.environ.get('HAPPYBASE_COMPAT', '0.98')
+HAPPYBASE_TRANSPORT = os.environ.get('HAPPYBASE_TRANSPORT', 'buffered')
+
+TABLE_PREFIX = b'happybase_tests_tmp'
+TEST_TABLE_NAME = b'test_aio'
+
+connection_kwargs = dict(
+    host=HAPPYBASE_HOST,
+    port=HAPPYBASE_PORT,
+    table_prefix=TABLE_PREFIX,
+    compat=HAPPYBASE_COMPAT,
+    transport=HAPPYBASE_TRANSPORT,
+)
+
+
+def setup_module():
+    # Table administration is not available in the asyncio API.
+    connection = Connection(**connection_kwargs)
+    if TEST_TABLE_NAME in connection.tables():
+        connection.delete_table(TEST_TABLE_NAME, disable=True)
+    connection.create_table(TEST_TABLE_NAME, families={'cf1': {}, 'cf2': {}})
+    connection.close()
+
+
+def teardown_module():
+    connection = Connection(**connection_kwargs)
+    connection.delete_table(TEST_TABLE_NAME, disable=True)
+    connection.close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_connection():
+    async def check():
+        async with AsyncConnection(**connection_kwargs) as connection:
+            assert connection.is_open()
+            assert TEST_TABLE_NAME in await connection.tables()
+            table = connection.table(TEST_TABLE_NAME)
+            assert set(await table.families()) == {b'cf1', b'cf2'}
+            assert len(await table.regions()) >= 1
+        assert not connection.is_open()
+
+    run(check())
+
+
+def test_data_retrieval_and_manipulation():
+    async def check():
+        async with AsyncConnection(**connection_kwargs) as connection:
+            table = connection.table(TEST_TABLE_NAME)
+
+            await table.put(b'row1', {b'cf1:a': b'v1', b'cf2:b': b'v2'})
+            await table.put(b'row2', {b'cf1:a': b'v3'}, timestamp=1234)
+
+            assert await table.row(b'row1') == {
+                b'cf1:a': b'v1', b'cf2:b': b'v2'}
+            assert await table.row(b'row1', columns=[b'cf2']) == {
+                b'cf2:b': b'v2'}
+            assert await table.row(b'row2', include_timestamp=True) == {
+                b'cf1:a': (b'v3', 1234)}
+            assert await table.row(b'missing') == {}
+
+            rows = await table.rows([b'row1', b'missing', b'row2'])
+            assert [row_key for row_key, data in rows] == [b'row1', b'row2']
+
+            assert await table.cells(b'row1', b'cf1:a') == [b'v1']
+
+            await table.delete(b'row1', columns=[b'cf2:b'])
+            assert await table.row(b'row1') == {b'cf1:a': b'v1'}
+            await table.delete(b'row1')
+            assert await table.row(b'row1') == {}
+
+    run(check())
+
+
+def test_scan():
+    async def check():
+        async with AsyncConnection(**connection_kwargs) as connection:
+            table = connection.table(TEST_TABLE_NAME)
+            async with table.batch(batch_size=50) as batch:
+                for i in range(200):
+                    await batch.put(b'scan-%04d' % i, {b'cf1:n': b'%d' % i})
+
+            rows = [row async for row in table.scan(
+                row_prefix=b'scan-', batch_size=30)]
+            assert len(rows) == 200
+            assert rows[0] == (b'scan-0000', {b'cf1:n': b'0'})
+
+            keys = [row_key async for row_key, data in table.scan(
+                row_prefix=b'scan-', limit=5, reverse=True)]
+            assert keys == [b'scan-%04d' % i for i in range(199, 194, -1)]
+
+            scanner = table.scan(row_prefix=b'scan-', batch_size=10)
+            async for row in scanner:
+                break
+            await scanner.aclose()
+
+    run(check())
+
+
+def test_batch():
+    async def check():
+        async with AsyncConnection(**connection_kwargs) as connection:
+            table = connection.table(TEST_TABLE_NAME)
+
+            try:
+                async with table.batch(transaction=True) as batch:
+                    await batch.put(b'batch-row', {b'cf1:a': b'v'})
+                    raise ValueError("abort")
+            except ValueError:
+                pass
+            assert await table.row(b'batch-row') == {}
+
+            try:
+                with table.batch():
+                    pass
+            except TypeError:
+                pass
+            else:
+                assert False, "regular 'with' must fail"
+
+    run(check())
+
+
+def test_atomic_counters():
+    async def check():
+        async with AsyncConnection(**connection_kwargs) as connection:
+            table = connection.table(TEST_TABLE_NAME)
+            row, column = b'counter-row', b'cf1:counter'
+
+            assert await table.counter_get(row, column) == 0
+            assert await table.counter_inc(row, column) == 1
+            assert await table.counter_inc(row, column, value=10) == 11
+            assert await table.counter_dec(row, column, value=2) == 9
+            await table.counter_set(row, column, 100)
+            assert await table.counter_get(row, column) == 100
+
+    run(check())
+
+
+def test_connection_pool():
+    pool = AsyncConnectionPool(size=5, **connection_kwargs)
+
+    async def get(i):
+        async with pool.connection() as connection:
+            table = connection.table(TEST_TABLE_NAME)
+            await table.put(b'pool-%d' % i, {b'cf1:i': b'%d' % i})
+            return await table.row(b'pool-%d' % i)
+
+    async def check():
+        rows = await asyncio.gather(*[get(i) for i in range(50)])
+        assert rows == [{b'cf1:i': b'%d' % i} for i in range(50)]
+
+        async with pool.connection():
+            async with pool.connection():
+                pass
+
+        small_pool = AsyncConnectionPool(size=1, **connection_kwargs)
+        async with small_pool.connection():
+            try:
+                async with small_pool.connection(timeout=.1):
+                    pass
+            except NoConnectionsAvailable:
+                pass
+            else:
+                assert False, "pool must be exhausted"
+        small_pool.close()
+
+    run(check())
+    pool.close()
@@ -5,7 +5,10 @@ HappyBase tests.
 import collections
 import os
 import random
+import socket
+import struct
 import threading
+import time
 
 import six
 from six.moves import range
@@ -78,6 +81,185 @@ def test_timeout_arg():
         autoconnect=False)
 
 
+def test_socket_options():
+    with assert_raises(ValueError):
+        Connection(connect_timeout=0, autoconnect=False)
+
+    with assert_raises(TypeError):
+        Connection(socket_options=1, autoconnect=False)
+
+    conn = Connection(timeout=5000, connect_timeout=1000, **connection_kwargs)
+    sock = conn._socket.sock
+    assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+    assert sock.gettimeout() == 5.0
+    conn.close()
+
+    options = [(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)]
+    conn = Connection(socket_options=options, **connection_kwargs)
+    sock = conn._socket.sock
+    assert not sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 65536
+    assert TEST_TABLE_NAME in conn.tables()
+    conn.close()
+
+
+def test_accelerated():
+    from happybase.connection import ACCELERATED_AVAILABLE
+
+    with assert_raises(ValueError):
+        Connection(accelerated='yes', autoconnect=False)
+
+    assert not Connection(accelerated=False, autoconnect=False).accelerated
+    assert (Connection(autoconnect=False).accelerated
+            == ACCELERATED_AVAILABLE)
+
+    row_key = b'row-accelerated'
+    for accelerated in (False, 'auto'):
+        conn = Connection(accelerated=accelerated, **connection_kwargs)
+        t = conn.table(TEST_TABLE_NAME)
+        t.put(row_key, {b'cf1:col1': b'v1'})
+        assert t.row(row_key) == {b'cf1:col1': b'v1'}
+        assert list(t.scan(row_prefix=row_key)) == [
+            (row_key, {b'cf1:col1': b'v1'})]
+        t.delete(row_key)
+        conn.close()
+
+
+def test_auto_modes():
+    from happybase.connection import _negotiated_modes
+
+    with assert_raises(ValueError):
+        Connection(transport='auto-detect', autoconnect=False)
+
+    kwargs = dict(connection_kwargs, transport='auto', protocol='auto')
+    conn = Connection(**kwargs)
+    assert TEST_TABLE_NAME in conn.tables()
+    assert (conn.host, conn.port, 'auto', 'auto') in _negotiated_modes
+    modes = (conn._transport_name, conn._protocol_name)
+    conn.close()
+
+    conn = Connection(**kwargs)
+    assert (conn._transport_name, conn._protocol_name) == modes
+    assert TEST_TABLE_NAME in conn.tables()
+    conn.close()
+
+
+def test_shared_connection():
+    conn = Connection(shared=True, **connection_kwargs)
+    table = conn.table(TEST_TABLE_NAME)
+    with table.batch() as b:
+        for i in range(20):
+            b.put(b'row-shared-%02d' % i, {b'cf1:col1': b'%d' % i})
+
+    errors = []
+
+    def run(n):
+        try:
+            for i in range(50):
+                i = (i + n) % 20
+                row = table.row(b'row-shared-%02d' % i)
+                assert row == {b'cf1:col1': b'%d' % i}
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+
+    # Once broken, the connection can be reopened.
+    from thriftpy2.transport import TTransportException
+    conn.transport.sock.shutdown(socket.SHUT_RDWR)
+    for i in range(2):
+        with assert_raises((TTransportException, socket.error)):
+            table.row(b'row-shared-00')
+    conn.close()
+    conn.open()
+    assert table.row(b'row-shared-00') == {b'cf1:col1': b'0'}
+    conn.close()
+
+
+def test_pipeline():
+    with assert_raises(ValueError):
+        connection.pipeline(max_in_flight=0)
+
+    with connection.pipeline(max_in_flight=3) as pipe:
+        t = pipe.table(TEST_TABLE_NAME)
+        puts = [t.put(b'row-pipeline-%02d' % i, {b'cf1:col1': b'%d' % i})
+                for i in range(10)]
+        incs = [t.counter_inc(b'row-pipeline', b'cf1:counter')
+                for i in range(5)]
+        assert len(pipe) == 15
+        assert not puts[0].done()
+
+    assert all(p.done() and p.result() is None for p in puts)
+    assert [i.result() for i in incs] == [1, 2, 3, 4, 5]
+    assert len(pipe) == 0
+
+    pipe = connection.pipeline()
+    t = pipe.table(TEST_TABLE_NAME)
+    row = t.row(b'row-pipeline-03')
+    missing = t.row(b'row-pipeline-missing')
+    rows = t.rows([b'row-pipeline-01', b'row-pipeline-02'])
+    counter = t.counter_get(b'row-pipeline', b'cf1:counter')
+    t.delete(b'row-pipeline-09', columns=[b'cf1:col1'])
+
+    with assert_raises(RuntimeError):
+        row.result()
+
+    results = pipe.send()
+    assert results[0] == {b'cf1:col1': b'3'}
+    assert results[1] == {}
+    assert rows.result() == [
+        (b'row-pipeline-01', {b'cf1:col1': b'1'}),
+        (b'row-pipeline-02', {b'cf1:col1': b'2'}),
+    ]
+    assert counter.result() == 5
+    assert missing.exception() is None
+    assert table.row(b'row-pipeline-09') == {}
+    assert pipe.send() == []
+
+    # Nothing is sent when the block raises
+    with assert_raises(ValueError):
+        with connection.pipeline() as pipe:
+            put = pipe.table(TEST_TABLE_NAME).put(
+                b'row-pipeline-unsent', {b'cf1:col1': b'v'})
+            raise ValueError()
+    assert not put.done()
+    assert table.row(b'row-pipeline-unsent') == {}
+
+
+def test_retry_policy():
+    from happybase import RetryPolicy
+
+    with assert_raises(TypeError):
+        Connection(retry_policy=3, autoconnect=False)
+
+    policy = RetryPolicy(max_retries=2, backoff=.01)
+    conn = Connection(retry_policy=policy, **connection_kwargs)
+    table = conn.table(TEST_TABLE_NAME)
+    row_key = b'row-retry'
+    table.put(row_key, {b'cf1:col1': b'v1'})
+
+    # Break the connection; the next call is retried on a new one.
+    conn.transport.sock.shutdown(socket.SHUT_RDWR)
+    assert table.row(row_key) == {b'cf1:col1': b'v1'}
+    assert policy.stats()['recovered'] == 1
+
+    # Non-idempotent calls are not retried.
+    conn.transport.sock.shutdown(socket.SHUT_RDWR)
+    with assert_raises(socket.error):
+        table.counter_inc(row_key, b'cf1:counter')
+    assert policy.stats()['not_retried'] == 1
+
+    table.delete(row_key)
+    conn.close()
+
+
 def test_enabling():
     assert connection.is_table_enabled(TEST_TABLE_NAME)
     connection.disable_table(TEST_TABLE_NAME)
@@ -283,6 +465,11 @@ def test_row():
     assert b'v1new' == res[b'cf1:col1'][0]
     assert isinstance(res[b'cf1:col1'][1], int)
 
+    res = row(row_key, raw=True)
+    assert row_key == res.row
+    assert b'v1new' == res.columns[b'cf1:col1'].value
+    assert row(b'row-test-nonexistent', raw=True) is None
+
 
 def test_rows():
     row_keys = [b'rows-row1', b'rows-row2', b'rows-row3']
@@ -313,6 +500,18 @@ def test_rows():
         assert row_key in rows
         assert data_old == rows[row_key]
 
+    rows = table.rows(row_keys, raw=True)
+    assert row_keys == [r.row for r in rows]
+    assert b'v1new' == rows[0].columns[b'cf1:col1'].value
+    assert rows == table.rows(row_keys, raw=True, max_result_bytes=10)
+    assert [] == table.rows([], raw=True)
+
+    with assert_raises(ValueError):
+        table.rows(row_keys, max_result_bytes=0)
+
+    rows = table.rows(row_keys + [b'rows-no-such-row'], max_result_bytes=50)
+    assert [(row_key, data_new) for row_key in row_keys] == rows
+
 
 def test_cells():
     row_key = b'cell-test'
@@ -344,6 +543,10 @@ def test_cells():
     assert b'old' == results[0][0]
     assert 1234 == results[0][1]
 
+    results = table.cells(row_key, col, raw=True)
+    assert [b'new', b'old'] == [cell.value for cell in results]
+    assert 1234 == results[1].timestamp
+
 
 def test_scan():
     with assert_raises(TypeError):
@@ -401,6 +604,52 @@ def test_scan():
     scanner = table.scan(row_prefix=b'row-scan-b', batch_size=5, limit=10)
     assert 10 == calc_len(scanner)
 
+    with assert_raises(ValueError):
+        list(table.scan(prefetch=0))
+
+    scanner = table.scan(row_prefix=b'row-scan-a', batch_size=7, prefetch=2)
+    assert list(table.scan(row_prefix=b'row-scan-a')) == list(scanner)
+
+    scanner = table.scan(row_prefix=b'row-scan-b', batch_size=5, limit=12,
+                         prefetch=1)
+    assert 12 == calc_len(scanner)
+
+    scanner = table.scan(row_prefix=b'row-scan-a', raw=True, limit=10)
+    assert [row_key for row_key, row in table.scan(
+        row_prefix=b'row-scan-a', limit=10)] == [r.row for r in scanner]
+
+    scanner = table.scan(row_prefix=b'row-scan-a', batch_size='auto')
+    assert list(table.scan(row_prefix=b'row-scan-a')) == list(scanner)
+
+    scanner = table.scan(row_prefix=b'row-scan-b', batch_size='auto',
+                         limit=150)
+    assert 150 == calc_len(scanner)
+
+    with assert_raises(ValueError):
+        list(table.scan(max_result_bytes=0))
+
+    scanner = table.scan(row_prefix=b'row-scan-a', max_result_bytes=1000)
+    assert list(table.scan(row_prefix=b'row-scan-a')) == list(scanner)
+
+    scanner = table.scan(row_prefix=b'row-scan-a', batch_size='auto',
+                         max_result_bytes=10, limit=20)
+    assert 20 == calc_len(scanner)
+
+    with assert_raises(ValueError):
+        list(table.scan(retries=-1))
+
+    with assert_raises(TypeError):
+        list(table.scan(retries=3, scan_batching=10))
+
+    rows = list(table.scan(row_prefix=b'row-scan-a', limit=20))
+    scanner = table.scan(row_prefix=b'row-scan-a', limit=10,
+                         resume_after=rows[9][0], retries=3)
+    assert rows[10:] == list(scanner)
+
+    scanner = table.scan(row_prefix=b'row-scan-a', limit=10,
+                         resume_after=rows[9][0].decode('ascii'))
+    assert rows[10:] == list(scanner)
+
     scanner = table.scan(timestamp=123)
     assert 0 == calc_len(scanner)
 
@@ -414,6 +663,12 @@ def test_scan():
     with assert_raises(StopIteration):
         next(scanner)
 
+    scanner = table.scan(batch_size=20, prefetch=3)
+    next(scanner)
+    scanner.close()
+    with assert_raises(StopIteration):
+        next(scanner)
+
 
 def test_scan_sorting():
     if connection.compat < '0.96':
@@ -460,6 +715,63 @@ def test_scan_reverse():
     key, data = list(scan)[-1]
     assert b'row-scan-reverse-0001' == key
 
+    scan = table.scan(row_prefix=b'row-scan-reverse', reverse=True,
+                      resume_after=b'row-scan-reverse-1000', limit=2)
+    assert [b'row-scan-reverse-0999', b'row-scan-reverse-0998'] == \
+        [key for key, data in scan]
+
+
+def test_scan_batches():
+    batches = list(table.scan_batches(row_prefix=b'row-scan-a',
+                                      batch_size=300))
+    assert [300] * 6 + [200] == [len(batch) for batch in batches]
+    assert list(table.scan(row_prefix=b'row-scan-a')) == \
+        [row for batch in batches for row in batch]
+
+    batches = table.scan_batches(row_prefix=b'row-scan-a', limit=20,
+                                 batch_size=15, raw=True)
+    batches = list(batches)
+    assert [15, 5] == [len(batch) for batch in batches]
+    assert b'row-scan-a00000' == batches[0][0].row
+    assert b'v1' == batches[0][0].columns[b'cf1:col1'].value
+
+
+def test_scan_columnar():
+    try:
+        import numpy  # noqa
+    except ImportError:
+        return  # not supported
+
+    with table.batch() as b:
+        for i in range(100):
+            data = {b'cf1:str': ('%d' % i).encode('ascii')}
+            if i % 2:
+                data[b'cf1:num'] = struct.pack('>q', i)
+            b.put(('row-scan-columnar-%03d' % i).encode('ascii'), data)
+
+    with assert_raises(TypeError):
+        table.scan_columnar([])
+
+    with assert_raises(ValueError):
+        table.scan_columnar([b'cf1:str'], dtypes={b'cf1:other': '>i8'})
+
+    with assert_raises(ValueError):
+        table.scan_columnar([b'cf1:str'], dtypes={b'cf1:str': '>i8'},
+                            row_prefix=b'row-scan-columnar-')
+
+    row_keys, arrays = table.scan_columnar(
+        [b'cf1:num', b'cf1:str'], dtypes={b'cf1:num': '>i8'},
+        row_prefix=b'row-scan-columnar-', batch_size=30)
+    assert 100 == len(row_keys)
+    assert b'row-scan-columnar-000' == row_keys[0]
+    assert 50 == arrays[b'cf1:num'].count()
+    assert sum(range(1, 100, 2)) == arrays[b'cf1:num'].sum()
+    assert b'99' == arrays[b'cf1:str'][99]
+
+    chunks = table.scan_columnar(
+        [b'cf1:str'], row_prefix=b'row-scan-columnar-', chunk_size=40)
+    assert [40, 40, 20] == [len(row_keys) for row_keys, arrays in chunks]
+
 
 def test_scan_filter_and_batch_size():
     # See issue #54 and #56
@@ -468,6 +780,57 @@ def test_scan_filter_and_batch_size():
         print(v)
 
 
+def test_parallel_scan():
+    pool = ConnectionPool(size=3, **connection_kwargs)
+
+    with assert_raises(TypeError):
+        list(table.parallel_scan(pool, row_prefix=b'row', row_start=b'xyz'))
+
+    with assert_raises(ValueError):
+        list(table.parallel_scan(pool, max_workers=0))
+
+    rows = list(table.parallel_scan(pool, row_prefix=b'row-scan-a'))
+    assert 2000 == len(rows)
+    assert list(table.scan(row_prefix=b'row-scan-a')) == sorted(rows)
+
+    scanner = table.parallel_scan(
+        pool, row_start=b'row-scan-b00100', row_stop=b'row-scan-b00200',
+        columns=[b'cf1:col1'], batch_size=7, max_workers=1)
+    rows = sorted(scanner)
+    assert 100 == len(rows)
+    assert (b'row-scan-b00100', {b'cf1:col1': b'v1'}) == rows[0]
+
+    # Text row keys work as well.
+    scanner = table.parallel_scan(
+        pool, row_start=u'row-scan-b00100', row_stop=u'row-scan-b00200',
+        columns=[b'cf1:col1'])
+    assert rows == sorted(scanner)
+    scanner = table.parallel_scan(pool, row_prefix=u'row-scan-a')
+    assert 2000 == len(list(scanner))
+
+    scanner = table.parallel_scan(pool, row_prefix=b'row-scan-', limit=10)
+    assert 10 == len(list(scanner))
+
+    scanner = table.parallel_scan(
+        pool, row_prefix=b'row-scan-', ordered=True, batch_size=50,
+        read_ahead=1)
+    assert list(table.scan(row_prefix=b'row-scan-')) == list(scanner)
+
+    if connection.compat >= '0.98':
+        scanner = table.parallel_scan(
+            pool, row_start=b'row-scan-b00999', row_stop=b'row-scan-a00500',
+            ordered=True, reverse=True)
+        assert list(table.scan(row_start=b'row-scan-b00999',
+                               row_stop=b'row-scan-a00500',
+                               reverse=True)) == list(scanner)
+
+    scanner = table.parallel_scan(pool, batch_size=20)
+    next(scanner)
+    scanner.close()
+    with assert_raises(StopIteration):
+        next(scanner)
+
+
 def test_delete():
     row_key = b'row-test-delete'
     data = {b'cf1:col1': b'v1',
@@ -502,6 +865,67 @@ def test_connection_pool_construction():
     with assert_raises(ValueError):
         ConnectionPool(size=0)
 
+    with assert_raises(ValueError):
+        ConnectionPool(size=1, hosts=[])
+
+    with assert_raises(ValueError):
+        ConnectionPool(size=1, strategy='fastest')
+
+    with assert_raises(ValueError):
+        ConnectionPool(size=1, backoff=0)
+
+    with assert_raises(TypeError):
+        ConnectionPool(size=1, hosts=['localhost'], host='localhost')
+
+
+def test_connection_pool_multiple_hosts():
+
+    from thriftpy2.transport import TTransportException
+
+    kwargs = dict(connection_kwargs)
+    host = kwargs.pop('host') or 'localhost'
+    port = kwargs.pop('port') or 9090
+
+    # The unreachable server is marked down, and connections are
+    # spread over the others.
+    unreachable = ('localhost', 1)
+    hosts = [(host, port), unreachable, (host, port)]
+    for strategy in ('round_robin', 'random', 'least_outstanding'):
+        pool = ConnectionPool(size=4, hosts=hosts, strategy=strategy,
+                              **kwargs)
+        for i in range(10):
+            with pool.connection() as connection:
+                assert (connection.host, connection.port) != unreachable
+                connection.tables()
+
+    with assert_raises(TTransportException):
+        ConnectionPool(size=1, hosts=[unreachable], **kwargs)
+
+
+def test_connection_pool_routing():
+    kwargs = dict(connection_kwargs)
+    host = kwargs.pop('host') or 'localhost'
+    port = kwargs.pop('port') or 9090
+    pool = ConnectionPool(size=2, hosts=[(host, port), (host, port)],
+                          **kwargs)
+
+    with assert_raises(TypeError):
+        with pool.connection(table=TEST_TABLE_NAME):
+            pass
+
+    with pool.connection(table=TEST_TABLE_NAME, row=b'row-1') as connection:
+        table = connection.table(TEST_TABLE_NAME)
+        table.put(b'row-1', {b'cf1:col1': b'value'})
+
+        # Nested requests use the same connection.
+        with pool.connection(table=TEST_TABLE_NAME, row=b'x') as another:
+            assert another is connection
+
+    with pool.connection(table=TEST_TABLE_NAME, row=b'row-1') as connection:
+        table = connection.table(TEST_TABLE_NAME)
+        assert table.row(b'row-1') == {b'cf1:col1': b'value'}
+        table.delete(b'row-1')
+
 
 def test_connection_pool():
 
@@ -572,6 +996,152 @@ def test_pool_exhaustion():
         t.join()
 
 
+def test_pool_connection_checks():
+    pool = ConnectionPool(size=1, **connection_kwargs)
+    with pool.connection() as connection:
+        connection.tables()
+        transport = connection.transport
+
+        # Break the connection without the pool noticing
+        connection.transport.sock.shutdown(socket.SHUT_RDWR)
+
+    # The broken connection is replaced before it is handed out
+    with pool.connection() as connection:
+        assert connection.transport is not transport
+        connection.tables()
+        transport = connection.transport
+
+    with pool.connection() as connection:
+        assert connection.transport is transport
+
+    with assert_raises(ValueError):
+        ConnectionPool(size=1, max_lifetime=0, **connection_kwargs)
+
+    pool = ConnectionPool(size=1, max_idle_time=.1, probe_idle_time=.05,
+                          **connection_kwargs)
+    with pool.connection() as connection:
+        transport = connection.transport
+
+    time.sleep(.07)
+    with pool.connection() as connection:
+        # Probed, but not idle for too long
+        assert connection.transport is transport
+
+    time.sleep(.2)
+    with pool.connection() as connection:
+        assert connection.transport is not transport
+        connection.tables()
+
+
+def test_elastic_pool():
+    with assert_raises(TypeError):
+        ConnectionPool(size=2, max_size=3, **connection_kwargs)
+
+    with assert_raises(ValueError):
+        ConnectionPool(min_size=3, max_size=2, **connection_kwargs)
+
+    pool = ConnectionPool(min_size=1, max_size=3, max_idle_time=.1,
+                          warm_up=True, **connection_kwargs)
+    release = threading.Event()
+
+    def run():
+        with pool.connection() as connection:
+            connection.tables()
+            release.wait()
+
+    # Connections are added while all of them are in use
+    threads = [threading.Thread(target=run) for i in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(.5)
+    assert pool._n_connections == 3
+
+    with assert_raises(NoConnectionsAvailable):
+        with pool.connection(timeout=.1):
+            pass
+
+    release.set()
+    for t in threads:
+        t.join()
+
+    # Idle connections in excess of the minimum size are removed
+    time.sleep(.2)
+    with pool.connection() as connection:
+        connection.tables()
+    assert pool._n_connections == 1
+
+
+def test_pool_stats():
+    from happybase import PoolListener
+
+    events = []
+
+    class Listener(PoolListener):
+        def checked_out(self, pool, connection, wait_time):
+            events.append('checked_out')
+
+        def checked_in(self, pool, connection, hold_time):
+            events.append('checked_in')
+
+        def timed_out(self, pool, wait_time):
+            events.append('timed_out')
+
+    with assert_raises(TypeError):
+        ConnectionPool(size=1, listener=object(), **connection_kwargs)
+
+    pool = ConnectionPool(size=1, listener=Listener(), **connection_kwargs)
+    with pool.connection() as connection:
+        connection.tables()
+        stats = pool.stats()
+        assert stats['in_use'] == 1
+        assert stats['idle'] == 0
+
+        def run():
+            with assert_raises(NoConnectionsAvailable):
+                with pool.connection(timeout=.1):
+                    pass
+
+        t = threading.Thread(target=run)
+        t.start()
+        t.join()
+
+    stats = pool.stats()
+    assert stats['size'] == stats['idle'] == 1
+    assert stats['checkouts'] == 2
+    assert stats['timeouts'] == 1
+    assert stats['connects'] == 1
+    assert stats['hold_time']['count'] == 2
+    assert stats['wait_time']['count'] == 2
+    assert events == ['checked_out', 'checked_in', 'checked_out',
+                      'timed_out', 'checked_in']
+
+
+def test_pool_fork():
+    if not hasattr(os, 'fork'):
+        return
+
+    pool = ConnectionPool(size=2, **connection_kwargs)
+    with pool.connection() as connection:
+        connection.tables()
+
+    pid = os.fork()
+    if pid == 0:
+        # The child gets its own connections
+        try:
+            for i in range(10):
+                with pool.connection() as connection:
+                    connection.tables()
+        finally:
+            os._exit(0 if pool.stats()['checkouts'] == 10 else 1)
+
+    # The connections of the parent remain usable
+    for i in range(10):
+        with pool.connection() as connection:
+            connection.tables()
+
+    assert os.waitpid(pid, 0)[1] == 0
+
+
 if __name__ == '__main__':
     import logging
     import sys
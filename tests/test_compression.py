@@ -0,0 +1,113 @@
+"""
+HappyBase compression tests.
+"""
+
+import zlib
+
+from thriftpy2.protocol.binary import TBinaryProtocol
+from thriftpy2.transport import TTransportException
+
+import happybase  # noqa, loads the Thrift module
+from Hbase_thrift import Hbase
+
+from happybase.compression import TZlibTransport
+
+
+class Pipe(object):
+    """Transport passing written data to the reading side in small chunks."""
+
+    def __init__(self, chunk_size=7):
+        self.chunk_size = chunk_size
+        self.data = b''
+        self.is_opened = False
+
+    def is_open(self):
+        return self.is_opened
+
+    def open(self):
+        self.is_opened = True
+
+    def close(self):
+        self.is_opened = False
+
+    def read(self, sz):
+        if not self.data:
+            raise TTransportException(
+                type=TTransportException.END_OF_FILE, message='no data')
+        n = min(sz, self.chunk_size)
+        chunk, self.data = self.data[:n], self.data[n:]
+        return chunk
+
+    def write(self, buf):
+        self.data += buf
+
+    def flush(self):
+        pass
+
+
+def test_round_trip():
+    pipe = Pipe()
+    writer = TZlibTransport(pipe)
+    reader = TZlibTransport(pipe)
+
+    for i in range(3):
+        message = b'message %d ' % i * 100
+        pending = len(pipe.data)
+        writer.write(message[:10])
+        writer.write(message[10:])
+        assert len(pipe.data) == pending
+        writer.flush()
+        assert pending < len(pipe.data) < pending + len(message)
+        assert reader.read(len(message)) == message
+
+
+def test_compatibility():
+    # Each flush is decompressible by a plain zlib stream...
+    pipe = Pipe()
+    transport = TZlibTransport(pipe)
+    decompressor = zlib.decompressobj()
+    for message in (b'first', b'second'):
+        transport.write(message)
+        transport.flush()
+        assert decompressor.decompress(pipe.data) == message
+        pipe.data = b''
+
+    # ...and the other way around.
+    compressor = zlib.compressobj()
+    for message in (b'first', b'second'):
+        pipe.data = (compressor.compress(message)
+                     + compressor.flush(zlib.Z_SYNC_FLUSH))
+        assert transport.read(len(message)) == message
+
+
+def test_thrift_messages():
+    pipe = Pipe(chunk_size=100)
+    protocol = TBinaryProtocol(TZlibTransport(pipe), decode_response=False)
+    names = [b'table-%d' % i for i in range(100)]
+
+    result = Hbase.getTableNames_result(success=names)
+    protocol.write_message_begin('getTableNames', 2, 0)
+    result.write(protocol)
+    protocol.write_message_end()
+    protocol.trans.flush()
+
+    assert protocol.read_message_begin() == ('getTableNames', 2, 0)
+    result = Hbase.getTableNames_result()
+    result.read(protocol)
+    assert result.success == names
+
+
+def test_reopen():
+    pipe = Pipe()
+    transport = TZlibTransport(pipe)
+    transport.open()
+    transport.write(b'data')
+    transport.flush()
+
+    # A new connection needs a new zlib stream.
+    transport.close()
+    pipe.data = b''
+    transport.open()
+    transport.write(b'data')
+    transport.flush()
+    assert zlib.decompressobj().decompress(pipe.data) == b'data'
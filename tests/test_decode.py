@@ -0,0 +1,125 @@
+"""
+HappyBase result decoding tests.
+"""
+
+from thriftpy2.protocol.binary import TBinaryProtocol
+from thriftpy2.thrift import TApplicationException, TClient, TMessageType
+from thriftpy2.transport.memory import TMemoryBuffer
+
+import happybase  # noqa, loads the Thrift module
+from Hbase_thrift import Hbase, IOError, TCell, TColumn, TRowResult
+
+from happybase.decode import can_decode, request_rows
+from happybase.table import make_ordered_row, make_row, make_values
+from happybase.util import OrderedDict
+
+
+class ReplayClient(TClient):
+    """Thrift client that replays a recorded reply."""
+
+    def __init__(self, api, result=None, exc=None):
+        trans = TMemoryBuffer()
+        protocol = TBinaryProtocol(trans)
+        if exc is None:
+            protocol.write_message_begin(api, TMessageType.REPLY, 0)
+            protocol.write_struct(result)
+        else:
+            protocol.write_message_begin(api, TMessageType.EXCEPTION, 0)
+            protocol.write_struct(exc)
+        protocol.write_message_end()
+
+        reply = TMemoryBuffer(trans.getvalue())
+        super(ReplayClient, self).__init__(
+            Hbase, TBinaryProtocol(reply, decode_response=False))
+        self.sent = []
+
+    def _send(self, api, **kwargs):
+        self.sent.append((api, kwargs))
+
+
+def make_results(n_rows, n_columns, sorted_columns=False):
+    results = []
+    for i in range(n_rows):
+        cells = [(b'cf:col%d' % j, TCell(value=b'%d-%d' % (i, j), timestamp=j))
+                 for j in range(n_columns)]
+        if sorted_columns:
+            columns = [TColumn(columnName=name, cell=cell)
+                       for name, cell in cells]
+            results.append(TRowResult(row=b'row%d' % i, sortedColumns=columns))
+        else:
+            results.append(TRowResult(row=b'row%d' % i, columns=dict(cells)))
+    return results
+
+
+def test_request_rows():
+    results = make_results(5, 3)
+    result = Hbase.scannerGetList_result(success=results)
+    args = dict(id=1, nbRows=10)
+
+    for include_timestamp in (False, True):
+        client = ReplayClient('scannerGetList', result)
+        assert can_decode(client)
+
+        rows = request_rows(client, 'scannerGetList', args, include_timestamp)
+        assert client.sent == [('scannerGetList', args)]
+        assert rows == [(r.row, make_row(r.columns, include_timestamp))
+                        for r in results]
+
+
+def test_request_rows_sorted_columns():
+    results = make_results(5, 3, sorted_columns=True)
+    result = Hbase.scannerGetList_result(success=results)
+
+    for include_timestamp in (False, True):
+        client = ReplayClient('scannerGetList', result)
+        rows = request_rows(client, 'scannerGetList', {}, include_timestamp,
+                            sorted_columns=True)
+        assert rows == [
+            (r.row, make_ordered_row(r.sortedColumns, include_timestamp))
+            for r in results]
+        assert all(isinstance(data, OrderedDict) for _, data in rows)
+
+
+def test_request_rows_columnar():
+    results = make_results(5, 3)
+    results.append(TRowResult(row=b'row-empty', columns={}))
+    result = Hbase.scannerGetList_result(success=results)
+    columnar = [b'cf:col2', b'cf:missing', b'cf:col0']
+
+    client = ReplayClient('scannerGetList', result)
+    rows = request_rows(client, 'scannerGetList', {}, columnar=columnar)
+    assert rows == [(r.row, make_values(r.columns, columnar))
+                    for r in results]
+    assert rows[0] == (b'row0', [b'0-2', None, b'0-0'])
+    assert rows[-1] == (b'row-empty', [None, None, None])
+
+
+def test_request_rows_empty():
+    for results in ([], [TRowResult(row=b'row')]):
+        result = Hbase.getRowsWithColumns_result(success=results)
+        client = ReplayClient('getRowsWithColumns', result)
+        rows = request_rows(client, 'getRowsWithColumns', {})
+        assert rows == [(r.row, {}) for r in results]
+
+
+def test_request_rows_errors():
+    def check(exc_type, *args, **kwargs):
+        client = ReplayClient('scannerGetList', *args, **kwargs)
+        try:
+            request_rows(client, 'scannerGetList', {})
+        except exc_type as exc:
+            # The complete reply must have been consumed.
+            assert client._iprot.trans.read(1) == b''
+            return exc
+        else:
+            assert False, "no exception raised"
+
+    exc = check(IOError, Hbase.scannerGetList_result(
+        io=IOError(message=b'scanner lease expired')))
+    assert exc.message == b'scanner lease expired'
+
+    check(TApplicationException, Hbase.scannerGetList_result())
+
+    exc = check(TApplicationException, exc=TApplicationException(
+        TApplicationException.UNKNOWN_METHOD, 'unknown method'))
+    assert exc.type == TApplicationException.UNKNOWN_METHOD
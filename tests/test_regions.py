@@ -0,0 +1,99 @@
+"""
+HappyBase region cache tests.
+"""
+
+import time
+
+from happybase.regions import RegionCache
+
+
+class FakeTable(object):
+    def __init__(self, name, split_keys):
+        self.name = name
+        self.split_keys = split_keys
+        self.calls = 0
+
+    def regions(self):
+        self.calls += 1
+        keys = [b''] + list(self.split_keys) + [b'']
+        regions = [
+            dict(start_key=keys[i], end_key=keys[i + 1], id=i,
+                 server_name=b'rs%d' % i, port=16020)
+            for i in range(len(keys) - 1)]
+        # Order should not matter
+        return list(reversed(regions))
+
+
+def test_region_lookup():
+    table = FakeTable(b'table', [b'g', b'p'])
+    cache = RegionCache()
+
+    boundaries = [(r['start_key'], r['end_key'])
+                  for r in cache.regions(table)]
+    assert boundaries == [(b'', b'g'), (b'g', b'p'), (b'p', b'')]
+
+    for row, region_id in [(b'', 0), (b'a', 0), (b'g', 1), (b'ozzz', 1),
+                           (b'p', 2), (b'zzz', 2)]:
+        assert cache.region(table, row)['id'] == region_id
+
+    # All of the above used a single round-trip
+    assert table.calls == 1
+
+    # Tables are cached separately
+    other = FakeTable(b'other', [])
+    assert cache.region(other, b'g')['id'] == 0
+    assert other.calls == 1
+    assert table.calls == 1
+
+
+def test_invalidate():
+    table = FakeTable(b'table', [b'g'])
+    other = FakeTable(b'other', [])
+    cache = RegionCache(ttl=None)
+    cache.regions(table)
+    cache.regions(other)
+
+    # The first region splits, which goes unnoticed until invalidated
+    table.split_keys = [b'c', b'g']
+    assert cache.region(table, b'd')['start_key'] == b''
+
+    cache.invalidate(table)
+    assert cache.region(table, b'd')['start_key'] == b'c'
+    assert table.calls == 2
+    assert other.calls == 1
+
+    cache.invalidate()
+    cache.regions(table)
+    cache.regions(other)
+    assert table.calls == 3
+    assert other.calls == 2
+
+
+def test_out_of_date_regions():
+    table = FakeTable(b'table', [b'g'])
+    cache = RegionCache()
+    cache.regions(table)
+
+    # Cached regions that do not cover a row key are retrieved again
+    cache._tables[table.name][2][0]['end_key'] = b'c'
+    assert cache.region(table, b'd')['start_key'] == b''
+    assert table.calls == 2
+
+
+def test_ttl():
+    try:
+        RegionCache(ttl=0)
+    except ValueError:
+        pass
+    else:
+        assert False, "no exception raised"
+
+    table = FakeTable(b'table', [b'g'])
+    cache = RegionCache(ttl=.05)
+    cache.regions(table)
+    cache.regions(table)
+    assert table.calls == 1
+
+    time.sleep(.1)
+    cache.regions(table)
+    assert table.calls == 2
@@ -0,0 +1,139 @@
+"""
+HappyBase retry policy tests.
+"""
+
+import socket
+
+from thriftpy2.transport import TTransportException
+
+import happybase  # noqa, loads the Thrift module
+from Hbase_thrift import IOError as HBaseIOError
+
+from happybase.retry import RetryPolicy
+from happybase.table import is_retryable_scan_error
+
+
+class Flaky(object):
+    """Callable that fails a number of times before succeeding."""
+
+    def __init__(self, n_failures, exc=None):
+        self.n_failures = n_failures
+        self.exc = exc or TTransportException(message='broken')
+        self.calls = 0
+        self.reconnects = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.n_failures:
+            raise self.exc
+        return 'result'
+
+    def reconnect(self):
+        self.reconnects += 1
+
+
+def check_raises(exc_type, policy, api, func):
+    try:
+        policy.call(api, func, func.reconnect)
+    except exc_type:
+        pass
+    else:
+        assert False, "no exception raised"
+
+
+def test_construction():
+    for kwargs in [dict(max_retries=-1), dict(backoff=0),
+                   dict(backoff=2, max_backoff=1), dict(deadline=0)]:
+        try:
+            RetryPolicy(**kwargs)
+        except ValueError:
+            pass
+        else:
+            assert False, "no exception raised for %r" % kwargs
+
+
+def test_retries():
+    policy = RetryPolicy(max_retries=3, backoff=.001)
+
+    func = Flaky(2)
+    assert policy.call('getRow', func, func.reconnect) == 'result'
+    assert func.calls == 3
+    assert func.reconnects == 2
+
+    func = Flaky(2, socket.error('connection reset'))
+    assert policy.call('mutateRows', func, func.reconnect) == 'result'
+
+    func = Flaky(10)
+    check_raises(TTransportException, policy, 'getRow', func)
+    assert func.calls == 4
+
+    stats = policy.stats()
+    assert stats['calls'] == 3
+    assert stats['failures'] == 8
+    assert stats['retries'] == 7
+    assert stats['recovered'] == 2
+    assert stats['exhausted'] == 1
+
+
+def test_no_retries():
+    policy = RetryPolicy(backoff=.001)
+
+    # Errors raised by HBase itself
+    func = Flaky(1, HBaseIOError(message=b'table not found'))
+    check_raises(HBaseIOError, policy, 'getRow', func)
+    assert func.calls == 1
+
+    # Calls that are not idempotent, or that use a scanner
+    for api in ('atomicIncrement', 'createTable', 'scannerGetList'):
+        func = Flaky(1)
+        check_raises(TTransportException, policy, api, func)
+        assert func.calls == 1
+
+    assert policy.stats()['not_retried'] == 3
+    assert policy.stats()['retries'] == 0
+
+    policy = RetryPolicy(backoff=.001, retry_non_idempotent=True)
+    func = Flaky(1)
+    assert policy.call('atomicIncrement', func, func.reconnect) == 'result'
+    func = Flaky(1)
+    check_raises(TTransportException, policy, 'scannerGetList', func)
+
+
+def test_deadline():
+    policy = RetryPolicy(max_retries=100, backoff=.01, max_backoff=.01,
+                         deadline=.1)
+    func = Flaky(1000)
+    check_raises(TTransportException, policy, 'getRow', func)
+    assert 1 < func.calls < 100
+    assert policy.stats()['deadline_exceeded'] == 1
+
+
+def test_failing_reconnect():
+    policy = RetryPolicy(max_retries=2, backoff=.001)
+    func = Flaky(1)
+
+    def reconnect():
+        func.reconnects += 1
+        if func.reconnects == 1:
+            raise socket.error('connection refused')
+
+    assert policy.call('getRow', func, reconnect) == 'result'
+    assert func.calls == 2
+    assert func.reconnects == 2
+
+
+def test_scan_errors():
+    assert is_retryable_scan_error(TTransportException(message='broken'))
+    assert is_retryable_scan_error(socket.error('connection reset'))
+    assert is_retryable_scan_error(HBaseIOError(
+        message='org.apache.hadoop.hbase.UnknownScannerException: '
+                'Unknown scanner 42'))
+    assert is_retryable_scan_error(HBaseIOError(
+        message=b'org.apache.hadoop.hbase.NotServingRegionException: '
+                b'Region is not online'))
+    assert not is_retryable_scan_error(HBaseIOError(
+        message='org.apache.hadoop.hbase.regionserver.'
+                'NoSuchColumnFamilyException: Column family cf2 does not '
+                'exist'))
+    assert not is_retryable_scan_error(HBaseIOError())
+    assert not is_retryable_scan_error(ValueError('bad filter'))
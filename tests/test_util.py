@@ -3,6 +3,12 @@ HappyBase utility tests.
 """
 
 from codecs import decode, encode
+import os
+import socket
+import threading
+import time
+
+from six.moves import queue
 
 import happybase.util as util
 
@@ -52,3 +58,177 @@ def test_bytes_increment():
 
     for s, expected in test_values:
         check(s, expected)
+
+
+def test_split_key_range():
+    boundaries = [(b'', b'd'), (b'd', b'm'), (b'm', b'')]
+
+    assert [(b'', b'd'), (b'd', b'm'), (b'm', None)] == \
+        util.split_key_range(boundaries, b'', None)
+
+    assert [(b'b', b'd'), (b'd', b'f')] == \
+        util.split_key_range(boundaries, b'b', b'f')
+
+    assert [(b'd', b'm')] == util.split_key_range(boundaries, b'd', b'm')
+    assert [(b'x', None)] == util.split_key_range(boundaries, b'x', None)
+    assert [] == util.split_key_range(boundaries, b'x', b'x')
+
+    assert [(b'', None)] == util.split_key_range([(b'', b'')], b'', None)
+
+
+def test_queue_put():
+    q = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    assert util.queue_put(q, 1, stop)
+
+    # The queue is full now, so this only returns once stopped
+    threading.Timer(.1, stop.set).start()
+    assert not util.queue_put(q, 2, stop, interval=.01)
+    assert 1 == q.get_nowait()
+
+
+def test_prefetch_iter():
+    assert list(range(10)) == list(util.prefetch_iter(iter(range(10)), 2))
+    assert [] == list(util.prefetch_iter(iter([]), 1))
+
+    def failing():
+        yield 1
+        raise ValueError("failure")
+
+    it = util.prefetch_iter(failing(), 5)
+    assert 1 == next(it)
+    try:
+        next(it)
+    except ValueError:
+        pass
+    else:
+        assert False, "exception not propagated"
+
+    consumed = []
+
+    def endless():
+        while True:
+            consumed.append(None)
+            yield len(consumed)
+
+    n_threads = threading.active_count()
+    it = util.prefetch_iter(endless(), 3)
+    assert 1 == next(it)
+    it.close()
+    assert threading.active_count() == n_threads
+
+    # Nothing is consumed anymore once the background thread has stopped.
+    time.sleep(.2)
+    n = len(consumed)
+    assert n <= 5
+    time.sleep(.2)
+    assert n == len(consumed)
+
+
+def test_batch_sizer():
+    sizer = util.BatchSizer(100, 1, 1000, target_bytes=10000,
+                            max_latency=1.0)
+    assert 100 == sizer.size
+
+    # Small items: grow, but at most twice the size per round-trip
+    sizer.update([5] * 100, .01)
+    assert 200 == sizer.size
+    sizer.update([5] * 200, .01)
+    assert 400 == sizer.size
+    sizer.update([5] * 400, .01)
+    sizer.update([5] * 800, .01)
+    assert 1000 == sizer.size
+
+    # Large items: shrink to stay around the target size
+    sizer.update([995] * 1000, .01)
+    assert 20 == sizer.size
+    sizer.update([10 ** 6] * 20, .01)
+    assert 1 == sizer.size
+    assert (1, 1000) == (sizer.smallest, sizer.largest)
+
+    # Slow round-trips reduce the size
+    sizer = util.BatchSizer(100, 1, 1000, target_bytes=10000,
+                            max_latency=1.0)
+    sizer.update([10] * 100, 4.0)
+    assert 25 == sizer.size
+
+    # Empty round-trips do not change anything
+    sizer.update([], 10.0)
+    assert 25 == sizer.size
+
+
+def test_batch_sizer_max_bytes():
+    sizer = util.BatchSizer(1, 1, 1000, max_bytes=10000)
+
+    sizer.update([10], .01)
+    assert 1000 == sizer.size
+
+    # A single large item limits the next batch
+    sizer.update([10] * 999 + [2000], .01)
+    assert 5 == sizer.size
+
+    sizer.update([10 ** 6], .01)
+    assert 1 == sizer.size
+
+    sizer.update([100] * 1, .01)
+    assert 100 == sizer.size
+
+
+def test_histogram():
+    histogram = util.Histogram()
+    for value in [.0001, .0005, .003, .003, 7.0, 100.0]:
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert 6 == snapshot['count']
+    assert 100.0 == snapshot['max']
+    assert abs(snapshot['sum'] - 107.0066) < 1e-9
+
+    buckets = dict(snapshot['buckets'])
+    assert 2 == buckets[.0005]
+    assert 2 == buckets[.005]
+    assert 1 == buckets[10.0]
+    assert 1 == buckets[float('inf')]
+    assert 6 == sum(buckets.values())
+
+
+def test_register_after_fork():
+    if not util.AT_FORK_SUPPORTED:
+        return
+
+    class Forkable(object):
+        def __init__(self):
+            self.pid = os.getpid()
+
+        def _after_fork(self):
+            self.pid = os.getpid()
+
+    obj = Forkable()
+    util.register_after_fork(obj)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if obj.pid == os.getpid() else 1)
+
+    assert 0 == os.waitpid(pid, 0)[1]
+    assert obj.pid == os.getpid()
+
+
+def test_socket_is_alive():
+    a, b = socket.socketpair()
+    a.settimeout(5.0)
+    assert util.socket_is_alive(a)
+    assert 5.0 == a.gettimeout()
+
+    # Data that was not asked for
+    b.sendall(b'x')
+    assert not util.socket_is_alive(a)
+    assert b'x' == a.recv(1)
+    assert util.socket_is_alive(a)
+
+    # Closed by the peer
+    b.close()
+    assert not util.socket_is_alive(a)
+    a.close()
+
+    assert not util.socket_is_alive(None)